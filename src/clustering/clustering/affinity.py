@@ -0,0 +1,35 @@
+import numpy as np
+import scipy.sparse as sp
+
+def knn_affinity(similarity, n_neighbors=20, block_size=1024):
+    #symmetric sparse graph of every vertex's n_neighbors strongest positive similarities
+    n = len(similarity)
+    n_neighbors = min(n_neighbors, n-1)
+    rows, cols, values = [], [], []
+    for start in range(0, n, block_size):
+        stop = min(start+block_size, n)
+        block = np.array(similarity[start:stop], dtype=np.float32).reshape(stop-start, n) #only this block is copied
+        block[np.arange(stop-start), np.arange(start, stop)] = 0 #no self loops
+        nearest = np.argpartition(-block, n_neighbors-1, axis=1)[:,:n_neighbors]
+        blockrows = np.repeat(np.arange(start, stop), n_neighbors)
+        strengths = block[blockrows-start, nearest.ravel()]
+        keep = strengths > 0 #spectral uses non-negative values
+        rows.append(blockrows[keep])
+        cols.append(nearest.ravel()[keep])
+        values.append(strengths[keep])
+    graph = sp.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))), shape=(n,n))
+    return graph.maximum(graph.T).astype(np.double) #keep an edge if either end chose it
+
+def radius_graph(similarity, eps, block_size=1024):
+    #sparse distance graph (1-similarity) keeping only pairs within eps, as dbscan neighbourhoods
+    n = len(similarity)
+    rows, cols, values = [], [], []
+    for start in range(0, n, block_size):
+        stop = min(start+block_size, n)
+        block = 1 - np.array(similarity[start:stop], dtype=np.float32).reshape(stop-start, n) #only this block is copied
+        block[np.arange(stop-start), np.arange(start, stop)] = 0 #every vertex is its own neighbour
+        blockrows, blockcols = np.nonzero(block <= eps)
+        rows.append(blockrows + start)
+        cols.append(blockcols)
+        values.append(block[blockrows, blockcols])
+    return sp.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))), shape=(n,n)) #zero distances stay stored entries
@@ -0,0 +1,125 @@
+import numpy as np
+import os
+from multiprocessing import Pool
+from nipype.interfaces.base import BaseInterface, \
+    BaseInterfaceInputSpec, traits, File, TraitedSpec, OutputMultiPath, isdefined
+from clustering.correlation import prepare_series, similarity_matrix, nifti_memmap
+from clustering.coassociation import stack_indicators, indicator_counts
+from clustering.series import squeeze_inputs
+from clustering.cluster import Cluster
+
+_shared = {} #z-scored series and settings, set once per worker process
+
+def block_bootstrap(n_timepoints, block_length, rng):
+    #circular moving-block resample of the timepoints, keeps autocorrelation within blocks
+    n_blocks = -(-n_timepoints // block_length)
+    starts = rng.randint(0, n_timepoints, n_blocks)
+    return ((starts[:,None] + np.arange(block_length)) % n_timepoints).ravel()[:n_timepoints]
+
+def _init(series, targetmask, sim_type, cluster_inputs, block_length, memory_mb):
+    _shared.update(series=series, targetmask=targetmask, sim_type=sim_type, cluster_inputs=cluster_inputs,
+                   block_length=block_length, memory_mb=memory_mb)
+
+def _resample_labels(seed):
+    #similarity of one resample (rows renormalized, no second detrend) clustered for every k
+    series = _shared['series']
+    timepoints = block_bootstrap(series.shape[1], _shared['block_length'], np.random.RandomState(seed))
+    similarity = similarity_matrix(series[:,timepoints], _shared['targetmask'], _shared['sim_type'], polort=-1, memory_mb=_shared['memory_mb'])
+    labels = Cluster(**_shared['cluster_inputs'])._sweep(similarity)
+    return dict((k, np.asarray(l, dtype=np.int32)) for k, l in labels.items())
+
+def bootstrap_consensus(series, targetmask, sim_type, cluster_inputs, n_bootstrap=100, block_length=10,
+                        n_procs=1, memory_mb=1024, seed=0, batch_size=None):
+    #co-assignment counts over block-bootstrap resamples, {k: (target x target) counts}, no per-resample files
+    seeds = np.random.RandomState(seed).randint(0, 2**31-1, n_bootstrap)
+    batch_size = batch_size or max(1, n_procs)
+    counts, pending = {}, {}
+
+    def accumulate(k, labelmaps):
+        indicators, _ = stack_indicators(labelmaps)
+        partial = indicator_counts(indicators, n_bootstrap, memory_mb=memory_mb)
+        if k in counts:
+            counts[k] += partial
+        else:
+            counts[k] = partial
+
+    initargs = (series, targetmask, sim_type, cluster_inputs, block_length, memory_mb)
+    if n_procs > 1:
+        pool = Pool(n_procs, initializer=_init, initargs=initargs)
+        results = pool.imap_unordered(_resample_labels, seeds)
+    else:
+        pool = None
+        _init(*initargs)
+        results = (_resample_labels(resample_seed) for resample_seed in seeds) #one resample at a time, as the pool delivers them
+    try:
+        for labels in results:
+            for k, l in labels.items():
+                pending.setdefault(k, []).append(l)
+                if len(pending[k]) == batch_size:
+                    accumulate(k, pending.pop(k)) #partitions go straight into the accumulator
+        for k, labelmaps in pending.items():
+            accumulate(k, labelmaps)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return counts
+
+class BootstrapInputSpec(BaseInterfaceInputSpec):
+    volume_input = File(exists=True, desc="input volume for similarity")
+    surface_input = File(exists=True, desc="input surface")
+    volume_target_mask = File(exists=True, desc="target volume as mask")
+    surface_mask = File(exists=True, desc="target surface as mask")
+    sim_type = traits.String(exists=True, desc='temp, eta2, or spat', mandatory=True)
+    cluster_type = traits.Enum('spectral', 'hiercluster', 'kmeans', 'dbscan', desc='clustering of each resample (meshward needs the surface mesh and is not supported)', mandatory=True)
+    n_clusters_list = traits.List(traits.Int, desc='numbers of clusters, one consensus matrix each', mandatory=True)
+    epsilon = traits.Float(exists=True, desc='epsilon parameter for dbscan', mandatory=False)
+    dbscan_metric = traits.Enum('euclidean', 'precomputed', usedefault=True, desc='dbscan on the similarity rows as features, or on a sparse 1-similarity radius graph')
+    affinity = traits.Enum('dense', 'knn', usedefault=True, desc='spectral affinity: thresholded dense matrix or sparse k-nearest-neighbour graph')
+    n_neighbors = traits.Int(20, usedefault=True, desc='strongest similarities kept per vertex for the knn affinity')
+    eigen_solver = traits.Enum('arpack', 'lobpcg', 'amg', usedefault=True, desc='spectral eigensolver')
+    n_bootstrap = traits.Int(100, usedefault=True, desc='number of block-bootstrap resamples')
+    block_length = traits.Int(10, usedefault=True, desc='timepoints per bootstrap block')
+    seed = traits.Int(0, usedefault=True, desc='seed of the resampling')
+    n_procs = traits.Int(1, usedefault=True, desc='worker processes, each resamples, correlates and clusters')
+    memory_budget = traits.Int(1024, usedefault=True, desc='MB per worker for the similarity and co-assignment products')
+
+class BootstrapOutputSpec(TraitedSpec):
+    consensus_mats = OutputMultiPath(File(exists=True), desc="fraction of resamples in which two targets share a cluster, one per number of clusters")
+    maskindex = File(exists=True, desc='index for later returning to anat space')
+    targetmask = File(exists=True, desc='total target mask')
+
+class Bootstrap(BaseInterface):
+    input_spec = BootstrapInputSpec
+    output_spec = BootstrapOutputSpec
+
+    def _filename(self, n_clusters):
+        return os.path.abspath('bootstrap_'+str(n_clusters)+'_'+self.inputs.cluster_type+'_ConsensusMat.nii')
+
+    def _run_interface(self, runtime):
+        ##load and squeeze data and target, as in Concat##
+        totalinput, densetarget, _ = squeeze_inputs(self.inputs.volume_input, self.inputs.surface_input,
+                                                    self.inputs.volume_target_mask, self.inputs.surface_mask)
+
+        ##z-score once, then resample, correlate and cluster in the worker processes##
+        series = prepare_series(totalinput, memory_mb=self.inputs.memory_budget)
+        cluster_inputs = dict(cluster_type=self.inputs.cluster_type, n_clusters_list=self.inputs.n_clusters_list,
+                              dbscan_metric=self.inputs.dbscan_metric, affinity=self.inputs.affinity,
+                              n_neighbors=self.inputs.n_neighbors, eigen_solver=self.inputs.eigen_solver)
+        if isdefined(self.inputs.epsilon):
+            cluster_inputs['epsilon'] = self.inputs.epsilon
+        counts = bootstrap_consensus(series, densetarget, self.inputs.sim_type, cluster_inputs,
+                                     n_bootstrap=self.inputs.n_bootstrap, block_length=self.inputs.block_length,
+                                     n_procs=self.inputs.n_procs, memory_mb=self.inputs.memory_budget, seed=self.inputs.seed)
+        for k, kcounts in counts.items():
+            out = nifti_memmap(self._filename(k), len(kcounts))
+            np.divide(kcounts, self.inputs.n_bootstrap, out=out, dtype=np.float32)
+            del out
+        return runtime
+
+    def _list_outputs(self):
+        outputs = self._outputs().get()
+        outputs["consensus_mats"] = [self._filename(k) for k in self.inputs.n_clusters_list]
+        outputs["maskindex"] = os.path.abspath('indices.npy')
+        outputs["targetmask"] = os.path.abspath('simTarget.nii')
+        return outputs
@@ -1,7 +1,11 @@
 import os
 from nipype.interfaces.base import BaseInterface, \
-    BaseInterfaceInputSpec, traits, File, TraitedSpec
+    BaseInterfaceInputSpec, traits, File, TraitedSpec, OutputMultiPath, isdefined
 from nipype.utils.filemanip import split_filename
+from clustering.utils import load_similarity, process_peak_memory_mb
+from clustering.sweep import spectral_sweep, ward_sweep, factored_sweep
+from clustering.affinity import knn_affinity, radius_graph
+from clustering.mesh import mesh_adjacency, vertex_connectivity
 
 from sklearn.cluster import spectral_clustering as spectral
 from sklearn.cluster import KMeans as km
@@ -12,43 +16,110 @@ import nibabel as nb
 import os
 
 class ClusterInputSpec(BaseInterfaceInputSpec):
-    in_File = File(exists=True, desc='surface to be clustered', mandatory=True)
+    in_File = File(exists=True, desc='surface to be clustered, or a factored consensus .npy', mandatory=True)
     hemi = traits.String(exists=True, desc='hemisphere', mandatory=True)
-    cluster_type = traits.String(exists=True, desc='spectral, hiercluster, kmeans, or dbscan', mandatory=True)
-    n_clusters = traits.Int(exists=True, desc='number of clusters', mandatory=True)
-    epsilon = traits.Float(exists=True, desc='epsilon parameter for dbscan', mandatory=False)
+    cluster_type = traits.String(exists=True, desc='spectral, hiercluster, meshward, kmeans, or dbscan', mandatory=True)
+    n_clusters = traits.Int(exists=True, desc='number of clusters', mandatory=True, xor=['n_clusters_list'])
+    n_clusters_list = traits.List(traits.Int, desc='sweep over several numbers of clusters, reusing one decomposition', mandatory=True, xor=['n_clusters'])
+    epsilon = traits.Float(exists=True, desc='epsilon parameter for dbscan, a 1-consensus radius for a factored consensus', mandatory=False)
+    dbscan_metric = traits.Enum('euclidean', 'precomputed', usedefault=True, desc='dbscan on the similarity rows as features, or on a sparse 1-similarity radius graph')
+    affinity = traits.Enum('dense', 'knn', usedefault=True, desc='spectral affinity: thresholded dense matrix or sparse k-nearest-neighbour graph')
+    n_neighbors = traits.Int(20, usedefault=True, desc='strongest similarities kept per vertex for the knn affinity')
+    indicesfile = File(exists=True, desc='indices .npy file from before similarity, for meshward')
+    maskfile = File(exists=True, desc='total target mask, for meshward')
+    freesurferdir = traits.String(desc='freesurfer directory, for meshward')
+    fs = traits.String(desc='fsaverage whose surface triangles constrain meshward')
+    eigen_solver = traits.Enum('arpack', 'lobpcg', 'amg', usedefault=True, desc='spectral eigensolver, lobpcg or amg (needs pyamg) suit the sparse knn affinity')
 
 class ClusterOutputSpec(TraitedSpec):
     out_File = File(exists=True, desc="clustered volume")
+    out_Files = OutputMultiPath(File(exists=True), desc="clustered volumes, one per number of clusters in the sweep")
 
 class Cluster(BaseInterface):
     input_spec = ClusterInputSpec
     output_spec = ClusterOutputSpec
 
+    def _filename(self, n_clusters):
+        _, base, _ = split_filename(self.inputs.in_File)
+        return os.path.abspath(base+'_'+str(n_clusters)+'_'+self.inputs.cluster_type+'_'+self.inputs.hemi+'.nii')
+
+    def _affinity(self, corrmatrix):
+        if self.inputs.affinity == 'knn':
+            return knn_affinity(corrmatrix, self.inputs.n_neighbors) #sparse, built from row blocks without dense copies
+        np.maximum(corrmatrix, 0, out=corrmatrix) #threshold at 0 in place (spectral uses non-negative values)
+        return np.asarray(corrmatrix, dtype=np.double) #spectral expects dtype=double values, as the knn graph
+
+    def _dbscan(self, corrmatrix):
+        if self.inputs.dbscan_metric == 'precomputed':
+            distances = radius_graph(corrmatrix, self.inputs.epsilon) #only pairs within epsilon, built from row blocks
+            return DBSCAN(eps=self.inputs.epsilon, metric='precomputed').fit_predict(distances)
+        return DBSCAN(eps=self.inputs.epsilon).fit_predict(corrmatrix)
+
+    def _connectivity(self):
+        #fsaverage mesh neighbours of the clustered vertices, as ward connectivity constraint
+        indices = np.load(self.inputs.indicesfile)
+        mask = nb.load(self.inputs.maskfile).get_data()
+        vertices = indices[np.asarray(mask,dtype=np.bool).ravel()]
+        return vertex_connectivity(mesh_adjacency(self.inputs.freesurferdir, self.inputs.fs, self.inputs.hemi), vertices)
+
+    def _sweep(self, corrmatrix):
+        ##decompose once, then label every k##
+        n_clusters_list = self.inputs.n_clusters_list
+        if self.inputs.cluster_type == 'spectral':
+            return spectral_sweep(self._affinity(corrmatrix), n_clusters_list, eigen_solver=self.inputs.eigen_solver)
+        if self.inputs.cluster_type == 'hiercluster':
+            return ward_sweep(corrmatrix, n_clusters_list)
+        if self.inputs.cluster_type == 'meshward':
+            return ward_sweep(corrmatrix, n_clusters_list, connectivity=self._connectivity())
+        if self.inputs.cluster_type == 'kmeans':
+            return dict((k, km(n_clusters=k).fit_predict(corrmatrix)) for k in n_clusters_list)
+        if self.inputs.cluster_type == 'dbscan':
+            labels = self._dbscan(corrmatrix) #independent of k
+            return dict((k, labels) for k in n_clusters_list)
+
+    def _factored(self, n_clusters_list):
+        ##consensus kept as stacked one-hot label matrices H, the (n x n) matrix H.H^T is never formed##
+        connectivity = self._connectivity() if self.inputs.cluster_type == 'meshward' else None
+        return factored_sweep(self.inputs.in_File, self.inputs.cluster_type, n_clusters_list, self.inputs.epsilon, connectivity)
+
     def _run_interface(self, runtime):        
+        if self.inputs.in_File.endswith('.npy'):
+            n_clusters_list = self.inputs.n_clusters_list if isdefined(self.inputs.n_clusters_list) else [self.inputs.n_clusters]
+            for k, labels in self._factored(n_clusters_list).items():
+                new_img = nb.Nifti1Image(labels+1, None) #+1 because cluster labels start at 0
+                nb.save(new_img, self._filename(k))
+            runtime.process_peak_memory_mb = process_peak_memory_mb()
+            return runtime
+
         #load data
-        data = nb.load(self.inputs.in_File).get_data()
-        corrmatrix = np.squeeze(data)
+        corrmatrix = load_similarity(self.inputs.in_File) #memory-mapped float32, no squeezed/thresholded copies
+        if isdefined(self.inputs.n_clusters_list):
+            for k, labels in self._sweep(corrmatrix).items():
+                new_img = nb.Nifti1Image(labels+1, None) #+1 because cluster labels start at 0
+                nb.save(new_img, self._filename(k))
+            runtime.process_peak_memory_mb = process_peak_memory_mb()
+            return runtime
+
         if self.inputs.cluster_type == 'spectral':
-            positivecorrs = np.where(corrmatrix>0,corrmatrix,0) #threshold at 0 (spectral uses non-negative values)
-            newmatrix = np.asarray(positivecorrs,dtype=np.double) #spectral expects dtype=double values
-            labels = spectral(newmatrix, n_clusters=self.inputs.n_clusters, eigen_solver='arpack', assign_labels='discretize')
+            labels = spectral(self._affinity(corrmatrix), n_clusters=self.inputs.n_clusters, eigen_solver=self.inputs.eigen_solver, assign_labels='discretize')
         if self.inputs.cluster_type == 'hiercluster':
             labels = Ward(n_clusters=self.inputs.n_clusters).fit_predict(corrmatrix)
+        if self.inputs.cluster_type == 'meshward':
+            labels = Ward(n_clusters=self.inputs.n_clusters, connectivity=self._connectivity()).fit_predict(corrmatrix)
         if self.inputs.cluster_type == 'kmeans':
             labels = km(n_clusters=self.inputs.n_clusters).fit_predict(corrmatrix)
         if self.inputs.cluster_type == 'dbscan':
-            labels = DBSCAN(eps=self.inputs.epsilon).fit_predict(corrmatrix)
+            labels = self._dbscan(corrmatrix)
 
         new_img = nb.Nifti1Image(labels+1, None) #+1 because cluster labels start at 0
-        _, base, _ = split_filename(self.inputs.in_File)
-        nb.save(new_img, os.path.abspath(base+'_'+str(self.inputs.n_clusters)+'_'+self.inputs.cluster_type+'_'+self.inputs.hemi+'.nii'))
-
+        nb.save(new_img, self._filename(self.inputs.n_clusters))
+        runtime.process_peak_memory_mb = process_peak_memory_mb()
         return runtime
 
     def _list_outputs(self):
         outputs = self._outputs().get()
-        fname = self.inputs.in_File
-        _, base, _ = split_filename(fname)
-        outputs["out_File"] = os.path.abspath(base+'_'+str(self.inputs.n_clusters)+'_'+self.inputs.cluster_type+'_'+self.inputs.hemi+'.nii')
+        if isdefined(self.inputs.n_clusters_list):
+            outputs["out_Files"] = [self._filename(k) for k in self.inputs.n_clusters_list]
+        else:
+            outputs["out_File"] = self._filename(self.inputs.n_clusters)
         return outputs
@@ -2,43 +2,49 @@ import nibabel as nb
 import numpy as np
 import os
 from nipype.interfaces.base import BaseInterface, \
-    BaseInterfaceInputSpec, traits, File, TraitedSpec
+    BaseInterfaceInputSpec, traits, File, TraitedSpec, InputMultiPath, OutputMultiPath
 from nipype.utils.filemanip import split_filename
 
 class ClusterMapInputSpec(BaseInterfaceInputSpec):
-    clusteredfile = File(exists=True, desc='clustered data', mandatory=True)
+    clusteredfile = InputMultiPath(File(exists=True), desc='clustered data, one or many files reinflated together', mandatory=True)
     indicesfile = File(exists=True, desc='indices .npy file from before similarity', mandatory=True)
     maskfile = File(exists=True, desc='total target mask', mandatory=True)
+    save_text = traits.Bool(True, usedefault=True, desc='also export every clustermap as text (slow for large surfaces)')
 
 class ClusterMapOutputSpec(TraitedSpec):
-    clustermapfile = File(exists=True, desc="clustered data with proper indices in nifti")
-    clustermaptext = File(exists=True, desc="clustered data with proper indices as text")
+    clustermapfile = OutputMultiPath(File(exists=True), desc="clustered data with proper indices in nifti")
+    clustermaptext = OutputMultiPath(File(exists=True), desc="clustered data with proper indices as text")
+    clustermaps = File(exists=True, desc="all clustermaps as one int16 (maps x vertices) .npy")
 
 
 class ClusterMap(BaseInterface):
     input_spec = ClusterMapInputSpec
     output_spec = ClusterMapOutputSpec
 
+    def _basenames(self):
+        return [split_filename(fname)[1] for fname in self.inputs.clusteredfile]
+
     def _run_interface(self, runtime):
-        data = nb.load(self.inputs.clusteredfile).get_data() #clustered data
+        data = np.vstack([np.ravel(nb.load(fname).get_data()) for fname in self.inputs.clusteredfile]) #(maps x clustered vertices)
         mask = nb.load(self.inputs.maskfile).get_data() #target mask
         indices = np.load(self.inputs.indicesfile) #indices of non-zero values used as input for similarity
 
-        mask_bool = np.asarray(mask,dtype=np.bool) #change mask to boolean values
+        mask_bool = np.asarray(mask,dtype=np.bool).ravel() #change mask to boolean values
         expandedmask = np.zeros((indices.max()+1),dtype=np.bool) #inititalize mask to incorporate zero-value indices
         expandedmask[indices] = mask_bool
-        clustermap = np.zeros_like(expandedmask,dtype=np.float) #back to correct indices values for surface data.
-        clustermap[expandedmask] = data
-        new_img = nb.Nifti1Image(clustermap, None)
-        _, base, _ = split_filename(self.inputs.clusteredfile)
-        np.savetxt(os.path.abspath(base+'_clustermap.txt'), np.reshape(clustermap, (1, clustermap.size)), fmt='%d',delimiter=' ')
-        nb.save(new_img, os.path.abspath(base+'_clustermap.nii'))
+        clustermaps = np.zeros((len(data),expandedmask.size),dtype=np.int16) #back to correct indices values for surface data.
+        clustermaps[:,expandedmask] = data #one scatter for all maps
+        np.save(os.path.abspath('clustermaps.npy'), clustermaps)
+        for base, clustermap in zip(self._basenames(), clustermaps):
+            nb.save(nb.Nifti1Image(clustermap, None), os.path.abspath(base+'_clustermap.nii'))
+            if self.inputs.save_text:
+                np.savetxt(os.path.abspath(base+'_clustermap.txt'), np.reshape(clustermap, (1, clustermap.size)), fmt='%d',delimiter=' ')
         return runtime
 
     def _list_outputs(self):
         outputs = self._outputs().get()
-        fname = self.inputs.clusteredfile
-        _, base, _ = split_filename(fname)
-        outputs["clustermapfile"] = os.path.abspath(base+'_clustermap.nii')
-        outputs["clustermaptext"] = os.path.abspath(base+'_clustermap.txt')
+        outputs["clustermapfile"] = [os.path.abspath(base+'_clustermap.nii') for base in self._basenames()]
+        if self.inputs.save_text:
+            outputs["clustermaptext"] = [os.path.abspath(base+'_clustermap.txt') for base in self._basenames()]
+        outputs["clustermaps"] = os.path.abspath('clustermaps.npy')
         return outputs
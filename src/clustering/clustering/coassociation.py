@@ -0,0 +1,149 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+import nibabel as nb
+import scipy.sparse as sp
+from scipy.sparse.linalg import LinearOperator, eigsh
+from multiprocessing import Pool
+from clustering.correlation import block_rows
+
+def load_labels(labelmap, mask=None):
+    #accept a clustermap filename or an array, keep only the target vertices
+    if not hasattr(labelmap, 'shape'):
+        labelmap = nb.load(labelmap).get_data()
+    labels = np.asarray(labelmap).ravel()
+    if mask is not None:
+        labels = labels[np.asarray(mask).ravel().astype(bool)]
+    return labels
+
+def label_indicator(labels, dtype=np.float32):
+    #one-hot (vertices x clusters) matrix, one column per distinct label
+    _, inverse = np.unique(labels, return_inverse=True)
+    inverse = inverse.ravel()
+    indicator = np.zeros((len(inverse), inverse.max()+1), dtype=dtype)
+    indicator[np.arange(len(inverse)), inverse] = 1
+    return indicator
+
+def count_dtype(n_subjects):
+    #smallest unsigned integer type able to hold n_subjects co-assignments
+    return np.min_scalar_type(n_subjects)
+
+def stack_indicators(labelmaps, mask=None, dtype=np.float32):
+    #stream clustermaps one at a time into a (vertices x sum of clusters) matrix
+    indicators = []
+    for labelmap in labelmaps:
+        indicators.append(label_indicator(load_labels(labelmap, mask), dtype))
+    if not indicators:
+        raise ValueError('no clustermaps given for consensus')
+    return np.hstack(indicators), len(indicators)
+
+def triu_offsets(n):
+    #start of every row in a row-major packed upper triangle (diagonal included)
+    rows = np.arange(n)
+    return rows*n - rows*(rows-1)//2
+
+def unpack_triu(packed, n):
+    #expand a packed upper triangle back into a full symmetric matrix
+    full = np.empty((n,n), dtype=packed.dtype)
+    full[np.triu_indices(n)] = packed
+    lower = np.tril_indices(n, -1)
+    full[lower] = full.T[lower]
+    return full
+
+def indicator_counts(indicators, n_subjects, triu=False, block_size=None, memory_mb=1024):
+    #co-assignment counts as H.H^T, computed in row blocks straight into an integer accumulator.
+    #triu packs the upper triangle for library callers that only need pairs; the Consensus interface always writes the
+    #full matrix (or the factored labels), since clustering it needs every row
+    n = indicators.shape[0]
+    dtype = count_dtype(n_subjects)
+    if block_size is None:
+        block_size = block_rows(n, memory_mb) #float32 product block
+    if triu:
+        counts = np.empty(n*(n+1)//2, dtype=dtype)
+        offsets = triu_offsets(n)
+    else:
+        counts = np.empty((n,n), dtype=dtype)
+    for start in range(0, n, block_size):
+        stop = min(start+block_size, n)
+        if triu:
+            block = np.dot(indicators[start:stop], indicators[start:].T) #only columns right of the diagonal
+            for row in range(start, stop):
+                counts[offsets[row]:offsets[row]+n-row] = block[row-start, row-start:]
+        else:
+            counts[start:stop] = np.dot(indicators[start:stop], indicators.T)
+    return counts
+
+def co_association(labelmaps, mask=None, triu=False, block_size=None, memory_mb=1024):
+    #number of clustermaps in which every pair of vertices shares a label
+    indicators, n_subjects = stack_indicators(labelmaps, mask)
+    return indicator_counts(indicators, n_subjects, triu=triu, block_size=block_size, memory_mb=memory_mb)
+
+def _partial_counts(args):
+    #map: co-assignment counts of one shard of clustermaps, saved for the reduction
+    labelmaps, mask, n_subjects, memory_mb, filename = args
+    indicators, _ = stack_indicators(labelmaps, mask)
+    np.save(filename, indicator_counts(indicators, n_subjects, memory_mb=memory_mb)) #dtype sized for the total
+    return filename
+
+def _combine(filenames):
+    #reduce: add the second partial sum into the first
+    first, second = filenames
+    total = np.load(first)
+    total += np.load(second, mmap_mode='r')
+    np.save(first, total)
+    os.remove(second)
+    return first
+
+def parallel_co_association(labelmaps, mask=None, n_procs=2, memory_mb=1024, tmpdir=None):
+    #co_association as map-reduce: shards counted in worker processes, partial sums combined pairwise in a tree
+    labelmaps = list(labelmaps)
+    n_shards = max(1, min(n_procs, len(labelmaps)))
+    workdir = tempfile.mkdtemp(dir=tmpdir)
+    shards = [(labelmaps[i::n_shards], mask, len(labelmaps), memory_mb, os.path.join(workdir, 'partial%d.npy' % i))
+              for i in range(n_shards)]
+    pool = Pool(n_procs)
+    try:
+        partials = pool.map(_partial_counts, shards)
+        while len(partials) > 1:
+            combined = pool.map(_combine, zip(partials[::2], partials[1::2]))
+            partials = combined + partials[len(combined)*2:] #odd one out waits for the next level
+        return np.load(partials[0])
+    finally:
+        pool.close()
+        pool.join()
+        shutil.rmtree(workdir)
+
+def stack_labels(labelmaps, mask=None):
+    #factored consensus: (vertices x maps) labels, whose one-hot expansion H gives H.H^T as co-assignment counts
+    return np.column_stack([load_labels(labelmap, mask).astype(np.int32) for labelmap in labelmaps])
+
+def sparse_indicator(labels):
+    #sparse one-hot H (vertices x sum of clusters) of a (vertices x maps) label matrix
+    n, n_maps = labels.shape
+    columns = np.empty((n, n_maps), dtype=np.int64)
+    offset = 0
+    for i in range(n_maps):
+        _, inverse = np.unique(labels[:,i], return_inverse=True)
+        columns[:,i] = inverse.ravel() + offset
+        offset = columns[:,i].max() + 1
+    return sp.csr_matrix((np.ones(n*n_maps), columns.ravel(), np.arange(0, n*n_maps+1, n_maps)), shape=(n, offset))
+
+def load_factors(filename):
+    #sparse one-hot H and the number of maps from a saved factored consensus
+    labels = np.load(filename)
+    return sparse_indicator(labels), labels.shape[1]
+
+def factored_embedding(indicators, n_subjects, n_components):
+    #spectral embedding of the consensus H.H^T/n_subjects through implicit matvecs, the (n x n) matrix is never formed
+    n = indicators.shape[0]
+    HT = indicators.T.tocsr()
+    degree = indicators.dot(HT.dot(np.ones(n)))/n_subjects - 1 #diagonal dropped, as in the graph laplacian
+    dd = np.sqrt(degree)
+    dd[dd==0] = 1
+    def matvec(x):
+        y = np.ravel(x)/dd
+        return (indicators.dot(HT.dot(y))/n_subjects - y)/dd #normalized affinity D^-1/2 A D^-1/2
+    operator = LinearOperator((n,n), matvec=matvec, dtype=np.float64)
+    _, vectors = eigsh(operator, k=n_components, which='LA')
+    return vectors[:,::-1]/dd[:,None] #leading eigenvectors first, as spectral_embedding returns them
@@ -4,6 +4,8 @@ import os
 import nipype.interfaces.afni as afni
 from nipype.interfaces.base import BaseInterface, \
     BaseInterfaceInputSpec, traits, File, TraitedSpec
+from clustering.correlation import similarity_matrix, nifti_memmap
+from clustering.series import squeeze_inputs
 
 class ConcatInputSpec(BaseInterfaceInputSpec):
     volume_input = File(exists=True, desc="input volume for similarity")
@@ -11,6 +13,9 @@ class ConcatInputSpec(BaseInterfaceInputSpec):
     volume_target_mask = File(exists=True, desc="target volume as mask")
     surface_mask = File(exists=True, desc="target surface as mask")
     sim_type = traits.String(exists=True, desc='temp, eta2, or spat', mandatory=True)
+    backend = traits.Enum('afni', 'numpy', usedefault=True, desc='afni 3dAutoTcorrelate or in-process numpy similarity')
+    memory_budget = traits.Int(1024, usedefault=True, desc='MB per block of the numpy similarity products')
+    n_threads = traits.Int(1, usedefault=True, desc='threads for the numpy eta2 tiles')
 
 class ConcatOutputSpec(TraitedSpec):
     simmatrix = File(exists=True, desc="output similarity")
@@ -22,37 +27,24 @@ class Concat(BaseInterface):
     output_spec = ConcatOutputSpec
 
     def _run_interface(self, runtime):
-        ##load data
-        vol = nb.load(self.inputs.volume_input).get_data()
-        surf = nb.load(self.inputs.surface_input).get_data()
-        vol_target = nb.load(self.inputs.volume_target_mask).get_data()
-        surf_mask = nb.load(self.inputs.surface_mask).get_data()
+        ##load, concatenate and squeeze data and target##
+        totalinput, densetarget, targetfile = squeeze_inputs(self.inputs.volume_input, self.inputs.surface_input,
+                                                             self.inputs.volume_target_mask, self.inputs.surface_mask)
 
-        ##CONCATENATE INPUT##
-        volumeinput = np.resize(vol,(vol.size/vol.shape[-1],vol.shape[-1]))
-        surfaceinput = np.squeeze(surf)
-        totalinput = np.concatenate((surfaceinput,volumeinput))
+        if self.inputs.backend == 'numpy':
+            #same (target x target) matrix as the afni round-trips below, computed in-process
+            #written straight into a memory-mapped nifti, the full matrix never sits in memory
+            out = nifti_memmap(os.path.abspath('similarity.1D.nii'), int(np.count_nonzero(densetarget)))
+            similarity_matrix(totalinput, densetarget, self.inputs.sim_type, memory_mb=self.inputs.memory_budget, n_threads=self.inputs.n_threads, out=out)
+            del out
+            return runtime
 
-        ##SQUEEZE SPARSE MATRIX##
-        input_sum = np.sum(totalinput,axis=1) #find rows of all zeroes
-        the_indices = np.where(input_sum!=0)[0] #save indices for reinflation after squeeze
-        np.save(os.path.abspath('indices.npy'),the_indices)
-        #squeeze & save
-        denseinput = totalinput[the_indices]
-        niftishape = np.reshape(denseinput,(-1,1,1,vol.shape[3]))#reshape into proper nifti (N,1,1,time)
+        denseinput = totalinput[:] #afni needs the squeezed input on disk
+        niftishape = np.reshape(denseinput,(-1,1,1,totalinput.n_timepoints))#reshape into proper nifti (N,1,1,time)
         inputfile = os.path.abspath('simInput.nii')
         nImg = nb.Nifti1Image(niftishape, None)
         nb.save(nImg, inputfile)
 
-        ##CONCATENATE TARGET##
-        volumetarget = np.reshape(vol_target,(vol_target.size))
-        surfacetarget = surf_mask[:,0,0,0] ##one timepoint
-        totaltarget = np.concatenate((surfacetarget,volumetarget))
-        densetarget = np.array(totaltarget[the_indices],dtype='f') ##squeeze target mask, save as float32 for afni input
-        targetfile = os.path.abspath('simTarget.nii')
-        nImg = nb.Nifti1Image(densetarget, None)
-        nb.save(nImg, targetfile)
-
         #run Connectivity (source x target)
         corr = afni.AutoTcorrelate()  #3dWarp -deoblique ??
         corr.inputs.in_file = inputfile
@@ -2,6 +2,8 @@ import os
 from nipype.interfaces.base import BaseInterface, \
     BaseInterfaceInputSpec, traits, File, TraitedSpec
 from nipype.utils.filemanip import split_filename
+from clustering.utils import load_similarity, process_peak_memory_mb
+from clustering.sweep import factored_sweep
 
 from sklearn.cluster import spectral_clustering as spectral
 from sklearn.cluster import KMeans as km
@@ -12,11 +14,11 @@ import nibabel as nb
 import os
 
 class ConsClusterInputSpec(BaseInterfaceInputSpec):
-    in_File = File(exists=True, desc='surface to be clustered', mandatory=True)
+    in_File = File(exists=True, desc='consensus matrix to be clustered, or a factored consensus .npy', mandatory=True)
     hemi = traits.String(exists=True, desc='hemisphere', mandatory=True)
     cluster_type = traits.String(exists=True, desc='spectral, hiercluster, kmeans, or dbscan', mandatory=True)
     n_clusters = traits.Int(exists=True, desc='number of clusters', mandatory=True)
-    epsilon = traits.Float(exists=True, desc='epsilon parameter for dbscan', mandatory=False)
+    epsilon = traits.Float(exists=True, desc='epsilon parameter for dbscan, a 1-consensus radius for a factored consensus', mandatory=False)
 
 class ConsClusterOutputSpec(TraitedSpec):
     out_File = File(exists=True, desc="clustered volume")
@@ -25,14 +27,25 @@ class ConsCluster(BaseInterface):
     input_spec = ConsClusterInputSpec
     output_spec = ConsClusterOutputSpec
 
+    def _save(self, labels):
+        new_img = nb.Nifti1Image(labels+1, None) #+1 because cluster labels start at 0
+        _, base, _ = split_filename(self.inputs.in_File)
+        nb.save(new_img, os.path.abspath(base+'_'+str(self.inputs.n_clusters)+'_'+self.inputs.cluster_type+'_'+self.inputs.hemi+'.nii'))
+
     def _run_interface(self, runtime):        
+        if self.inputs.in_File.endswith('.npy'):
+            ##factored consensus from Consensus(representation='factored')##
+            n_clusters = self.inputs.n_clusters+1
+            labels = factored_sweep(self.inputs.in_File, self.inputs.cluster_type, [n_clusters], self.inputs.epsilon)[n_clusters]
+            self._save(labels)
+            runtime.process_peak_memory_mb = process_peak_memory_mb()
+            return runtime
+
         #load data
-        data = nb.load(self.inputs.in_File).get_data()
-        corrmatrix = np.squeeze(data)
+        corrmatrix = load_similarity(self.inputs.in_File) #memory-mapped float32, no squeezed/thresholded copies
         if self.inputs.cluster_type == 'spectral':
-            positivecorrs = np.where(corrmatrix>0,corrmatrix,0) #threshold at 0 (spectral uses non-negative values)
-            newmatrix = np.asarray(positivecorrs,dtype=np.double) #spectral expects dtype=double values
-            labels = spectral(newmatrix, n_clusters=self.inputs.n_clusters+1, eigen_solver='arpack', assign_labels='discretize')
+            np.maximum(corrmatrix, 0, out=corrmatrix) #threshold at 0 in place (spectral uses non-negative values)
+            labels = spectral(np.asarray(corrmatrix, dtype=np.double), n_clusters=self.inputs.n_clusters+1, eigen_solver='arpack', assign_labels='discretize') #spectral expects dtype=double values
         if self.inputs.cluster_type == 'hiercluster':
             labels = Ward(n_clusters=self.inputs.n_clusters+1).fit_predict(corrmatrix)
         if self.inputs.cluster_type == 'kmeans':
@@ -40,10 +53,8 @@ class ConsCluster(BaseInterface):
         if self.inputs.cluster_type == 'dbscan':
             labels = DBSCAN(eps=self.inputs.epsilon).fit_predict(corrmatrix)
 
-        new_img = nb.Nifti1Image(labels+1, None) #+1 because cluster labels start at 0
-        _, base, _ = split_filename(self.inputs.in_File)
-        nb.save(new_img, os.path.abspath(base+'_'+str(self.inputs.n_clusters)+'_'+self.inputs.cluster_type+'_'+self.inputs.hemi+'.nii'))
-
+        self._save(labels)
+        runtime.process_peak_memory_mb = process_peak_memory_mb()
         return runtime
 
     def _list_outputs(self):
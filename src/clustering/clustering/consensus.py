@@ -4,6 +4,7 @@ from nipype.utils.filemanip import split_filename
 import nibabel as nb
 import numpy as np
 import os
+from clustering.coassociation import load_labels, co_association, parallel_co_association, stack_labels
 
 class ConsensusInputSpec(BaseInterfaceInputSpec):
     in_Files = traits.Either(InputMultiPath(File(exists=True)),
@@ -12,6 +13,9 @@ class ConsensusInputSpec(BaseInterfaceInputSpec):
                                 traits.List(),
                                 mandatory=True)
     maskfile = File(exists=True, desc='total target mask', mandatory=True)
+    representation = traits.Enum('dense', 'factored', usedefault=True, desc='dense consensus matrix, or the stacked subject labels it factors into')
+    n_procs = traits.Int(1, usedefault=True, desc='worker processes for the map-reduce over subject shards')
+    memory_budget = traits.Int(1024, usedefault=True, desc='MB per worker for the co-assignment product blocks')
 
 class ConsensusOutputSpec(TraitedSpec):
     #out_File = File(exists=True, desc="out_File")
@@ -35,24 +39,26 @@ class Consensus(BaseInterface):
             return trait_input
 
     def makeConsensus(self, eachFile, mask):
-        clustermap=nb.load(eachFile).get_data()
-        maskedmap = clustermap[np.where(np.squeeze(mask))]
-        consensus = np.zeros((len(maskedmap),len(maskedmap)))
-        for j in range(len(maskedmap)):
-            consensus[j] = maskedmap == maskedmap[j]
-        return consensus
+        maskedmap = load_labels(eachFile, mask)
+        return co_association([maskedmap])
 
     def _run_interface(self, runtime):
         mask = nb.load(self.inputs.maskfile).get_data()
         src_paths = self._get_filelist(self.inputs.in_Files)
         _, base, _ = split_filename(self.inputs.in_Files[0])
-        
-        cons_dim = len(nb.load(src_paths[0]).get_data())
-        totalConsensus = np.zeros((cons_dim,cons_dim), dtype=np.float64)
-        for src_path in src_paths:
-            totalConsensus += self.makeConsensus(src_path)
+
+        if self.inputs.representation == 'factored':
+            ##keep (vertices x subjects) labels, Cluster works on their one-hot expansion H instead of H.H^T##
+            np.save(os.path.abspath(base+'_ConsensusFactors.npy'), stack_labels(src_paths, mask))
+            return runtime
+
+        ##count co-assignments over all subjects, streamed from disk one clustermap at a time##
+        if self.inputs.n_procs > 1:
+            totalConsensus = parallel_co_association(src_paths, mask, self.inputs.n_procs, self.inputs.memory_budget, tmpdir=os.getcwd())
+        else:
+            totalConsensus = co_association(src_paths, mask, memory_mb=self.inputs.memory_budget)
         ##average across all consensus instances and output##
-        totalConsensus = totalConsensus/len(src_paths)
+        totalConsensus = np.divide(totalConsensus, len(src_paths), dtype=np.float32)
         cImg = nb.Nifti1Image(totalConsensus, None)
         nb.save(cImg, os.path.abspath(base+'_ConsensusMat.nii'))
         ##make consensus into stability measure## remove stability measure for now...
@@ -69,4 +75,6 @@ class Consensus(BaseInterface):
         #outputs["out_File"] = os.path.abspath(base+'_Stability.nii')
         outputs["variation_mat"] = os.path.abspath(base+'_VariationMat.nii')
         outputs["consensus_mat"] = os.path.abspath(base+'_ConsensusMat.nii')
+        if self.inputs.representation == 'factored':
+            outputs["consensus_mat"] = os.path.abspath(base+'_ConsensusFactors.npy')
         return outputs
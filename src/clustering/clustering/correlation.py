@@ -0,0 +1,129 @@
+import tempfile
+import numpy as np
+import nibabel as nb
+from multiprocessing.pool import ThreadPool
+
+def block_rows(n_cols, memory_mb, itemsize=4):
+    #how many output rows of n_cols values fit into the memory budget
+    return max(1, int(memory_mb*2**20 // (n_cols*itemsize)))
+
+def detrend(data, polort=1, out=None):
+    #remove a polynomial trend of order polort from every row, as 3dAutoTcorrelate -polort does (in place with out=data)
+    data = np.asarray(data)
+    if data.dtype.kind != 'f':
+        data = data.astype(np.float64)
+    if polort < 0:
+        if out is None:
+            return data
+        out[...] = data
+        return out
+    basis = np.polynomial.legendre.legvander(np.linspace(-1, 1, data.shape[1]), polort)
+    q, _ = np.linalg.qr(basis)
+    q = q.astype(data.dtype)
+    return np.subtract(data, np.dot(np.dot(data, q), q.T), out=out)
+
+def normalize(data):
+    #zero mean, unit norm rows so that correlations become plain dot products
+    data = data - data.mean(axis=1)[:,None]
+    norms = np.sqrt(np.einsum('ij,ij->i', data, data, dtype=np.float64))
+    norms[norms==0] = 1 #constant rows correlate to 0, as in afni
+    data /= norms[:,None].astype(data.dtype)
+    return np.asarray(data, dtype=np.float32)
+
+def prepare_series(data, polort=1, memory_mb=1024):
+    #detrended, normalized float32 rows of an array or a lazily indexed view, processed one block at a time
+    n, n_timepoints = data.shape
+    series = np.empty((n, n_timepoints), dtype=np.float32)
+    step = block_rows(n_timepoints, memory_mb, itemsize=8)
+    for start in range(0, n, step):
+        series[start:start+step] = normalize(detrend(data[start:start+step], polort))
+    return series
+
+def correlate(sources, targets, memory_mb=1024, out=None):
+    #(sources x targets) products of normalized rows, one BLAS call per row block
+    if out is None:
+        out = np.empty((len(sources), len(targets)), dtype=np.float32)
+    step = block_rows(len(targets), memory_mb)
+    for start in range(0, len(sources), step):
+        out[start:start+step] = np.dot(sources[start:start+step], targets.T)
+    return out
+
+def profile_matrix(series, targets, polort=1, normalized=False, memory_mb=1024):
+    #detrended (target x source) connectivity profiles, computed one block of targets at a time straight into the
+    #result, which is memory-mapped to a temporary file when it does not fit the memory budget
+    shape = (len(targets), len(series))
+    if 4.*shape[0]*shape[1] > memory_mb*2**20:
+        profiles = np.memmap(tempfile.TemporaryFile(), dtype=np.float32, mode='w+', shape=shape)
+    else:
+        profiles = np.empty(shape, dtype=np.float32)
+    step = block_rows(len(series), memory_mb, itemsize=8) #the block and the trend removed from it
+    for start in range(0, len(targets), step):
+        block = np.dot(series[targets[start:start+step]], series.T)
+        detrend(block, polort, out=block)
+        profiles[start:start+step] = normalize(block) if normalized else block
+    return profiles
+
+def nifti_memmap(filename, n):
+    #(n x n) float32 matrix saved as an (n,1,1,n) nifti and filled in place through a memmap
+    hdr = nb.Nifti1Header()
+    hdr.set_data_shape((n,1,1,n))
+    hdr.set_data_dtype(np.float32)
+    hdr.set_data_offset(352)
+    with open(filename, 'wb') as openfile:
+        hdr.write_to(openfile)
+        openfile.write(b'\0'*4) #no extensions
+        openfile.truncate(352+4*n*n)
+    matrix = np.memmap(filename, dtype=np.float32, mode='r+', offset=352, shape=(n,n), order='F')
+    return matrix.T #similarity is symmetric, so the C-ordered view holds the same matrix
+
+def eta2_tile(data, sqnorms, sums, rows, cols):
+    #eta^2 between two row blocks from their Gram matrix, row sums and sums of squares
+    m = data.shape[1]
+    gram = np.dot(data[rows], data[cols].T)
+    pairnorms = sqnorms[rows,None] + sqnorms[None,cols]
+    within = (pairnorms - 2*gram)/2 #sum of squares around the pairwise means
+    grandmean = (sums[rows,None] + sums[None,cols])/(2*m)
+    total = pairnorms - 2*m*grandmean**2 #sum of squares around the grand mean
+    total[total==0] = np.inf
+    return 1 - within/total
+
+def eta2(data, memory_mb=1024, n_threads=1, out=None):
+    #eta^2 (Cohen et al., 2008) between all rows, computed on upper-triangle tiles and mirrored
+    data = np.asarray(data, dtype=np.float32)
+    n = len(data)
+    sqnorms = np.einsum('ij,ij->i', data, data, dtype=np.float64)
+    sums = data.sum(axis=1, dtype=np.float64)
+    if out is None:
+        out = np.empty((n,n), dtype=np.float32)
+    tile = max(1, int(np.sqrt(memory_mb*2**20 / (40.*n_threads)))) #five float64 temporaries per tile and thread
+    starts = range(0, n, tile)
+    tiles = [(slice(i, i+tile), slice(j, j+tile)) for i in starts for j in starts if j >= i]
+
+    def fill(tile_pair):
+        rows, cols = tile_pair
+        block = eta2_tile(data, sqnorms, sums, rows, cols)
+        out[rows,cols] = block
+        if rows != cols:
+            out[cols,rows] = block.T
+    if n_threads > 1:
+        pool = ThreadPool(n_threads) #blas and numpy ufuncs release the GIL
+        pool.map(fill, tiles)
+        pool.close()
+        pool.join()
+    else:
+        for tile_pair in tiles:
+            fill(tile_pair)
+    return out
+
+def similarity_matrix(data, targetmask, sim_type, polort=1, sim_polort=1, memory_mb=1024, n_threads=1, out=None):
+    #(target x target) temp, spat or eta2 similarity of a (source x time) array
+    targets = np.flatnonzero(np.asarray(targetmask).ravel())
+    series = prepare_series(data, polort, memory_mb)
+    if sim_type == 'temp':
+        return correlate(series[targets], series[targets], memory_mb, out)
+    if sim_type == 'eta2':
+        return eta2(profile_matrix(series, targets, sim_polort, memory_mb=memory_mb), memory_mb, n_threads, out)
+    if sim_type == 'spat':
+        profiles = profile_matrix(series, targets, sim_polort, normalized=True, memory_mb=memory_mb)
+        return correlate(profiles, profiles, memory_mb, out)
+    raise ValueError('unknown similarity type %s' % sim_type)
@@ -1,27 +1,104 @@
 import os
+import re
+import csv
+import itertools
 import nibabel as nb
 import numpy as np
-import glob
-from variables import subjects, resultsdir
-import matplotlib.pyplot as plt
+from multiprocessing import Pool
+from clustering.standardize_labels import contingency, match_labels
+from variables import subjects, clusterdir
 
-def find_cluster(subject_id,hemi,sim,cluster_type,n_clusters,session):
-    filestring = '/volumes/clustered/_hemi_{0}/_session_{1}/_subject_id_{2}/_sim_{3}/_cluster_{4}/_n_clusters_{5}'
-    filepath = resultsdir+filestring.format(hemi,session,subject_id,sim,cluster_type,n_clusters)
-    os.chdir(filepath)
-    clustermap = nb.load(''.join(glob.glob('*.nii'))).get_data()
-    return clustermap
+factors = ['fs', 'hemi', 'session', 'subject_id', 'sim', 'cluster', 'n_clusters'] #iterable folders written by the datasink
+optional_factors = ['fs', 'session'] #not iterated by every pipeline (the session infosource is commented out), None when absent
+factor_folder = re.compile('^_(%s)_(.+)$' % '|'.join(sorted(factors, key=len, reverse=True)))
+
+def index_results(resultsdir=clusterdir, subdir='clustered'):
+    #one walk over the results tree: {(fs, hemi, session, subject_id, sim, cluster, n_clusters): clustermap file}
+    index = {}
+    for root, _, files in os.walk(os.path.join(resultsdir, subdir)):
+        keys = dict(m.groups() for m in map(factor_folder.match, root.split(os.sep)) if m)
+        for f in files:
+            if f.endswith('.nii') and all(factor in keys for factor in factors if factor not in optional_factors):
+                key = tuple(keys.get(factor) for factor in factors)
+                if key in index:
+                    raise ValueError('%s and %s are both indexed as %s' % (index[key], os.path.join(root, f), key))
+                index[key] = os.path.join(root, f)
+    if not index:
+        raise IOError('no clustermaps in _hemi_/_subject_id_/_sim_/_cluster_/_n_clusters_ folders under ' + os.path.join(resultsdir, subdir))
+    return index
+
+def find_cluster(subject_id,hemi,sim,cluster_type,n_clusters,session=None,index=None,fs=None):
+    if index is None:
+        index = index_results()
+    return nb.load(index[(fs,hemi,session,subject_id,sim,cluster_type,str(n_clusters))]).get_data()
+
+def scores(table):
+    #dice (after optimal label matching), adjusted rand and normalized mutual information from one contingency table
+    table = np.asarray(table, dtype=np.float64)
+    n = table.sum()
+    rows, columns = table.sum(axis=1), table.sum(axis=0)
+    mapping = match_labels(table)
+    matched = np.flatnonzero(rows)
+    dice = np.sum(2*table[matched, mapping[matched]]/(rows[matched]+columns[mapping[matched]]))/max(np.count_nonzero(rows), np.count_nonzero(columns))
+
+    pairs = lambda x: np.sum(x*(x-1))/2
+    expected = pairs(rows)*pairs(columns)/pairs(n)
+    maximum = (pairs(rows)+pairs(columns))/2
+    ari = 1.0 if maximum == expected else (pairs(table)-expected)/(maximum-expected)
+
+    p, p1, p2 = table/n, rows/n, columns/n
+    nz = p > 0
+    mi = np.sum(p[nz]*np.log(p[nz]/np.outer(p1, p2)[nz]))
+    h1, h2 = -np.sum(p1[p1>0]*np.log(p1[p1>0])), -np.sum(p2[p2>0]*np.log(p2[p2>0]))
+    nmi = 1.0 if h1 == h2 == 0 else (mi/np.sqrt(h1*h2) if h1*h2 > 0 else 0.0)
+    return dict(dice=dice, ari=ari, nmi=nmi, n_vertices=int(n))
+
+def compare(clustermap1, clustermap2):
+    #scores over the vertices clustered in both maps (label 0 is outside the target mask)
+    map1 = np.asarray(clustermap1, dtype=np.int64).ravel()
+    map2 = np.asarray(clustermap2, dtype=np.int64).ravel()
+    keep = (map1 > 0) & (map2 > 0)
+    return scores(contingency(map1[keep], map2[keep]))
+
+def _compare_files(args):
+    key1, key2, file1, file2 = args
+    row = dict(('%s_1' % factor, value) for factor, value in zip(factors, key1))
+    row.update(('%s_2' % factor, value) for factor, value in zip(factors, key2))
+    row.update(compare(nb.load(file1).get_data(), nb.load(file2).get_data()))
+    return row
+
+def pairs_across(index, factor):
+    #every pair of results that differ only in factor (e.g. 'session' for test-retest, 'cluster' for methods)
+    i = factors.index(factor)
+    groups = {}
+    for key in sorted(index, key=str):
+        groups.setdefault(key[:i]+key[i+1:], []).append(key)
+    pairs = [pair for keys in groups.values() for pair in itertools.combinations(keys, 2)]
+    if not pairs:
+        raise ValueError('no pair of indexed results differs only in ' + factor)
+    return pairs
+
+def compare_grid(index, pairs, n_procs=1):
+    #score every pair of indexed results, in worker processes, as one table (list of rows)
+    jobs = [(key1, key2, index[key1], index[key2]) for key1, key2 in pairs]
+    if n_procs == 1:
+        return list(map(_compare_files, jobs))
+    pool = Pool(n_procs)
+    try:
+        return pool.map(_compare_files, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+def write_table(rows, filename):
+    columns = ['%s_%d' % (factor, i) for i in (1, 2) for factor in factors] + ['dice', 'ari', 'nmi', 'n_vertices']
+    with open(filename, 'w') as f:
+        writer = csv.DictWriter(f, columns)
+        writer.writeheader()
+        writer.writerows(rows)
 
 if __name__ == '__main__' :
-    Map1=find_cluster(subjects[0],'lh','eta2','hiercluster','7','session1')
-    Map2=find_cluster(subjects[0],'lh','eta2','hiercluster','7','session2')
-    
-    pairs = []
-    matrix = np.zeros(shape=(np.max(Map1),np.max(Map1)))
-    for i, cluster in enumerate(Map1):
-        pairs.append(str([cluster,Map2[i]]))
-        if cluster>=0:
-            matrix[cluster-1][Map2[i]-1] = matrix[cluster-1][Map2[i]-1]+1
-    #n, bins, patches = plt.hist(pairs)
-    #plt.show()
-    #plt.acorr(matrix)
+    index = index_results()
+    index = dict((key, f) for key, f in index.items() if key[factors.index('subject_id')] in subjects)
+    rows = compare_grid(index, pairs_across(index, 'session'), n_procs=4) #session1 vs session2 for every subject and method
+    write_table(rows, os.path.join(clusterdir, 'session_comparison.csv'))
@@ -3,12 +3,11 @@ import numpy as np
 import os
 
 import nipype.interfaces.freesurfer as fs
-import nipype.interfaces.fsl as fsl
 from nipype.interfaces.base import BaseInterface, \
     BaseInterfaceInputSpec, traits, File, TraitedSpec
 from nipype.utils.filemanip import split_filename
 
-from utils import get_mask
+from utils import get_mask, resample_nearest
 
 class MaskVolumeInputSpec(BaseInterfaceInputSpec):
     preprocessedfile = File(exists=True, desc='original volume', mandatory=True)
@@ -28,14 +27,11 @@ class MaskVolume(BaseInterface):
 
     def _run_interface(self, runtime):
         preprocessedfile = self.inputs.preprocessedfile
-        regfile = self.inputs.regfile
-
-        #invert transform matrix
-        invt = fsl.ConvertXFM()
-        invt.inputs.in_file = regfile
-        invt.inputs.invert_xfm = True
-        invt.inputs.out_file = regfile + '_inv.mat'
-        invt_result= invt.run()
+        funcImg = nb.load(preprocessedfile)
+        parcImg = nb.load(self.inputs.parcfile)
+        #the functional->anatomical registration maps every functional voxel to its anatomical voxel,
+        #so nearest-neighbour sampling needs no inverted matrix (ConvertXFM) and no ApplyXfm runs
+        func2anat = np.loadtxt(self.inputs.regfile)
 
         #define source mask (surface, volume)
         input_labels = self.inputs.vol_source+self.inputs.vol_target
@@ -45,22 +41,15 @@ class MaskVolume(BaseInterface):
         nb.save(sourceImg, sourcemaskfile)
 
         #transform anatomical mask to functional space
-        sourcexfm = fsl.ApplyXfm()
-        sourcexfm.inputs.in_file = sourcemaskfile
-        sourcexfm.inputs.in_matrix_file = invt_result.outputs.out_file
+        sourcemask_xfm = resample_nearest(np.asarray(sourcemask,dtype=np.uint8), parcImg, funcImg, func2anat)
         _, base, _ = split_filename(sourcemaskfile)
-        sourcexfm.inputs.out_file = base + '_xfm.nii.gz'
-        sourcexfm.inputs.reference = preprocessedfile
-        sourcexfm.inputs.interp = 'nearestneighbour'
-        sourcexfm.inputs.apply_xfm = True
-        sourcexfm_result = sourcexfm.run()
+        nb.save(nb.Nifti1Image(sourcemask_xfm, funcImg.get_affine()), os.path.abspath(base + '_xfm.nii.gz'))
 
         #manual source data creation (-mask_source option not yet available in afni)
-        sourcemask_xfm = nb.load(sourcexfm_result.outputs.out_file).get_data()
-        inputdata = nb.load(preprocessedfile).get_data()
-        maskedinput = np.zeros_like(inputdata)
-        for timepoint in range(inputdata.shape[3]):
-            maskedinput[:,:,:,timepoint] = np.where(sourcemask_xfm,inputdata[:,:,:,timepoint],0)
+        inputdata = funcImg.get_data() #memory-mapped for uncompressed images
+        inside = sourcemask_xfm.astype(np.bool)
+        maskedinput = np.zeros(inputdata.shape, dtype=inputdata.dtype)
+        maskedinput[inside] = inputdata[inside] #all timepoints in one fancy-index
         maskedinputfile = os.path.abspath('inputfile.nii')
         inputImg = nb.Nifti1Image(maskedinput, None)
         nb.save(inputImg, maskedinputfile)
@@ -74,15 +63,9 @@ class MaskVolume(BaseInterface):
         nb.save(targetImg, targetmaskfile)
 
         #same transform for target
-        targetxfm = fsl.ApplyXfm()
-        targetxfm.inputs.in_file = targetmaskfile
-        targetxfm.inputs.in_matrix_file = invt_result.outputs.out_file
+        targetmask_xfm = resample_nearest(np.asarray(targetmask,dtype=np.uint8), parcImg, funcImg, func2anat)
         _, base, _ = split_filename(targetmaskfile)
-        targetxfm.inputs.out_file = base + '_xfm.nii.gz'
-        targetxfm.inputs.reference = preprocessedfile
-        targetxfm.inputs.interp = 'nearestneighbour'
-        targetxfm.inputs.apply_xfm = True
-        targetxfm_result = targetxfm.run()
+        nb.save(nb.Nifti1Image(targetmask_xfm, funcImg.get_affine()), os.path.abspath(base + '_xfm.nii.gz'))
 
         return runtime
 
@@ -0,0 +1,28 @@
+import os
+import nibabel as nb
+import numpy as np
+import scipy.sparse as sp
+
+_adjacency_cache = {} #one sparse graph per freesurferdir/fsaverage/hemisphere/surface in this process
+
+def mesh_adjacency(freesurferdir, fsaverage, hemi, surface='white'):
+    #sparse vertex adjacency from the fsaverage surface triangles
+    key = (freesurferdir, fsaverage, hemi[-2:], surface)
+    if key not in _adjacency_cache:
+        _, faces = nb.freesurfer.read_geometry(os.path.join(freesurferdir, fsaverage+'/surf/'+hemi[-2:]+'.'+surface))
+        edges = np.vstack((faces[:,[0,1]], faces[:,[1,2]], faces[:,[2,0]]))
+        n = faces.max()+1
+        adjacency = sp.coo_matrix((np.ones(len(edges), dtype=np.int8), (edges[:,0], edges[:,1])), shape=(n,n)).tocsr()
+        adjacency = adjacency + adjacency.T
+        adjacency.data[:] = 1 #shared edges were counted twice
+        _adjacency_cache[key] = adjacency
+    return _adjacency_cache[key]
+
+def vertex_connectivity(adjacency, vertices):
+    #adjacency restricted to the clustered vertices, rows beyond the mesh (volume data) stay unconnected
+    vertices = np.asarray(vertices)
+    size = max(adjacency.shape[0], vertices.max()+1)
+    if size > adjacency.shape[0]:
+        padding = size - adjacency.shape[0]
+        adjacency = sp.block_diag((adjacency, sp.csr_matrix((padding, padding), dtype=adjacency.dtype)), format='csr')
+    return adjacency[vertices][:,vertices]
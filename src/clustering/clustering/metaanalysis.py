@@ -1,9 +1,10 @@
 from nipype.interfaces.freesurfer import Surface2VolTransform
 from neurosynth.base.dataset import Dataset
-from neurosynth.analysis import meta
 import nibabel as nb
 import numpy as np
+import scipy.sparse as sp
 import cPickle
+import csv
 import os
 
 ## convert niftis by reshaping to add extra dimensions
@@ -15,42 +16,90 @@ def to3dNifti(file_1d):
     nb.save(nImg, file_3d)
     return file_3d
 
-in_file = '/scr/schweiz1/Data/results/consensus_intersubject/_cluster_hiercluster/_hemi_lh/_n_clusters_7/_session_session1/_sim_temp/temp_17_hiercluster_lh_ConsensusMat_7_hiercluster_lh.nii'
-
-file_3d = to3dNifti(in_file)
-volume_file = file_3d + '_volume.nii'
-template = '/scr/ilz1/Data/freesurfer/fsaverage4/mri/orig.mgz'
-## then transform the clustered surface into volumes 
-
-xfm2vol = Surface2VolTransform()
-xfm2vol.inputs.source_file = file_3d
-xfm2vol.inputs.identity = 'fsaverage4'
-xfm2vol.inputs.hemi = 'lh'
-xfm2vol.inputs.transformed_file = volume_file
-xfm2vol.inputs.template_file = template
-xfm2vol.run()
-
-#make masks to input into neurosynth
-def cluster2masks(clusterfile):
-    clustermap = nb.load(clusterfile).get_data()
-    for x in range(1,clustermap.max()+1):
-        clustermask = (clustermap==x).astype(int)
-        nImg = nb.Nifti1Image(clustermask, None)
-        nb.save(nImg, os.path.abspath(clusterfile+'_clustermask'+str(x)+'.nii'))
-
-cluster2masks(volume_file)
-
-dataset_file = '/home/raid3/watanabe/neurosynth/data/dataset.pkl'
-if not os.path.exists(dataset_file):
-    dataset = Dataset('/home/raid3/watanabe/neurosynth/data/database.txt')
-    dataset.add_features('/home/raid3/watanabe/neurosynth/data/features.txt')
-    dataset.save(dataset_file)
-else:
-    dataset = cPickle.load(open(dataset_file,'rb'))
-
-clustermask = volume_file+'_clustermask'+str(3)+'.nii'
-
-ids = dataset.get_ids_by_mask(clustermask)
-features = dataset.feature_table.get_features_by_ids(ids)
+##dataset cache## unpickled once, then (voxels x studies) and (studies x features) arrays memory-mapped from disk
+cache_files = ['voxels', 'image_data', 'image_indices', 'image_indptr', 'features', 'feature_names']
+
+def load_dataset(dataset_file, database=None, features=None):
+    if not os.path.exists(dataset_file):
+        dataset = Dataset(database)
+        dataset.add_features(features)
+        dataset.save(dataset_file)
+        return dataset
+    return cPickle.load(open(dataset_file,'rb'))
+
+def build_cache(dataset, cachedir):
+    if not os.path.isdir(cachedir):
+        os.makedirs(cachedir)
+    volume = dataset.masker.volume
+    grid = np.arange(np.prod(volume.shape[:3])).reshape(volume.shape[:3]) #flat voxel numbers, masked in the dataset's own voxel order
+    voxels = np.asarray(dataset.masker.mask(nb.Nifti1Image(grid.astype(np.float64), volume.get_affine())), dtype=np.int64)
+    images = sp.csr_matrix(dataset.image_table.data, dtype=np.float32) #(voxels x studies) activations
+    feature_data = dataset.get_feature_data().reindex(dataset.image_table.ids).fillna(0) #studies in image order
+    np.save(os.path.join(cachedir, 'voxels.npy'), voxels)
+    np.save(os.path.join(cachedir, 'image_data.npy'), images.data)
+    np.save(os.path.join(cachedir, 'image_indices.npy'), images.indices)
+    np.save(os.path.join(cachedir, 'image_indptr.npy'), images.indptr)
+    np.save(os.path.join(cachedir, 'features.npy'), np.asarray(feature_data.values, dtype=np.float32))
+    np.save(os.path.join(cachedir, 'feature_names.npy'), np.array(list(feature_data.columns)))
+    nb.save(nb.Nifti1Image(np.asarray(volume.get_data()), volume.get_affine()), os.path.join(cachedir, 'mask.nii'))
+
+def load_cache(dataset_file, cachedir=None, database=None, features=None):
+    #memory-mapped dataset arrays, rebuilt from the pickle only when it is newer than the cache
+    if cachedir is None:
+        cachedir = dataset_file+'_cache'
+    stamp = os.path.join(cachedir, 'feature_names.npy')
+    if not os.path.exists(stamp) or (os.path.exists(dataset_file) and os.path.getmtime(stamp) < os.path.getmtime(dataset_file)):
+        build_cache(load_dataset(dataset_file, database, features), cachedir)
+    arrays = dict((name, np.load(os.path.join(cachedir, name+'.npy'), mmap_mode='r')) for name in cache_files)
+    n_studies = arrays['features'].shape[0]
+    arrays['images'] = sp.csr_matrix((arrays['image_data'], arrays['image_indices'], arrays['image_indptr']), shape=(len(arrays['voxels']), n_studies))
+    arrays['template'] = os.path.join(cachedir, 'mask.nii')
+    return arrays
+
+##all labels to volume in one transform##
+def surface2volume(clusterfile, template, fsaverage='fsaverage4', hemi='lh'):
+    file_3d = to3dNifti(clusterfile)
+    xfm2vol = Surface2VolTransform()
+    xfm2vol.inputs.source_file = file_3d
+    xfm2vol.inputs.identity = fsaverage
+    xfm2vol.inputs.hemi = hemi
+    xfm2vol.inputs.transformed_file = file_3d + '_volume.nii'
+    xfm2vol.inputs.template_file = template
+    xfm2vol.run()
+    return file_3d + '_volume.nii'
+
+def cluster_masks(labelvolume, voxels):
+    #multi-label volume split in memory into a sparse (clusters x dataset voxels) indicator, no mask files
+    labels = np.asarray(np.ravel(nb.load(labelvolume).get_data())[voxels], dtype=np.int64)
+    inside = np.flatnonzero(labels > 0)
+    n_clusters = labels.max()
+    return sp.csr_matrix((np.ones(len(inside)), (labels[inside]-1, inside)), shape=(n_clusters, len(voxels)))
+
+def decode(masks, cache, threshold=0.0):
+    #mean feature weights of the studies active in each cluster, as get_ids_by_mask + get_features_by_ids for all clusters at once
+    sizes = np.asarray(masks.sum(axis=1), dtype=np.float64)
+    sizes[sizes==0] = 1
+    active = masks.dot(cache['images']) #(clusters x studies) active voxels, one sparse product
+    active = sp.csr_matrix(active.multiply(1/sizes) > threshold, dtype=np.float64) #studies passing the mask proportion
+    n_studies = np.asarray(active.sum(axis=1), dtype=np.float64)
+    n_studies[n_studies==0] = 1
+    return np.asarray(active.dot(cache['features']))/n_studies
+
+def write_scores(scores, feature_names, filename):
+    with open(filename, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(['cluster'] + list(feature_names))
+        for cluster, row in enumerate(scores):
+            writer.writerow([cluster+1] + list(row))
+
+if __name__ == '__main__':
+    in_file = '/scr/schweiz1/Data/results/consensus_intersubject/_cluster_hiercluster/_hemi_lh/_n_clusters_7/_session_session1/_sim_temp/temp_17_hiercluster_lh_ConsensusMat_7_hiercluster_lh.nii'
+    dataset_file = '/home/raid3/watanabe/neurosynth/data/dataset.pkl'
+    cache = load_cache(dataset_file, database='/home/raid3/watanabe/neurosynth/data/database.txt',
+                       features='/home/raid3/watanabe/neurosynth/data/features.txt')
+    ## then transform the clustered surface into volumes, in the dataset's grid
+    volume_file = surface2volume(in_file, cache['template'], 'fsaverage4', 'lh')
+    scores = decode(cluster_masks(volume_file, cache['voxels']), cache)
+    write_scores(scores, cache['feature_names'], volume_file+'_decoded.csv')
 
 #mri_surf2vol --identity fsaverage4 --surfval /scr/ilz1/Data/attemptsurface.nii --hemi 'lh' --o /scr/ilz1/Data/results/surf2volume.nii --template /scr/ilz1/Data/freesurfer/fsaverage4/mri/orig.mgz
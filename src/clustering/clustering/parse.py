@@ -1,51 +1,86 @@
 import nibabel as nb
 import numpy as np
-import pickle
+import re
+import csv
 import sys
-import surfer.io as surf
-from variables import freesurferdir
 import os
+from multiprocessing import Pool
+from variables import freesurferdir
+from clustering.utils import annotation_index
 
-inputDir = sys.argv[1]
-flag = 'found cluster!!'
-rowflag = 'rows=,['
+flag = re.compile(r'^found cluster!!')
+rows = re.compile(r'rows=,\[([^\]]*)\]')
+vertex = re.compile(r'\d+')
+runtime = re.compile(r'(?:duration|runtime|elapsed time)\s*[:=]?\s*([0-9]*\.?[0-9]+)', re.IGNORECASE)
+failure = re.compile(r'Traceback|Error|Exception')
+iterable = re.compile(r'^_(subject_id|hemi|sim|cluster|n_clusters)_(.+)$') #nipype iterable folders
+columns = ['subject', 'hemi', 'sim', 'method', 'k', 'runtime', 'status', 'n_found', 'log']
 
-def is_number(s):
-    try:
-        float(s)
-        return True
-    except ValueError:
-        return False
-
-def createSurface(inputFile,hemi):
-    [vertices,colortable,names] = surf.read_annot(freesurferdir+'/fsaverage4/label/'+hemi+'.aparc.a2009s.annot', orig_ids=True)
-    
-    clusters = []
-    with open(inputFile,'rb') as openfile:
+def n_vertices(hemi, fsaverage='fsaverage4'):
+    #vertex count of the template the logged rows index into
+    return len(annotation_index(os.path.join(freesurferdir, fsaverage+'/label/'+hemi+'.aparc.a2009s.annot'))[0])
+
+def log_keys(logfile):
+    #subject, hemi, sim, method and k from the iterable folders around a log, hemi falls back to the file name
+    keys = dict(m.groups() for m in map(iterable.match, logfile.split(os.sep)) if m)
+    hemi = keys.get('hemi', os.path.basename(logfile)[:2])
+    if hemi == 'De' or hemi == 'te':
+        hemi = 'lh'
+    return dict(subject=keys.get('subject_id', ''), hemi=hemi, sim=keys.get('sim', ''),
+                method=keys.get('cluster', ''), k=keys.get('n_clusters', ''))
+
+def parse_log(args):
+    #one streaming pass over a log: summary row, and one surface per found cluster when write_surfaces
+    logfile, fsaverage, write_surfaces = args
+    row = log_keys(logfile)
+    row.update(log=logfile, runtime='', status='empty', n_found=0)
+    size = n_vertices(row['hemi'], fsaverage) if write_surfaces else None
+    with open(logfile, 'r') as openfile:
         for line in openfile:
-            if line[:len(flag)] == flag:
-                clusters.append(line)
-
-    for index, cluster in enumerate(clusters):
-        surface = np.zeros_like(vertices)
-        startIndex = cluster.find(rowflag)+len(rowflag)
-        stopIndex = cluster.find(']', startIndex)-1
-        
-        for x in cluster[startIndex:stopIndex].split(','):
-            vertex = x.lstrip()
-            if vertex.isdigit():
-                surface[int(x)%2562] = +1
-        savefile = inputFile.split('.')[0]+'_cluster'+str(index)
-        newImage = nb.nifti1.Nifti1Image(surface, None)
-        nb.save(newImage, savefile)
-        #with open(savefile,'wb') as openfile:
-        #pickle.dump(numbers, openfile)
-
-for root, dirs, filenames in os.walk(inputDir):
-    for f in filenames:
-        if f.endswith('.log'):
-            hemi = f[:2]
-            if hemi == 'De' or hemi == 'te':
-                hemi = 'lh'
-            print f, hemi
-            surface = createSurface(os.path.join(root,f), hemi)
+            if flag.match(line):
+                if write_surfaces:
+                    found = rows.search(line)
+                    surface = np.zeros(size, dtype=np.int32)
+                    if found:
+                        surface[np.array(vertex.findall(found.group(1)), dtype=np.int64) % size] = 1
+                    savefile = logfile.split('.')[0]+'_cluster'+str(row['n_found'])+'.nii'
+                    nb.save(nb.nifti1.Nifti1Image(surface, None), savefile)
+                row['n_found'] += 1
+                continue
+            timed = runtime.search(line)
+            if timed:
+                row['runtime'] = float(timed.group(1))
+            if failure.search(line):
+                row['status'] = 'failed'
+    if row['status'] != 'failed' and row['n_found']:
+        row['status'] = 'ok'
+    if not row['k'] and row['n_found']:
+        row['k'] = row['n_found']
+    return row
+
+def find_logs(inputDir):
+    for root, dirs, filenames in os.walk(inputDir):
+        for f in filenames:
+            if f.endswith('.log'):
+                yield os.path.join(root, f)
+
+def parse_logs(inputDir, fsaverage='fsaverage4', write_surfaces=True, n_procs=4):
+    #all logs under inputDir, streamed through a process pool, as a list of summary rows
+    jobs = [(logfile, fsaverage, write_surfaces) for logfile in find_logs(inputDir)]
+    pool = Pool(n_procs)
+    try:
+        return sorted(pool.imap_unordered(parse_log, jobs, chunksize=8), key=lambda row: row['log'])
+    finally:
+        pool.close()
+        pool.join()
+
+def write_summary(summary, filename):
+    with open(filename, 'w') as f:
+        writer = csv.DictWriter(f, columns)
+        writer.writeheader()
+        writer.writerows(summary)
+
+if __name__ == '__main__':
+    inputDir = sys.argv[1] #parse.py logdir [fsaverage] -> logdir/log_summary.csv
+    fsaverage = sys.argv[2] if len(sys.argv) > 2 else 'fsaverage4'
+    write_summary(parse_logs(inputDir, fsaverage), os.path.join(inputDir, 'log_summary.csv'))
@@ -0,0 +1,67 @@
+import os
+import numpy as np
+import nibabel as nb
+
+class ConcatenatedSeries(object):
+    #(source x time) rows of several memory-mapped images stacked one after the other, read only when indexed.
+    #all-zero rows are squeezed out through an index (self.indices) instead of a physical copy.
+
+    def __init__(self, images, memory_mb=256):
+        self.images = images
+        self.sizes = [int(np.prod(image.shape[:-1])) for image in images]
+        self.offsets = np.cumsum([0]+self.sizes)
+        self.n_timepoints = images[0].shape[-1]
+        self.dtype = np.result_type(*[image.dtype for image in images])
+        self.memory_mb = memory_mb
+        self.indices = np.concatenate([offset + np.flatnonzero(self._rowsums(image)!=0)
+                                       for image, offset in zip(images, self.offsets)]) #rows kept for reinflation
+
+    def _rowsums(self, image):
+        #sum over time in chunks of timepoints, which are contiguous in a (fortran ordered) nifti
+        step = max(1, int(self.memory_mb*2**20 // (8*max(1, image[...,0].size))))
+        sums = np.zeros(image.shape[:-1])
+        for start in range(0, image.shape[-1], step):
+            sums += image[...,start:start+step].sum(axis=-1)
+        return sums.ravel() #c order, as np.resize flattened the images before
+
+    @property
+    def shape(self):
+        return (len(self.indices), self.n_timepoints)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, rows):
+        #squeezed rows (slice or index array) gathered from the images they live in
+        wanted = self.indices[rows]
+        data = np.empty((len(wanted), self.n_timepoints), dtype=self.dtype)
+        for image, start, stop in zip(self.images, self.offsets[:-1], self.offsets[1:]):
+            inside = (wanted >= start) & (wanted < stop)
+            if inside.any():
+                data[inside] = image[np.unravel_index(wanted[inside]-start, image.shape[:-1])]
+        return data
+
+def squeeze_inputs(volume_input, surface_input, volume_target_mask, surface_mask):
+    #concatenated (surface, volume) series without all-zero rows and the matching target mask, as Concat and
+    #Bootstrap feed them to the similarity; indices.npy and simTarget.nii are written for reinflation and afni
+    vol = nb.load(volume_input).get_data() #memory-mapped for uncompressed images
+    surf = nb.load(surface_input).get_data()
+    vol_target = nb.load(volume_target_mask).get_data()
+    surf_mask = nb.load(surface_mask).get_data()
+
+    ##CONCATENATE INPUT## as a view, rows are only read when the similarity needs them
+    totalinput = ConcatenatedSeries([surf, vol])
+
+    ##SQUEEZE SPARSE MATRIX## rows of all zeroes are dropped through the index, not copied
+    the_indices = totalinput.indices #save indices for reinflation after squeeze
+    np.save(os.path.abspath('indices.npy'),the_indices)
+
+    ##CONCATENATE TARGET##
+    volumetarget = np.reshape(vol_target,(vol_target.size))
+    surfacetarget = surf_mask[:,0,0,0] ##one timepoint
+    totaltarget = np.concatenate((surfacetarget,volumetarget))
+    densetarget = np.array(totaltarget[the_indices],dtype='f') ##squeeze target mask, save as float32 for afni input
+    targetfile = os.path.abspath('simTarget.nii')
+    nImg = nb.Nifti1Image(densetarget, None)
+    nb.save(nImg, targetfile)
+    return totalinput, densetarget, targetfile
@@ -3,11 +3,17 @@ import os
 from nipype.interfaces.base import BaseInterface, \
     BaseInterfaceInputSpec, traits, File, TraitedSpec
 from nipype.utils.filemanip import split_filename
+from clustering.correlation import similarity_matrix, nifti_memmap
+import nibabel as nb
+import numpy as np
 
 class SimilarityInputSpec(BaseInterfaceInputSpec):
     in_file = File(exists=True, desc='surface data to construct similarity matrix', mandatory=True)
     sim = traits.String(exists=True, desc='type of similarity', mandatory=True)
     mask = File(exists=True, desc='mask surface which is correlation target', mandatory=True)
+    backend = traits.Enum('afni', 'numpy', usedefault=True, desc='afni 3dAutoTcorrelate or in-process numpy similarity')
+    memory_budget = traits.Int(1024, usedefault=True, desc='MB per block of the numpy similarity products')
+    n_threads = traits.Int(1, usedefault=True, desc='threads for the numpy eta2 tiles')
 
 class SimilarityOutputSpec(TraitedSpec):
     out_file = File(exists=True, desc="similarity matrix output")
@@ -17,6 +23,16 @@ class Similarity(BaseInterface):
     output_spec = SimilarityOutputSpec
 
     def _run_interface(self, runtime):
+        if self.inputs.backend == 'numpy':
+            data = nb.load(self.inputs.in_file).get_data()
+            mask = nb.load(self.inputs.mask).get_data()
+            series = np.reshape(data,(-1,data.shape[-1])) #(source x time)
+            targetmask = np.reshape(mask,(len(series),-1))[:,0] #one timepoint
+            out = nifti_memmap(self._list_outputs()['out_file'], int(np.count_nonzero(targetmask)))
+            similarity_matrix(series, targetmask, self.inputs.sim, sim_polort=-1, memory_mb=self.inputs.memory_budget, n_threads=self.inputs.n_threads, out=out)
+            del out
+            return runtime
+
         ##correlationmatrix##
         corr = afni.AutoTcorrelate()
         corr.inputs.in_file = self.inputs.in_file
@@ -41,4 +57,6 @@ class Similarity(BaseInterface):
     def _list_outputs(self):
         outputs = self._outputs().get()
         outputs["out_file"] = os.path.abspath(self.inputs.sim+'.1D')
+        if self.inputs.backend == 'numpy':
+            outputs["out_file"] = os.path.abspath(self.inputs.sim+'.1D.nii')
         return outputs
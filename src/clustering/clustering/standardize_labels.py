@@ -1,57 +1,51 @@
 import nibabel as nb
 import numpy as np
 import sys
-
-def separate_clusters(clustermap):
-    assignments = np.zeros((clustermap.max()+1,len(clustermap)))
-    for label in xrange(clustermap.max()+1):
-        assignments[label] = clustermap==label
-    return assignments
-
-def find_pair(arr):
-    maximum = arr==arr.max() #largest intersection for array
-    while maximum.sum() >1: #more than one maximum
-        print 'Warning, non-unique clusters/n'+str(arr)
-        arr = np.where(1-maximum,arr,-arr) #set duplicate maximums as negative
-        maximum = arr==arr.max()#try next maximum
-    row = np.where(maximum)[0][0] #what row is that maximum in?
-    column = np.where(maximum)[1][0] # what column is that maximum in?
-    newarr = arr.copy()
-    newarr[row,:] = 0 #prevent that row from being chosen again
-    newarr[:,column] = 0 #ditto for columns
-    newarr = abs(newarr) #get back duplicate maximum
-    return row,column,newarr
-
+from scipy.optimize import linear_sum_assignment
+
+def contingency(clustermap1, clustermap2, n_labels=None):
+    #(labels1 x labels2) number of shared vertices for every pair of clusters, from a single bincount
+    map1 = np.asarray(clustermap1, dtype=np.int64).ravel()
+    map2 = np.asarray(clustermap2, dtype=np.int64).ravel()
+    if n_labels is None:
+        n_labels = max(map1.max(), map2.max())+1
+    return np.bincount(map1*n_labels+map2, minlength=n_labels**2).reshape(n_labels,n_labels)
+
+def match_labels(table):
+    #label mapping that maximizes the total intersection (hungarian assignment, globally optimal)
+    rows, columns = linear_sum_assignment(-table)
+    mapping = np.arange(len(table))
+    mapping[rows] = columns
+    return mapping
 
 def cluster_diff(clustermap1,clustermap2): #non-commutative
-    boolmap1 = separate_clusters(clustermap1) #expand out to boolean clusters of n_clusters x surface_vertices
-    boolmap2 = separate_clusters(clustermap2)
-
-    n = len(boolmap1) #number of clusters
-    intersect = np.zeros((n,n)) 
-    for i in xrange(n):
-        for j in xrange(n):
-            intersect[i,j] = np.sum(boolmap1[i]*boolmap2[j]) #find size of intersecting vertices for every pair of clusters
-    
-    ##############for k in xrange(n):
-    ##############    intersect[:,k] = intersect[:,k]/intersect[:,k].sum() #divided by total intersecting vertices
-
-    pairs = []
-    destructive_arr = intersect
-    for pair in range(intersect.shape[0]): #choose cluster pairs by finding the largest size of intersecting vertices and then removing this pair from the possibility pairs to choose from. Iterate.
-        r,c,destructive_arr = find_pair(destructive_arr)
-        pairs.append((r,c))
-    t = boolmap1.copy()
-    for x in pairs:
-        origlabel,newlabel = x
-        t[origlabel] = np.where(boolmap1[origlabel],newlabel,0) #reassign the cluster labels to new schema
-    clustermap1_stdlabels = t.sum(axis=0) #collapse to one clustermap again
+    clustermap1 = np.asarray(clustermap1, dtype=np.int64)
+    clustermap2 = np.asarray(clustermap2, dtype=np.int64)
+    mapping = match_labels(contingency(clustermap1,clustermap2))
+    clustermap1_stdlabels = mapping[clustermap1] #reassign the cluster labels to new schema
 
     diff = np.where(clustermap1_stdlabels != clustermap2, (clustermap1_stdlabels,clustermap2), 0) #matrix with dimensions 2 x surface_vertices. When cluster assignments are different, that vertex has two labels, one from map1 and one from map2.
     stability = np.sum(diff[0]!=0) #how similar are the clusters?
     return clustermap1_stdlabels, diff, stability
 
+def align_to_reference(clustermaps, reference):
+    #relabel a (maps x vertices) stack of clustermaps onto the labels of reference in one call
+    maps = np.asarray(clustermaps, dtype=np.int64).reshape(len(clustermaps),-1)
+    reference = np.asarray(reference, dtype=np.int64).ravel()
+    n_maps = len(maps)
+    n_labels = max(maps.max(), reference.max())+1
+    codes = (np.arange(n_maps)[:,None]*n_labels + maps)*n_labels + reference #one contingency table per map
+    tables = np.bincount(codes.ravel(), minlength=n_maps*n_labels**2).reshape(n_maps,n_labels,n_labels)
+    mappings = np.array([match_labels(table) for table in tables])
+    return mappings[np.arange(n_maps)[:,None], maps]
+
 if __name__ == '__main__':
+    if len(sys.argv) > 3: #standardize_labels.py reference.nii map1.nii map2.nii ... -> map*_stdlabels.nii
+        reference = nb.load(sys.argv[1]).get_data()
+        aligned = align_to_reference([nb.load(f).get_data() for f in sys.argv[2:]], reference)
+        for f, newmap in zip(sys.argv[2:], aligned):
+            nb.save(nb.Nifti1Image(np.reshape(newmap, reference.shape), None), f.split('.nii')[0]+'_stdlabels.nii')
+        sys.exit()
     clustermap1 = nb.load(sys.argv[1]).get_data()
     clustermap2 = nb.load(sys.argv[2]).get_data()
     #clustermap2 = nb.load('/scr/ilz1/nki_enhanced/Results/clusterResults/clustered/_hemi_lh/_subject_id_0192736/_sim_temp/_cluster_kmeans/_n_clusters_6/similarity.1D_6_kmeans_lh_clustermap.nii').get_data()
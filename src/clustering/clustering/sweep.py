@@ -0,0 +1,50 @@
+import numpy as np
+from sklearn.manifold import spectral_embedding
+from sklearn.cluster.spectral import discretize
+from sklearn.cluster import ward_tree
+from sklearn.cluster import KMeans as km
+from sklearn.cluster import DBSCAN
+from clustering.coassociation import load_factors, factored_embedding
+
+def spectral_sweep(affinity, n_clusters_list, eigen_solver='arpack'):
+    #one embedding for the largest k, discretized on its leading k eigenvectors for every k
+    maps = spectral_embedding(affinity, n_components=max(n_clusters_list), eigen_solver=eigen_solver, drop_first=False)
+    return embedding_sweep(maps, n_clusters_list)
+
+def embedding_sweep(maps, n_clusters_list):
+    #discretize the leading k columns of a spectral embedding for every k
+    return dict((k, discretize(maps[:,:k])) for k in n_clusters_list)
+
+def cut_tree(children, n_leaves, n_clusters):
+    #labels of the n_clusters subtrees left after undoing the last n_clusters-1 merges
+    cut = 2*n_leaves - n_clusters #nodes with ids >= cut are above the cut
+    owner = np.arange(2*n_leaves-1)
+    for merge in range(len(children)-1, -1, -1):
+        node = n_leaves + merge
+        if node < cut:
+            owner[children[merge]] = owner[node]
+    _, labels = np.unique(owner[:n_leaves], return_inverse=True)
+    return labels
+
+def ward_sweep(data, n_clusters_list, connectivity=None):
+    #one ward tree, cut at every k
+    children = ward_tree(data, connectivity=connectivity)[0]
+    return dict((k, cut_tree(children, len(data), k)) for k in n_clusters_list)
+
+def factored_sweep(filename, cluster_type, n_clusters_list, epsilon=None, connectivity=None):
+    #labels of a factored consensus (stacked subject labels) for every k, the (n x n) matrix H.H^T is never formed
+    indicators, n_subjects = load_factors(filename)
+    if cluster_type == 'spectral':
+        return embedding_sweep(factored_embedding(indicators, n_subjects, max(n_clusters_list)), n_clusters_list)
+    features = indicators.toarray() #rows of H, their squared distances are 2*n_subjects*(1-consensus)
+    if cluster_type == 'hiercluster':
+        return ward_sweep(features, n_clusters_list)
+    if cluster_type == 'meshward':
+        return ward_sweep(features, n_clusters_list, connectivity=connectivity)
+    if cluster_type == 'kmeans':
+        return dict((k, km(n_clusters=k).fit_predict(features)) for k in n_clusters_list)
+    if cluster_type == 'dbscan':
+        #epsilon is a 1-consensus radius (as dbscan_metric='precomputed'), mapped to the distance between rows of H
+        labels = DBSCAN(eps=np.sqrt(2*n_subjects*epsilon)).fit_predict(features)
+        return dict((k, labels) for k in n_clusters_list)
+    raise ValueError('unknown cluster type %s' % cluster_type)
@@ -1,4 +1,5 @@
 import os
+import resource
 import nibabel as nb
 import numpy as np
 
@@ -6,17 +7,38 @@ def get_subjects_from(Directory):
     subjects = os.listdir(Directory)
     return subjects
 
+_annotation_cache = {} #parsed annotations of this process, keyed by file
+annotation_cachedir = os.path.join(os.path.expanduser('~'), '.cache', 'clustering_annotations') #shared by all processes
+
+def annotation_index(annotfile, cachedir=annotation_cachedir):
+    #per-vertex annotation ids and colortable ids of an annotation, parsed once and kept on disk for other processes
+    if annotfile not in _annotation_cache:
+        cachefile = None
+        if cachedir is not None:
+            cachefile = os.path.join(cachedir, os.path.abspath(annotfile).strip(os.sep).replace(os.sep,'_')+'.npz')
+        if cachefile is not None and os.path.exists(cachefile) and os.path.getmtime(cachefile) >= os.path.getmtime(annotfile):
+            cached = np.load(cachefile)
+            index = (cached['vertices'], cached['ids'])
+        else:
+            [vertices,colortable,names] = nb.freesurfer.read_annot(annotfile, orig_ids=True)
+            index = (vertices, colortable[:,4])
+            if cachefile is not None:
+                if not os.path.isdir(cachedir):
+                    try:
+                        os.makedirs(cachedir)
+                    except OSError: #created by a parallel job in the meantime
+                        pass
+                tmpfile = cachefile[:-len('.npz')]+'.%d.npz' % os.getpid()
+                np.savez(tmpfile, vertices=vertices, ids=index[1])
+                os.rename(tmpfile, cachefile) #atomic, parallel jobs never read a half-written cache
+        _annotation_cache[annotfile] = index
+    return _annotation_cache[annotfile]
+
 def get_vertices(hemi,freesurferdir, fsaverage, labellist):
-    [vertices,colortable,names] = nb.freesurfer.read_annot(os.path.join(freesurferdir,fsaverage+'/label/'+hemi[-2:]+'.aparc.a2009s.annot'), orig_ids=True)
-    chosenvertices = list()
+    vertices, ids = annotation_index(os.path.join(freesurferdir,fsaverage+'/label/'+hemi[-2:]+'.aparc.a2009s.annot'))
     if labellist == []:
-        chosenvertices = range(len(vertices)) #all vertices
-    else:
-        for j, value in enumerate(vertices):
-            for i, index in enumerate(labellist):
-                if colortable[index][4]==value:
-                    chosenvertices.append(j)
-    return chosenvertices
+        return np.arange(len(vertices)) #all vertices
+    return np.flatnonzero(np.isin(vertices, ids[labellist])) #vertices carrying any of the labels
 
 def get_mask(labels, parcfile):
     import nibabel as nb
@@ -34,3 +56,40 @@ def get_mask(labels, parcfile):
             newdata = parcdata == label
             mask = mask + newdata
     return mask
+
+def fsl_scaling(img):
+    #voxel -> flirt 'scaled mm' coordinates, x flipped for images with a positive (neurological) determinant
+    scaling = np.diag(list(img.get_header().get_zooms()[:3])+[1.])
+    if np.linalg.det(img.get_affine()) > 0:
+        flip = np.eye(4)
+        flip[0,0] = -1
+        flip[0,3] = img.shape[0]-1
+        scaling = scaling.dot(flip)
+    return scaling
+
+def resample_nearest(data, in_img, ref_img, ref2in):
+    #nearest-neighbour resampling of data (on in_img's grid) onto ref_img's grid, as flirt -applyxfm -interp nearestneighbour
+    #ref2in is the flirt matrix from reference to input space, i.e. the inverse of the one given to applyxfm
+    shape = ref_img.shape[:3]
+    grid = np.indices(shape).reshape(3,-1)
+    voxels = np.vstack((grid, np.ones((1,grid.shape[1]))))
+    transform = np.linalg.inv(fsl_scaling(in_img)).dot(ref2in).dot(fsl_scaling(ref_img))
+    coords = np.rint(transform.dot(voxels)[:3]).astype(np.int64)
+    inside = np.all((coords >= 0) & (coords < np.array(data.shape[:3])[:,None]), axis=0)
+    resampled = np.zeros(grid.shape[1], dtype=data.dtype)
+    resampled[inside] = data[tuple(coords[:,inside])]
+    return resampled.reshape(shape)
+
+def load_similarity(filename):
+    #(n x n) similarity matrix memory-mapped from an uncompressed nifti, float32 copy only if stored otherwise
+    data = np.squeeze(nb.load(filename).get_data()) #memmap (copy-on-write) for uncompressed, unscaled images
+    if data.dtype != np.float32:
+        data = data.astype(np.float32)
+    if not data.flags.writeable:
+        data = np.array(data)
+    return data
+
+def process_peak_memory_mb():
+    #peak resident memory of this process over its whole lifetime (ru_maxrss is in kilobytes on linux), not of one
+    #node: with nodes run in the same process it is an upper bound that earlier nodes may have set
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.
@@ -2,41 +2,70 @@ import surfer
 from surfer import Brain
 import numpy as np
 import nibabel as nb
-import nipype.interfaces.freesurfer as fs
-#from variables import freesurferdir, resultsdir
 import os
-import glob
 import sys
+from multiprocessing import Pool
 
-def annotation():
-	brain.add_annotation('aparc.a2009s', alpha = .2)
-def roi():
-	brain.add_label('prefrontal', alpha = .4)
-def save(filename):
-	brain.save_montage(filename+'.png',['med', 'lat', 'ros', 'vent'],orientation = 'h') #to save png
-def all_brains(dir):
+views = ['med', 'lat', 'ros', 'vent']
+_brains = {} #one offscreen Brain per fsaverage/hemisphere/surface in this process, only the overlay is swapped
+
+def get_brain(fsaverage, hemi, surface='pial', subjects_dir=None):
+    key = (fsaverage, hemi, surface, subjects_dir)
+    if key not in _brains:
+        _brains[key] = Brain(fsaverage, hemi, surface, subjects_dir=subjects_dir, offscreen=True,
+                             config_opts=dict(background="lightslategray", cortex="high_contrast"))
+    return _brains[key]
+
+def annotation(brain):
+    brain.add_annotation('aparc.a2009s', alpha = .2)
+def roi(brain):
+    brain.add_label('prefrontal', alpha = .4)
+def save(brain, filename):
+    brain.save_montage(filename+'.png',views,orientation = 'h') #to save png
+
+def add_cluster(clustermap, hemi, fsaverage, surface='pial', subjects_dir=None):
+    brain = get_brain(fsaverage, hemi, surface, subjects_dir)
+    brain.add_data(clustermap, colormap='spectral', alpha=.8, remove_existing=True) #replaces the previous map, the scene stays
+    brain.data['colorbar'].number_of_colors = int(clustermap.max())+1
+    brain.data['colorbar'].number_of_labels = int(clustermap.max())+1 ##because -1 denotes masked regions, cluster labels start at 1
+    return brain
+
+def hemisphere(filename):
+    hemi = os.path.basename(filename)[:2]
+    if hemi == 'De' or hemi == 'te':
+        hemi = 'lh'
+    if hemi not in ('lh', 'rh'):
+        hemi = 'rh' if '_rh_' in filename else 'lh'
+    return hemi
+
+def render(args):
+    #one clustermap into a png montage next to it
+    filename, fsaverage, surface, subjects_dir = args
+    clustermap = np.ravel(nb.load(filename).get_data())
+    brain = add_cluster(clustermap, hemisphere(filename), fsaverage, surface, subjects_dir)
+    save(brain, filename)
+    return filename+'.png'
+
+def find_clustermaps(dir):
     for root, dirs, filenames in os.walk(dir):
         for f in filenames:
-            hemi = f[:2]
-            if hemi == 'De' or hemi == 'te':
-                hemi = 'lh'
             if f.endswith('nii'):
-                print f, hemi
-                clustermap = nb.load(os.path.join(root,f)).get_data()
-                add_cluster(clustermap, hemi)
-                save(os.path.join(root,f))
-
-def add_cluster(clustermap, hemi, fsaverage):
-    brain = Brain(fsaverage, hemi, surface,config_opts=dict(background="lightslategray", cortex="high_contrast"))
-    brain.add_data(clustermap, colormap='spectral', alpha=.8)
-    brain.data['colorbar'].number_of_colors = int(clustermap.max())+1
-    brain.data['colorbar'].number_of_labels = int(clustermap.max())+1 ##because -1 denotes masked regions, cluster labels start at 1
+                yield os.path.join(root,f)
+
+def all_brains(dir, fsaverage='fsaverage5', surface='pial', subjects_dir=None, n_procs=4):
+    #png montages of every clustermap under dir, spread over worker processes that keep their Brains
+    jobs = sorted(((f, fsaverage, surface, subjects_dir) for f in find_clustermaps(dir)), key=lambda job: hemisphere(job[0]))
+    if n_procs == 1:
+        return list(map(render, jobs))
+    pool = Pool(n_procs)
+    try:
+        return pool.map(render, jobs, chunksize=max(1, len(jobs)//(4*n_procs))) #contiguous chunks, mostly one hemisphere per worker
+    finally:
+        pool.close()
+        pool.join()
 
 if __name__ == '__main__' :
-	#fs.FSCommand.set_default_subjects_dir('SCR/data/Final_High')#(freesurferdir)
-	#pysurfer visualization
-    fsaverage = 'fsaverage5'
-    hemi = 'lh'
-    surface = 'pial'
-    brain = Brain(fsaverage, hemi, surface, config_opts=dict(background="lightslategray", cortex="high_contrast"))
-    print('FORMAT: add_cluster(clustermap,hemisphere,fsaverage)')
+    #visualization.py clusterdir [fsaverage] [n_procs] -> clustermap.nii.png montages
+    fsaverage = sys.argv[2] if len(sys.argv) > 2 else 'fsaverage5'
+    n_procs = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    all_brains(sys.argv[1], fsaverage, n_procs=n_procs)
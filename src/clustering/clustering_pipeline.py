@@ -18,7 +18,7 @@ from clustering.mask_volume import MaskVolume
 from clustering.concat import Concat
 from clustering.cluster_map import ClusterMap
 
-from variables import subjects, sessions, workingdir, similaritydir, clusterdir, freesurferdir, clustering_dg_template, clustering_dg_args, hemispheres, similarity_types, cluster_types, n_clusters, epsilon
+from variables import subjects, sessions, fsaverage, workingdir, similaritydir, clusterdir, freesurferdir, clustering_dg_template, clustering_dg_args, hemispheres, similarity_types, cluster_types, n_clusters, cluster_sweep, clustermap_text, epsilon, dbscan_metric, spectral_affinity, spectral_neighbors, spectral_solver
 
 def get_wf():
     
@@ -45,8 +45,9 @@ def get_wf():
     cluster_infosource = pe.Node(util.IdentityInterface(fields=['cluster']), name="cluster_infosource")
     cluster_infosource.iterables = ('cluster', cluster_types)
 
-    n_clusters_infosource = pe.Node(util.IdentityInterface(fields=['n_clusters']), name="n_clusters_infosource")
-    n_clusters_infosource.iterables = ('n_clusters', n_clusters)
+    if not cluster_sweep:
+        n_clusters_infosource = pe.Node(util.IdentityInterface(fields=['n_clusters']), name="n_clusters_infosource")
+        n_clusters_infosource.iterables = ('n_clusters', n_clusters)
 
 ##Datagrabber##
     datagrabber = pe.Node(nio.DataGrabber(infields=['subject_id','fs','hemi','sim'], outfields=['simmatrix','maskindex','targetmask']), name="datagrabber")
@@ -65,22 +66,39 @@ def get_wf():
 ##clustering##
     clustering = pe.Node(Cluster(), name = 'clustering')
     clustering.inputs.epsilon = epsilon
+    clustering.inputs.dbscan_metric = dbscan_metric
+    clustering.inputs.affinity = spectral_affinity
+    clustering.inputs.n_neighbors = spectral_neighbors
+    clustering.inputs.eigen_solver = spectral_solver
     wf.connect(hemi_infosource, 'hemi', clustering, 'hemi')
     wf.connect(cluster_infosource, 'cluster', clustering, 'cluster_type')
-    wf.connect(n_clusters_infosource, 'n_clusters', clustering, 'n_clusters')
     wf.connect(datagrabber, 'simmatrix', clustering, 'in_File')
+    clustering.inputs.freesurferdir = freesurferdir #mesh for meshward
+    wf.connect(fs_infosource, 'fs', clustering, 'fs')
+    wf.connect(datagrabber, 'maskindex', clustering, 'indicesfile')
+    wf.connect(datagrabber, 'targetmask', clustering, 'maskfile')
 
 ##reinflate to surface indices##
-    clustermap = pe.Node(ClusterMap(), name = 'clustermap')
-    wf.connect(clustering, 'out_File', clustermap, 'clusteredfile')
+    if cluster_sweep:
+        clustering.inputs.n_clusters_list = n_clusters
+        clustermap = pe.Node(ClusterMap(), name = 'clustermap') #all k reinflated in one scatter
+        wf.connect(clustering, 'out_Files', clustermap, 'clusteredfile')
+    else:
+        wf.connect(n_clusters_infosource, 'n_clusters', clustering, 'n_clusters')
+        clustermap = pe.Node(ClusterMap(), name = 'clustermap')
+        wf.connect(clustering, 'out_File', clustermap, 'clusteredfile')
     wf.connect(datagrabber, 'maskindex', clustermap, 'indicesfile')
     wf.connect(datagrabber, 'targetmask', clustermap, 'maskfile')    
+    clustermap.inputs.save_text = clustermap_text
 
 ##Datasink##
     ds = pe.Node(nio.DataSink(), name="datasink")
     ds.inputs.base_directory = clusterdir
+    if cluster_sweep: #same _n_clusters_ folders as the iterable layout, for the consensus datagrabber
+        ds.inputs.regexp_substitutions = [(r'/([^/]+_(\d+)_[^/_]+_[lr]h_clustermap\.(nii|txt))$', r'/_n_clusters_\2/\1')]
     wf.connect(clustermap, 'clustermapfile', ds, 'clustered')
-    wf.connect(clustermap, 'clustermaptext', ds, 'clustered.@1')
+    if clustermap_text:
+        wf.connect(clustermap, 'clustermaptext', ds, 'clustered.@1')
     wf.write_graph()
     return wf
 
@@ -1,6 +1,7 @@
 import matplotlib
 matplotlib.use('Agg')
 import os
+import warnings
 import nipype.pipeline.engine as pe
 import nipype.interfaces.utility as util
 import nipype.interfaces.io as nio
@@ -8,7 +9,7 @@ import nipype.interfaces.io as nio
 from clustering.cluster_map import ClusterMap
 from clustering.consensus import Consensus
 from clustering.cluster import Cluster
-from variables import subjects, sessions, workingdir, clusterdir, consensusdir, freesurferdir, consensus_dg_template, consensus_dg_args, hemispheres, similarity_types, cluster_types, n_clusters
+from variables import subjects, sessions, workingdir, clusterdir, consensusdir, freesurferdir, consensus_dg_template, consensus_dg_args, hemispheres, similarity_types, cluster_types, n_clusters, consensus_representation, consensus_procs, consensus_memory
 
 def get_wf():
     wf = pe.Workflow(name="main_workflow")
@@ -26,7 +27,9 @@ def get_wf():
     sim_infosource.iterables = ('sim', similarity_types)
 
     cluster_infosource = pe.Node(util.IdentityInterface(fields=['cluster']), name="cluster_infosource")
-    cluster_infosource.iterables = ('cluster', cluster_types)
+    if 'meshward' in cluster_types: #the consensus datagrabber has no fsaverage mesh to constrain the ward tree
+        warnings.warn("meshward is not supported by the consensus pipeline (no fsaverage surface mesh), its consensus is skipped")
+    cluster_infosource.iterables = ('cluster', [c for c in cluster_types if c != 'meshward'])
 
     n_clusters_infosource = pe.Node(util.IdentityInterface(fields=['n_clusters']), name="n_clusters_infosource")
     n_clusters_infosource.iterables = ('n_clusters', n_clusters)
@@ -47,6 +50,9 @@ def get_wf():
 
 ##Consensus between subjects##
     intersubject = pe.Node(Consensus(), name = 'intersubject')
+    intersubject.inputs.representation = consensus_representation
+    intersubject.inputs.n_procs = consensus_procs
+    intersubject.inputs.memory_budget = consensus_memory
     wf.connect(dg_subjects, 'all_subjects', intersubject, 'in_Files')
     wf.connect(dg_subjects, 'targetmask', intersubject, 'maskfile')
 
@@ -105,6 +105,8 @@ if __name__ == '__main__':
         workflow_0_prepro = do_pipe1_prepro(subject_id, freesurfer_dir, data_dir, data_template, workflow_dir, output_dir)
 
         workflow_3_proj = do_pipe3_projection(subject_id, freesurfer_dir, workflow_dir, output_dir, tract_number, use_sample)
+        # the left run of pipe 4 writes the native distance matrices of both hemispheres and between them,
+        # the right run (step 5) and pipe 5 (step 6) read them from the output directory and have to run after it
         workflow_4_distmat_lh = do_pipe4_distmat(subject_id, workflow_dir, output_dir, tract_number, is_LH, use_sample)
         workflow_5_distmat_rh = do_pipe4_distmat(subject_id, workflow_dir, output_dir, tract_number, is_RH, use_sample)
         workflow_6_distmat_lr = do_pipe5_distmat_lr(subject_id, workflow_dir, output_dir, tract_number, use_sample)
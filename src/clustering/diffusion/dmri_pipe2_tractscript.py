@@ -34,12 +34,8 @@ def script_tracking(subject_ID, chunk_nr, output_dir, tract_number,tract_step, i
     if(is_left):
         call("mkdir "+output_dir+"/"+subject_ID+"/raw_tracts", shell=True)
         call("mkdir "+output_dir+"/"+subject_ID+"/compact_tracts", shell=True)
-        call("mkdir "+output_dir+"/"+subject_ID+"/compact_tracts/nat", shell=True)
-        call("mkdir "+output_dir+"/"+subject_ID+"/compact_tracts/log", shell=True)
         
     call("mkdir "+output_dir+"/"+subject_ID+"/raw_tracts/"+hemi_string, shell=True)
-    call("mkdir "+output_dir+"/"+subject_ID+"/compact_tracts/nat/"+hemi_string, shell=True)
-    call("mkdir "+output_dir+"/"+subject_ID+"/compact_tracts/log/"+hemi_string, shell=True)
     
     chunk_file_prefix=seeds_dir+'/chunk_'
     
@@ -14,7 +14,7 @@ and  a 3D trackvis file of NKI_enhanced data.
 =============================================
 """
 
-def do_pipe3_projection(subject_ID, freesurfer_dir, workflow_dir, output_dir, tract_number, use_sample=False):
+def do_pipe3_projection(subject_ID, freesurfer_dir, workflow_dir, output_dir, tract_number, use_sample=False, n_procs=8):
 
     """
     Packages and Data Setup
@@ -33,14 +33,15 @@ def do_pipe3_projection(subject_ID, freesurfer_dir, workflow_dir, output_dir, tr
     
     from nipype.interfaces.utility import Function
 
-    from dmri_pipe_aux import get_connectivity_matrix
     from dmri_pipe_aux import surf2file
     from dmri_pipe_aux import voxels2nii
     from dmri_pipe_aux import normalize_matrix
     from dmri_pipe_aux import interface2surf
     from dmri_pipe_aux import read_voxels
-    from dmri_pipe_aux import downsample_matrix
+    from dmri_pipe_aux import downsample_matrices
     from dmri_pipe_aux import merge_matrices
+    from dmri_tract_store import pack_tracts
+    from dmri_tract_store import store_connectivity_matrix
 
     
     """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
@@ -115,17 +116,40 @@ def do_pipe3_projection(subject_ID, freesurfer_dir, workflow_dir, output_dir, tr
     dmripipeline.connect(inputnode, "seeds_right", interface_voxels_right,"seed_file")
     
     """
-    Get the direct connectivity matrix
+    pack each hemisphere's tracts, restricted to the white matter mask, into one compact tract store; the visits of the
+    seed voxels of both hemispheres are read in the same pass
+    """
+    
+    tract_store_left = pe.Node(interface=Function(input_names=["tract_list","mask_file","out_prefix","tract_number","n_procs","voxel_list","opposite_voxel_list"],
+                                                  output_names=["index_file","data_file"], function=pack_tracts), name='71_tract_store_left')
+    tract_store_left.inputs.out_prefix = subject_ID + '_left'
+    tract_store_left.inputs.tract_number = tract_number
+    tract_store_left.inputs.n_procs = n_procs # tract images are read in a process pool
+    tract_store_left.run_without_submitting = True
+    dmripipeline.connect(inputnode, "tracts_left", tract_store_left, "tract_list")
+    dmripipeline.connect(inputnode, "wm", tract_store_left, "mask_file")
+    dmripipeline.connect(interface_voxels_left, "seed_list", tract_store_left, "voxel_list")
+    dmripipeline.connect(interface_voxels_right, "seed_list", tract_store_left, "opposite_voxel_list")
+    
+    tract_store_right = tract_store_left.clone(name='71_tract_store_right')
+    tract_store_right.inputs.out_prefix = subject_ID + '_right'
+    dmripipeline.connect(inputnode, "tracts_right", tract_store_right, "tract_list")
+    dmripipeline.connect(inputnode, "wm", tract_store_right, "mask_file")
+    dmripipeline.connect(interface_voxels_right, "seed_list", tract_store_right, "voxel_list")
+    dmripipeline.connect(interface_voxels_left, "seed_list", tract_store_right, "opposite_voxel_list")
+    
+    """
+    Get the direct connectivity matrix from the tract stores
     """
         
-    connectivity_matrix = pe.Node(interface=Function(input_names=["tract_list_left", "tract_list_right","voxel_list_left","voxel_list_right","max_value"],
+    connectivity_matrix = pe.Node(interface=Function(input_names=["index_left", "index_right","voxel_list_left","voxel_list_right","max_value"],
                                                         output_names=["submatrix_left_left","submatrix_left_right","submatrix_right_left","submatrix_right_right","exclusion_list"],
-                                                        function=get_connectivity_matrix), name='71_direct_connect_array')
+                                                        function=store_connectivity_matrix), name='72_direct_connect_array')
     connectivity_matrix.inputs.max_value = tract_number
     connectivity_matrix.run_without_submitting = True
 #    connectivity_matrix.plugin_args={'override_specs': 'requirements = Machine == "kalifornien.cbs.mpg.de"'}
-    dmripipeline.connect(inputnode, "tracts_left", connectivity_matrix, "tract_list_left")
-    dmripipeline.connect(inputnode, "tracts_right", connectivity_matrix, "tract_list_right")
+    dmripipeline.connect(tract_store_left, "index_file", connectivity_matrix, "index_left")
+    dmripipeline.connect(tract_store_right, "index_file", connectivity_matrix, "index_right")
     dmripipeline.connect(interface_voxels_left, "seed_list", connectivity_matrix, "voxel_list_left")
     dmripipeline.connect(interface_voxels_right, "seed_list", connectivity_matrix, "voxel_list_right")
     
@@ -341,138 +365,21 @@ def do_pipe3_projection(subject_ID, freesurfer_dir, workflow_dir, output_dir, tr
     downsample matrices according to fsaverage projections
     """
     if (not use_sample):
-        connect_mat_fs4_nat_left_left = pe.Node(interface=Function(input_names=["index_row_file","index_col_file","matrix_file","out_prefix","dist2sim"], output_names=["out_mat","out_nii"], function=downsample_matrix), name='83_connect_mat_fs4_nat_left_left')
-        connect_mat_fs4_nat_left_left.inputs.out_prefix = subject_ID + '_connect_fs4_nat_left_left'
-        connect_mat_fs4_nat_left_left.inputs.dist2sim = False
-        dmripipeline.connect(fs4_indexlist_left, "out_file", connect_mat_fs4_nat_left_left,"index_row_file")
-        dmripipeline.connect(fs4_indexlist_left, "out_file", connect_mat_fs4_nat_left_left,"index_col_file")
-        dmripipeline.connect(submatrix_left_left, "mat_matrix_nat", connect_mat_fs4_nat_left_left,"matrix_file")
-        
-        connect_mat_fs4_nat_left_right = connect_mat_fs4_nat_left_left.clone(name='83_connect_mat_fs4_nat_left_right')
-        connect_mat_fs4_nat_left_right.inputs.out_prefix = subject_ID + '_connect_fs4_nat_left_right'
-        dmripipeline.connect(fs4_indexlist_left, "out_file", connect_mat_fs4_nat_left_right,"index_row_file")
-        dmripipeline.connect(fs4_indexlist_right, "out_file", connect_mat_fs4_nat_left_right,"index_col_file")
-        dmripipeline.connect(submatrix_left_right, "mat_matrix_nat", connect_mat_fs4_nat_left_right,"matrix_file")
-        
-        connect_mat_fs4_nat_right_left = connect_mat_fs4_nat_left_left.clone(name='83_connect_mat_fs4_nat_right_left')
-        connect_mat_fs4_nat_right_left.inputs.out_prefix = subject_ID + '_connect_fs4_nat_right_left'
-        dmripipeline.connect(fs4_indexlist_right, "out_file", connect_mat_fs4_nat_right_left,"index_row_file")
-        dmripipeline.connect(fs4_indexlist_left, "out_file", connect_mat_fs4_nat_right_left,"index_col_file")
-        dmripipeline.connect(submatrix_right_left, "mat_matrix_nat", connect_mat_fs4_nat_right_left,"matrix_file")
-        
-        connect_mat_fs4_nat_right_right = connect_mat_fs4_nat_left_left.clone(name='83_connect_mat_fs4_nat_right_right')
-        connect_mat_fs4_nat_right_right.inputs.out_prefix = subject_ID + '_connect_fs4_nat_right_right'
-        dmripipeline.connect(fs4_indexlist_right, "out_file", connect_mat_fs4_nat_right_right,"index_row_file")
-        dmripipeline.connect(fs4_indexlist_right, "out_file", connect_mat_fs4_nat_right_right,"index_col_file")
-        dmripipeline.connect(submatrix_right_right, "mat_matrix_nat", connect_mat_fs4_nat_right_right,"matrix_file")
-        
-        connect_mat_fs4_log_left_left = connect_mat_fs4_nat_left_left.clone(name='83_connect_mat_fs4_log_left_left')
-        connect_mat_fs4_log_left_left.inputs.out_prefix = subject_ID + '_connect_fs4_log_left_left'
-        dmripipeline.connect(fs4_indexlist_left, "out_file", connect_mat_fs4_log_left_left,"index_row_file")
-        dmripipeline.connect(fs4_indexlist_left, "out_file", connect_mat_fs4_log_left_left,"index_col_file")
-        dmripipeline.connect(submatrix_left_left, "mat_matrix_log", connect_mat_fs4_log_left_left,"matrix_file")
-        
-        connect_mat_fs4_log_left_right = connect_mat_fs4_log_left_left.clone(name='83_connect_mat_fs4_log_left_right')
-        connect_mat_fs4_log_left_right.inputs.out_prefix = subject_ID + '_connect_fs4_log_left_right'
-        dmripipeline.connect(fs4_indexlist_left, "out_file", connect_mat_fs4_log_left_right,"index_row_file")
-        dmripipeline.connect(fs4_indexlist_right, "out_file", connect_mat_fs4_log_left_right,"index_col_file")
-        dmripipeline.connect(submatrix_left_right, "mat_matrix_log", connect_mat_fs4_log_left_right,"matrix_file")
-        
-        connect_mat_fs4_log_right_left = connect_mat_fs4_log_left_left.clone(name='83_connect_mat_fs4_log_right_left')
-        connect_mat_fs4_log_right_left.inputs.out_prefix = subject_ID + '_connect_fs4_log_right_left'
-        dmripipeline.connect(fs4_indexlist_right, "out_file", connect_mat_fs4_log_right_left,"index_row_file")
-        dmripipeline.connect(fs4_indexlist_left, "out_file", connect_mat_fs4_log_right_left,"index_col_file")
-        dmripipeline.connect(submatrix_right_left, "mat_matrix_log", connect_mat_fs4_log_right_left,"matrix_file")
-        
-        connect_mat_fs4_log_right_right = connect_mat_fs4_log_left_left.clone(name='83_connect_mat_fs4_log_right_right')
-        connect_mat_fs4_log_right_right.inputs.out_prefix = subject_ID + '_connect_fs4_log_right_right'
-        dmripipeline.connect(fs4_indexlist_right, "out_file", connect_mat_fs4_log_right_right,"index_row_file")
-        dmripipeline.connect(fs4_indexlist_right, "out_file", connect_mat_fs4_log_right_right,"index_col_file")
-        dmripipeline.connect(submatrix_right_right, "mat_matrix_log", connect_mat_fs4_log_right_right,"matrix_file")
-        
-#         connect_mat_fs4_nat_full = pe.Node(interface=Function(input_names=["sm_left_left", "sm_left_right","sm_right_left", "sm_right_right", "out_filename"], output_names=["out_file"], function=merge_matrices), name='83_connect_mat_fs4_nat_full')
-#         connect_mat_fs4_nat_full.inputs.out_filename = subject_ID + '_connect_fs4_nat_full.mat'
-#         connect_mat_fs4_nat_full.run_without_submitting = True
-#         dmripipeline.connect(connect_mat_fs4_nat_left_left, "out_nii", connect_mat_fs4_nat_full, "sm_left_left")
-#         dmripipeline.connect(connect_mat_fs4_nat_left_right, "out_nii", connect_mat_fs4_nat_full, "sm_left_right")
-#         dmripipeline.connect(connect_mat_fs4_nat_right_left, "out_nii", connect_mat_fs4_nat_full, "sm_right_left")
-#         dmripipeline.connect(connect_mat_fs4_nat_right_right, "out_nii", connect_mat_fs4_nat_full, "sm_right_right")
-#         
-#         connect_mat_fs4_log_full = connect_mat_fs4_nat_full.clone(name='83_connect_mat_fs4_log_full')
-#         connect_mat_fs4_log_full.inputs.outfile_prefix = subject_ID + '_connect_fs4_log_full.mat'
-#         connect_mat_fs4_log_full.run_without_submitting = True
-#         dmripipeline.connect(connect_mat_fs4_log_left_left, "out_nii", connect_mat_fs4_log_full, "sm_left_left")
-#         dmripipeline.connect(connect_mat_fs4_log_left_right, "out_nii", connect_mat_fs4_log_full, "sm_left_right")
-#         dmripipeline.connect(connect_mat_fs4_log_right_left, "out_nii", connect_mat_fs4_log_full, "sm_right_left")
-#         dmripipeline.connect(connect_mat_fs4_log_right_right, "out_nii", connect_mat_fs4_log_full, "sm_right_right")
-        
+        connect_mat_fs = pe.Node(interface=Function(input_names=["fs4_left","fs4_right","fs5_left","fs5_right","out_template","dist2sim",
+                                                                 "nat_left_left","log_left_left","nat_left_right","log_left_right",
+                                                                 "nat_right_left","log_right_left","nat_right_right","log_right_right"],
+                                                    output_names=["fs4_mat","fs4_nii","fs5_mat","fs5_nii"], function=downsample_matrices), name='83_connect_mat_fs')
+        connect_mat_fs.inputs.out_template = subject_ID + '_connect_%(fs)s_%(norm)s_%(side)s'
+        connect_mat_fs.inputs.dist2sim = False
+        dmripipeline.connect(fs4_indexlist_left, "out_file", connect_mat_fs, "fs4_left")
+        dmripipeline.connect(fs4_indexlist_right, "out_file", connect_mat_fs, "fs4_right")
+        dmripipeline.connect(fs5_indexlist_left, "out_file", connect_mat_fs, "fs5_left")
+        dmripipeline.connect(fs5_indexlist_right, "out_file", connect_mat_fs, "fs5_right")
+        for side, submatrix in [('left_left', submatrix_left_left), ('left_right', submatrix_left_right), ('right_left', submatrix_right_left), ('right_right', submatrix_right_right)]:
+            dmripipeline.connect(submatrix, "mat_matrix_nat", connect_mat_fs, "nat_" + side)
+            dmripipeline.connect(submatrix, "mat_matrix_log", connect_mat_fs, "log_" + side)
 
 
-        connect_mat_fs5_nat_left_left = connect_mat_fs4_nat_left_left.clone(name='83_connect_mat_fs5_nat_left_left')
-        connect_mat_fs5_nat_left_left.inputs.out_prefix = subject_ID + '_connect_fs5_nat_left_left'
-        dmripipeline.connect(fs5_indexlist_left, "out_file", connect_mat_fs5_nat_left_left,"index_row_file")
-        dmripipeline.connect(fs5_indexlist_left, "out_file", connect_mat_fs5_nat_left_left,"index_col_file")
-        dmripipeline.connect(submatrix_left_left, "mat_matrix_nat", connect_mat_fs5_nat_left_left,"matrix_file")
-        
-        connect_mat_fs5_nat_left_right = connect_mat_fs5_nat_left_left.clone(name='83_connect_mat_fs5_nat_left_right')
-        connect_mat_fs5_nat_left_right.inputs.out_prefix = subject_ID + '_connect_fs5_nat_left_right'
-        dmripipeline.connect(fs5_indexlist_left, "out_file", connect_mat_fs5_nat_left_right,"index_row_file")
-        dmripipeline.connect(fs5_indexlist_right, "out_file", connect_mat_fs5_nat_left_right,"index_col_file")
-        dmripipeline.connect(submatrix_left_right, "mat_matrix_nat", connect_mat_fs5_nat_left_right,"matrix_file")
-        
-        connect_mat_fs5_nat_right_left = connect_mat_fs5_nat_left_left.clone(name='83_connect_mat_fs5_nat_right_left')
-        connect_mat_fs5_nat_right_left.inputs.out_prefix = subject_ID + '_connect_fs5_nat_right_left'
-        dmripipeline.connect(fs5_indexlist_right, "out_file", connect_mat_fs5_nat_right_left,"index_row_file")
-        dmripipeline.connect(fs5_indexlist_left, "out_file", connect_mat_fs5_nat_right_left,"index_col_file")
-        dmripipeline.connect(submatrix_right_left, "mat_matrix_nat", connect_mat_fs5_nat_right_left,"matrix_file")
-        
-        connect_mat_fs5_nat_right_right = connect_mat_fs5_nat_left_left.clone(name='83_connect_mat_fs5_nat_right_right')
-        connect_mat_fs5_nat_right_right.inputs.out_prefix = subject_ID + '_connect_fs5_nat_right_right'
-        dmripipeline.connect(fs5_indexlist_right, "out_file", connect_mat_fs5_nat_right_right,"index_row_file")
-        dmripipeline.connect(fs5_indexlist_right, "out_file", connect_mat_fs5_nat_right_right,"index_col_file")
-        dmripipeline.connect(submatrix_right_right, "mat_matrix_nat", connect_mat_fs5_nat_right_right,"matrix_file")
-        
-        connect_mat_fs5_log_left_left = connect_mat_fs5_nat_left_left.clone(name='83_connect_mat_fs5_log_left_left')
-        connect_mat_fs5_log_left_left.inputs.out_prefix = subject_ID + '_connect_fs5_log_left_left'
-        dmripipeline.connect(fs5_indexlist_left, "out_file", connect_mat_fs5_log_left_left,"index_row_file")
-        dmripipeline.connect(fs5_indexlist_left, "out_file", connect_mat_fs5_log_left_left,"index_col_file")
-        dmripipeline.connect(submatrix_left_left, "mat_matrix_log", connect_mat_fs5_log_left_left,"matrix_file")
-        
-        connect_mat_fs5_log_left_right = connect_mat_fs5_log_left_left.clone(name='83_connect_mat_fs5_log_left_right')
-        connect_mat_fs5_log_left_right.inputs.out_prefix = subject_ID + '_connect_fs5_log_left_right'
-        dmripipeline.connect(fs5_indexlist_left, "out_file", connect_mat_fs5_log_left_right,"index_row_file")
-        dmripipeline.connect(fs5_indexlist_right, "out_file", connect_mat_fs5_log_left_right,"index_col_file")
-        dmripipeline.connect(submatrix_left_right, "mat_matrix_log", connect_mat_fs5_log_left_right,"matrix_file")
-        
-        connect_mat_fs5_log_right_left = connect_mat_fs5_log_left_left.clone(name='83_connect_mat_fs5_log_right_left')
-        connect_mat_fs5_log_right_left.inputs.out_prefix = subject_ID + '_connect_fs5_log_right_left'
-        dmripipeline.connect(fs5_indexlist_right, "out_file", connect_mat_fs5_log_right_left,"index_row_file")
-        dmripipeline.connect(fs5_indexlist_left, "out_file", connect_mat_fs5_log_right_left,"index_col_file")
-        dmripipeline.connect(submatrix_right_left, "mat_matrix_log", connect_mat_fs5_log_right_left,"matrix_file")
-        
-        connect_mat_fs5_log_right_right = connect_mat_fs5_log_left_left.clone(name='83_connect_mat_fs5_log_right_right')
-        connect_mat_fs5_log_right_right.inputs.out_prefix = subject_ID + '_connect_fs5_log_right_right'
-        dmripipeline.connect(fs5_indexlist_right, "out_file", connect_mat_fs5_log_right_right,"index_row_file")
-        dmripipeline.connect(fs5_indexlist_right, "out_file", connect_mat_fs5_log_right_right,"index_col_file")
-        dmripipeline.connect(submatrix_right_right, "mat_matrix_log", connect_mat_fs5_log_right_right,"matrix_file")
-        
-#         connect_mat_fs5_nat_full = connect_mat_fs4_nat_full.clone(name='83_connect_mat_fs5_nat_full')
-#         connect_mat_fs5_nat_full.inputs.outfile_prefix = subject_ID + '_connect_fs5_nat_full.mat'
-#         connect_mat_fs5_nat_full.run_without_submitting = True
-#         dmripipeline.connect(connect_mat_fs5_nat_left_left, "out_nii", connect_mat_fs5_nat_full, "sm_left_left")
-#         dmripipeline.connect(connect_mat_fs5_nat_left_right, "out_nii", connect_mat_fs5_nat_full, "sm_left_right")
-#         dmripipeline.connect(connect_mat_fs5_nat_right_left, "out_nii", connect_mat_fs5_nat_full, "sm_right_left")
-#         dmripipeline.connect(connect_mat_fs5_nat_right_right, "out_nii", connect_mat_fs5_nat_full, "sm_right_right")
-#         
-#         connect_mat_fs5_log_full = connect_mat_fs5_nat_full.clone(name='83_connect_mat_fs5_log_full')
-#         connect_mat_fs5_log_full.inputs.out_filename = subject_ID + '_connect_fs5_log_full.mat'
-#         connect_mat_fs5_log_full.run_without_submitting = True
-#         dmripipeline.connect(connect_mat_fs5_log_left_left, "out_nii", connect_mat_fs5_log_full, "sm_left_left")
-#         dmripipeline.connect(connect_mat_fs5_log_left_right, "out_nii", connect_mat_fs5_log_full, "sm_left_right")
-#         dmripipeline.connect(connect_mat_fs5_log_right_left, "out_nii", connect_mat_fs5_log_full, "sm_right_left")
-#         dmripipeline.connect(connect_mat_fs5_log_right_right, "out_nii", connect_mat_fs5_log_full, "sm_right_right")
-#         
-
     """
     use a sink to save outputs
     """
@@ -500,6 +407,10 @@ def do_pipe3_projection(subject_ID, freesurfer_dir, workflow_dir, output_dir, tr
     dmripipeline.connect(fs_indexlist_left, 'out_file', datasink, 'interface_index.@17')
     dmripipeline.connect(fs_indexlist_right, 'out_file', datasink, 'interface_index.@18')
     dmripipeline.connect(tract_exclusion_mask, 'outfile', datasink, 'interface_index.@19')
+    dmripipeline.connect(tract_store_left, 'index_file', datasink, 'compact_tracts.@20')
+    dmripipeline.connect(tract_store_left, 'data_file', datasink, 'compact_tracts.@21')
+    dmripipeline.connect(tract_store_right, 'index_file', datasink, 'compact_tracts.@22')
+    dmripipeline.connect(tract_store_right, 'data_file', datasink, 'compact_tracts.@23')
      
 #    dmripipeline.connect(submatrix_left_left, 'mat_matrix_nat', datasink, 'connect_matrix.native.mat')
 #    dmripipeline.connect(submatrix_left_left, 'mat_matrix_log', datasink, 'connect_matrix.native.mat.@2')
@@ -523,47 +434,8 @@ def do_pipe3_projection(subject_ID, freesurfer_dir, workflow_dir, output_dir, tr
 
     
     if (not use_sample):
-#        dmripipeline.connect(connect_mat_fs4_nat_left_left, 'out_mat', datasink, 'connect_matrix.fs4.mat.@1')
-#        dmripipeline.connect(connect_mat_fs4_log_left_left, 'out_mat', datasink, 'connect_matrix.fs4.mat.@2')
-#        dmripipeline.connect(connect_mat_fs4_nat_right_right, 'out_mat', datasink, 'connect_matrix.fs4.mat.@3')
-#        dmripipeline.connect(connect_mat_fs4_log_right_right, 'out_mat', datasink, 'connect_matrix.fs4.mat.@4')
-#        dmripipeline.connect(connect_mat_fs4_nat_left_right, 'out_mat', datasink, 'connect_matrix.fs4.mat.@5')
-#        dmripipeline.connect(connect_mat_fs4_log_left_right, 'out_mat', datasink, 'connect_matrix.fs4.mat.@6')
-#        dmripipeline.connect(connect_mat_fs4_nat_right_left, 'out_mat', datasink, 'connect_matrix.fs4.mat.@7')
-#        dmripipeline.connect(connect_mat_fs4_log_right_left, 'out_mat', datasink, 'connect_matrix.fs4.mat.@8')
-        
-        dmripipeline.connect(connect_mat_fs4_nat_left_left, 'out_nii', datasink, 'connect_matrix.fs4.@1')
-        dmripipeline.connect(connect_mat_fs4_log_left_left, 'out_nii', datasink, 'connect_matrix.fs4.@2')
-        dmripipeline.connect(connect_mat_fs4_nat_right_right, 'out_nii', datasink, 'connect_matrix.fs4.@3')
-        dmripipeline.connect(connect_mat_fs4_log_right_right, 'out_nii', datasink, 'connect_matrix.fs4.@4')
-        dmripipeline.connect(connect_mat_fs4_nat_left_right, 'out_nii', datasink, 'connect_matrix.fs4.@5')
-        dmripipeline.connect(connect_mat_fs4_log_left_right, 'out_nii', datasink, 'connect_matrix.fs4.@6')
-        dmripipeline.connect(connect_mat_fs4_nat_right_left, 'out_nii', datasink, 'connect_matrix.fs4.@7')
-        dmripipeline.connect(connect_mat_fs4_log_right_left, 'out_nii', datasink, 'connect_matrix.fs4.@8')
-
-#         dmripipeline.connect(connect_mat_fs4_nat_full, 'out_file', datasink, 'connect_matrix.@28')
-#         dmripipeline.connect(connect_mat_fs4_log_full, 'out_file', datasink, 'connect_matrix.@30')        
-        
-#        dmripipeline.connect(connect_mat_fs5_nat_left_left, 'out_mat', datasink, 'connect_matrix.fs5.mat.@1')
-#        dmripipeline.connect(connect_mat_fs5_log_left_left, 'out_mat', datasink, 'connect_matrix.fs5.mat.@2')
-#        dmripipeline.connect(connect_mat_fs5_nat_right_right, 'out_mat', datasink, 'connect_matrix.fs5.mat.@3')
-#        dmripipeline.connect(connect_mat_fs5_log_right_right, 'out_mat', datasink, 'connect_matrix.fs5.mat.@4')
-#        dmripipeline.connect(connect_mat_fs5_nat_left_right, 'out_mat', datasink, 'connect_matrix.fs5.mat.@5')
-#        dmripipeline.connect(connect_mat_fs5_log_left_right, 'out_mat', datasink, 'connect_matrix.fs5.mat.@6')
-#        dmripipeline.connect(connect_mat_fs5_nat_right_left, 'out_mat', datasink, 'connect_matrix.fs5.mat.@7')
-#        dmripipeline.connect(connect_mat_fs5_log_right_left, 'out_mat', datasink, 'connect_matrix.fs5.mat.@8')
-        
-        dmripipeline.connect(connect_mat_fs5_nat_left_left, 'out_nii', datasink, 'connect_matrix.fs5.@1')     
-        dmripipeline.connect(connect_mat_fs5_log_left_left, 'out_nii', datasink, 'connect_matrix.fs5.@2')
-        dmripipeline.connect(connect_mat_fs5_nat_right_right, 'out_nii', datasink, 'connect_matrix.fs5.@3')
-        dmripipeline.connect(connect_mat_fs5_log_right_right, 'out_nii', datasink, 'connect_matrix.fs5.@4')
-        dmripipeline.connect(connect_mat_fs5_nat_left_right, 'out_nii', datasink, 'connect_matrix.fs5.@5')     
-        dmripipeline.connect(connect_mat_fs5_log_left_right, 'out_nii', datasink, 'connect_matrix.fs5.@6')
-        dmripipeline.connect(connect_mat_fs5_nat_right_left, 'out_nii', datasink, 'connect_matrix.fs5.@7')
-        dmripipeline.connect(connect_mat_fs5_log_right_left, 'out_nii', datasink, 'connect_matrix.fs5.@8')
-
-#         dmripipeline.connect(connect_mat_fs5_nat_full, 'out_file', datasink, 'connect_matrix.@40')
-#         dmripipeline.connect(connect_mat_fs5_log_full, 'out_file', datasink, 'connect_matrix.@42')
+        dmripipeline.connect(connect_mat_fs, 'fs4_nii', datasink, 'connect_matrix.fs4')
+        dmripipeline.connect(connect_mat_fs, 'fs5_nii', datasink, 'connect_matrix.fs5')
     
     
 
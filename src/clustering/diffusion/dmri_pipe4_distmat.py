@@ -5,7 +5,7 @@ Created on Oct 17, 2013
 '''
 
 
-def do_pipe4_distmat(subject_ID, workflow_dir, output_dir, tract_number, is_left, use_sample=False):
+def do_pipe4_distmat(subject_ID, workflow_dir, output_dir, tract_number, is_left, use_sample=False, memory_mb=6144, n_threads=4):
 
     
     """
@@ -19,13 +19,13 @@ def do_pipe4_distmat(subject_ID, workflow_dir, output_dir, tract_number, is_left
     import nipype.interfaces.utility as util  # utility
     import nipype.pipeline.engine as pe  # pipeline engine
     import nipype.interfaces.fsl as fsl
-    import nipype.interfaces.vista as vista
     import os.path as op  # system functions
     import numpy as np
        
     from nipype.interfaces.utility import Function
-    from my_custom_interfaces import DistMatrix
-    from dmri_pipe_aux import downsample_matrix
+    from dmri_tract_store import hemisphere_distance_matrices
+    from dmri_pipe_aux import downsample_matrices
+    from dmri_pipe_aux import native_distance_matrices
     from dmri_pipe_aux import merge_matrices
 
 
@@ -51,11 +51,16 @@ def do_pipe4_distmat(subject_ID, workflow_dir, output_dir, tract_number, is_left
     """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
     data_template = subject_ID + "/%s/" + "%s" + "%s"
     
-    info = dict(roi = [['compact_tracts', subject_ID, '_'+ side_string + '.txt']],
-                fs4_index = [['interface_index', subject_ID, '_seed_index_fs4_' + side_string +'.txt']],
+    info = dict(fs4_index = [['interface_index', subject_ID, '_seed_index_fs4_' + side_string +'.txt']],
                 fs5_index = [['interface_index', subject_ID, '_seed_index_fs5_' + side_string +'.txt']],
                 full_index = [['interface_index', subject_ID, '_seed_index_fsnative_' + side_string +'.txt']])
     
+    # the left run computes the distances of both hemispheres and between them from one read of each tract store,
+    # the right run and pipe 5 take their native matrices from the datasink, so they have to run after the left run
+    if (is_left):
+        info['tract_store_left'] = [['compact_tracts', subject_ID, '_left_index.npz']]
+        info['tract_store_right'] = [['compact_tracts', subject_ID, '_right_index.npz']]
+    
     
     datasource = pe.Node(interface=io.DataGrabber(outfields=info.keys()), name='datasource')
     datasource.inputs.template = data_template
@@ -64,10 +69,7 @@ def do_pipe4_distmat(subject_ID, workflow_dir, output_dir, tract_number, is_left
     datasource.inputs.sort_filelist = True
     datasource.run_without_submitting = True
     
-    inputnode = pe.Node(interface=util.IdentityInterface(fields=["roi", "fs4_index", "fs5_index"]), name="inputnode")
-    
-    tract_dir_nat = output_dir + "/" + subject_ID + "/compact_tracts/nat/" + hemi_string
-    tract_dir_log = output_dir + "/" + subject_ID + "/compact_tracts/log/" + hemi_string
+    inputnode = pe.Node(interface=util.IdentityInterface(fields=info.keys()), name="inputnode")
     
     thres_nat = 0.001
     thres_log = np.emath.log10(tract_number*thres_nat) / np.emath.log10(tract_number)
@@ -79,64 +81,42 @@ def do_pipe4_distmat(subject_ID, workflow_dir, output_dir, tract_number, is_left
     compute the full distance matrices
     """
     
-    full_distmat_nat = pe.Node(interface=DistMatrix(), name='85_full_distmat_nat')
-    full_distmat_nat.inputs.tract_dir = tract_dir_nat
-    full_distmat_nat.inputs.memory = 6
-    full_distmat_nat.inputs.threshold = thres_nat
-    full_distmat_nat.inputs.out_file = subject_ID + '_full_distmat_nat_' + side_string + '.v'
-    full_distmat_nat.run_without_submitting = True
-#    full_distmat_nat.plugin_args={'override_specs': 'requirements = Machine == "kalifornien.cbs.mpg.de"'}
-    dmripipeline.connect(inputnode, "roi", full_distmat_nat,"roi_file")
-    
-    full_distmat_log = pe.Node(interface=DistMatrix(), name='85_full_distmat_log')
-    full_distmat_log.inputs.tract_dir = tract_dir_log
-    full_distmat_log.inputs.memory = 6
-    full_distmat_log.inputs.threshold = thres_log
-    full_distmat_log.inputs.out_file = subject_ID + '_full_distmat_log_' + side_string  + '.v'
-    full_distmat_log.run_without_submitting = True
-    dmripipeline.connect(inputnode, "roi", full_distmat_log,"roi_file")
-    
-    """
-    transform matrices to .mat format
-    """
-    
-    mat_distmat_nat = pe.Node(interface=vista.VtoMat(), name='86_mat_distmat_nat')
-    #mat_distmat_nat.run_without_submitting = True
-    dmripipeline.connect(full_distmat_nat, "out_file", mat_distmat_nat,"in_file")
-    
-    mat_distmat_log = pe.Node(interface=vista.VtoMat(), name='86_mat_distmat_log')
-    #mat_distmat_log.run_without_submitting = True
-    dmripipeline.connect(full_distmat_log, "out_file", mat_distmat_log,"in_file")
+    if (is_left):
+        full_distmat = pe.Node(interface=Function(input_names=["index_left","index_right","out_template","thres_nat","thres_log","memory_mb","n_threads"],
+                                                  output_names=["nat_left","nat_right","nat_left_right","log_left","log_right","log_left_right","npy_files"],
+                                                  function=hemisphere_distance_matrices), name='85_full_distmat')
+        full_distmat.inputs.out_template = subject_ID + '_full_distmat_%s_%s'
+        full_distmat.inputs.thres_nat = thres_nat
+        full_distmat.inputs.thres_log = thres_log
+        full_distmat.inputs.memory_mb = memory_mb # nat and log tiles of one read of the stores, within this budget
+        full_distmat.inputs.n_threads = n_threads
+        full_distmat.run_without_submitting = True
+        dmripipeline.connect(inputnode, "tract_store_left", full_distmat,"index_left")
+        dmripipeline.connect(inputnode, "tract_store_right", full_distmat,"index_right")
+        distmat_nat = (full_distmat, "nat_left")
+        distmat_log = (full_distmat, "log_left")
+    else:
+        native_distmat = pe.Node(interface=Function(input_names=["output_dir","subject_ID","side"], output_names=["nat","log"],
+                                                    function=native_distance_matrices), name='85_native_distmat')
+        native_distmat.inputs.output_dir = output_dir
+        native_distmat.inputs.subject_ID = subject_ID
+        native_distmat.inputs.side = side_string
+        native_distmat.run_without_submitting = True
+        distmat_nat = (native_distmat, "nat")
+        distmat_log = (native_distmat, "log")
     
     """
     downsample matrices according to fsaverage projections
     """
     if (not use_sample):
-        sim_mat_fs4_nat = pe.Node(interface=Function(input_names=["index_row_file","index_col_file","matrix_file","out_prefix","dist2sim","transpose"], output_names=["out_mat","out_nii"], function=downsample_matrix), name='87_sim_mat_fs4_nat')
-        sim_mat_fs4_nat.inputs.out_prefix = subject_ID + '_simmat_fs4_nat_' + side_string
-        sim_mat_fs4_nat.inputs.dist2sim = True
-        sim_mat_fs4_nat.inputs.transpose = True
-        dmripipeline.connect(inputnode, "fs4_index", sim_mat_fs4_nat,"index_row_file")
-        dmripipeline.connect(inputnode, "fs4_index", sim_mat_fs4_nat,"index_col_file")
-        dmripipeline.connect(mat_distmat_nat, "out_file", sim_mat_fs4_nat,"matrix_file")
-    
-        sim_mat_fs4_log = sim_mat_fs4_nat.clone(name='87_sim_mat_fs4_log')
-        sim_mat_fs4_log.inputs.out_prefix = subject_ID + '_simmat_fs4_log_' + side_string 
-        dmripipeline.connect(inputnode, "fs4_index", sim_mat_fs4_log,"index_row_file")
-        dmripipeline.connect(inputnode, "fs4_index", sim_mat_fs4_log,"index_col_file")
-        dmripipeline.connect(mat_distmat_log, "out_file", sim_mat_fs4_log,"matrix_file")
-        
-        sim_mat_fs5_nat = sim_mat_fs4_nat.clone( name='88_sim_mat_fs5_nat')
-        sim_mat_fs5_nat.inputs.out_prefix = subject_ID + '_simmat_fs5_nat_' + side_string 
-        dmripipeline.connect(inputnode, "fs5_index", sim_mat_fs5_nat,"index_row_file")
-        dmripipeline.connect(inputnode, "fs5_index", sim_mat_fs5_nat,"index_col_file")
-        dmripipeline.connect(mat_distmat_nat, "out_file", sim_mat_fs5_nat,"matrix_file")
-    
-        sim_mat_fs5_log = sim_mat_fs5_nat.clone(  name='88_sim_mat_fs5_log')
-        sim_mat_fs5_log.inputs.out_prefix = subject_ID + '_simmat_fs5_log_' + side_string
-        dmripipeline.connect(inputnode, "fs5_index", sim_mat_fs5_log,"index_row_file")
-        dmripipeline.connect(inputnode, "fs5_index", sim_mat_fs5_log,"index_col_file")
-        dmripipeline.connect(mat_distmat_log, "out_file", sim_mat_fs5_log,"matrix_file")
+        sim_mat_fs = pe.Node(interface=Function(input_names=["fs4_" + side_string,"fs5_" + side_string,"out_template","dist2sim","nat_" + side_string + "_" + side_string,"log_" + side_string + "_" + side_string],
+                                                output_names=["fs4_mat","fs4_nii","fs5_mat","fs5_nii"], function=downsample_matrices), name='87_sim_mat_fs')
+        sim_mat_fs.inputs.out_template = subject_ID + '_simmat_%(fs)s_%(norm)s_' + side_string
+        sim_mat_fs.inputs.dist2sim = True
+        dmripipeline.connect(inputnode, "fs4_index", sim_mat_fs, "fs4_" + side_string)
+        dmripipeline.connect(inputnode, "fs5_index", sim_mat_fs, "fs5_" + side_string)
+        dmripipeline.connect(distmat_nat[0], distmat_nat[1], sim_mat_fs, "nat_" + side_string + "_" + side_string)
+        dmripipeline.connect(distmat_log[0], distmat_log[1], sim_mat_fs, "log_" + side_string + "_" + side_string)
 
     
     """
@@ -149,18 +129,20 @@ def do_pipe4_distmat(subject_ID, workflow_dir, output_dir, tract_number, is_left
     datasink.inputs.parameterization = True
     #datasink.run_without_submitting = True
      
-    dmripipeline.connect(mat_distmat_nat, 'out_file', datasink, 'similarity_matrix.native')
-    dmripipeline.connect(mat_distmat_log, 'out_file', datasink, 'similarity_matrix.native.@1')
+    if (is_left):
+        dmripipeline.connect(full_distmat, 'nat_left', datasink, 'similarity_matrix.native')
+        dmripipeline.connect(full_distmat, 'log_left', datasink, 'similarity_matrix.native.@1')
+        dmripipeline.connect(full_distmat, 'nat_right', datasink, 'similarity_matrix.native.@10')
+        dmripipeline.connect(full_distmat, 'log_right', datasink, 'similarity_matrix.native.@11')
+        dmripipeline.connect(full_distmat, 'nat_left_right', datasink, 'similarity_matrix.native.@12')
+        dmripipeline.connect(full_distmat, 'log_left_right', datasink, 'similarity_matrix.native.@13')
+        dmripipeline.connect(full_distmat, 'npy_files', datasink, 'similarity_matrix.native.@8')
     
     if (not use_sample):
-        dmripipeline.connect(sim_mat_fs4_nat, 'out_nii', datasink, 'similarity_matrix.fs4.@2')
-        dmripipeline.connect(sim_mat_fs4_log, 'out_nii', datasink, 'similarity_matrix.fs4.@4')
-        dmripipeline.connect(sim_mat_fs5_nat, 'out_nii', datasink, 'similarity_matrix.fs5.@5')
-        dmripipeline.connect(sim_mat_fs5_log, 'out_nii', datasink, 'similarity_matrix.fs5.@7')
-#         dmripipeline.connect(sim_mat_fs4_nat, 'out_mat', datasink, 'similarity_matrix.fs4.mat.@2')
-#         dmripipeline.connect(sim_mat_fs4_log, 'out_mat', datasink, 'similarity_matrix.fs4.mat.@3')
-#         dmripipeline.connect(sim_mat_fs5_nat, 'out_mat', datasink, 'similarity_matrix.fs5.mat.@5')
-#         dmripipeline.connect(sim_mat_fs5_log, 'out_mat', datasink, 'similarity_matrix.fs5.mat.@6')
+        dmripipeline.connect(sim_mat_fs, 'fs4_nii', datasink, 'similarity_matrix.fs4')
+        dmripipeline.connect(sim_mat_fs, 'fs5_nii', datasink, 'similarity_matrix.fs5')
+#         dmripipeline.connect(sim_mat_fs, 'fs4_mat', datasink, 'similarity_matrix.fs4.mat')
+#         dmripipeline.connect(sim_mat_fs, 'fs5_mat', datasink, 'similarity_matrix.fs5.mat')
    
     
     
@@ -182,7 +164,7 @@ def do_pipe4_distmat(subject_ID, workflow_dir, output_dir, tract_number, is_left
     connectprepro = pe.Workflow(name="dmri_pipe4_distmat_" + hemi_string)
     
     connectprepro.base_dir = op.abspath(workflow_dir + "/workflow_"+subject_ID )
-    connectprepro.connect([(datasource, dmripipeline, [('roi', 'inputnode.roi'),('fs4_index', 'inputnode.fs4_index'),('fs5_index', 'inputnode.fs5_index')])])
+    connectprepro.connect([(datasource, dmripipeline, [(field, 'inputnode.' + field) for field in info.keys()])])
 
     return connectprepro
 
@@ -181,70 +181,94 @@ def voxels2nii(voxel_list, ref_image, outfile):
 
 
 
+"""
+read the values of one visitation map at a set of flat (fortran order) voxel indices, keeping only the non-zero ones
+"""
+def get_tract_values(args):
+    import nibabel
+    import numpy as np
+    in_seed_tract, flat_indices = args
+    data = nibabel.load(in_seed_tract).get_data()
+    values = np.reshape(data, -1, order='F')[flat_indices] #a view for uncompressed niftis, one fancy-index per tract
+    nonzero = np.flatnonzero(values)
+    return nonzero, values[nonzero]
+
+
+"""
+direct connectivity of the seeds of one hemisphere from their (non-zero seed voxel columns, values) per tract, columns
+ordered as this then the opposite hemisphere. seeds whose own voxel is visited less than max_value times keep an empty
+row and go to the exclusion list
+"""
+def connectivity_submatrix(tract_values, tract_dim, this_voxel_list, seed_dim_opposite, max_value):
+    import numpy as np
+    from scipy.sparse import csr_matrix
+
+    seed_dim_this=len(this_voxel_list)
+    exclusion_list = []
+    rows_this, cols_this, values_this = [], [], []
+    rows_opposite, cols_opposite, values_opposite = [], [], []
+    
+    for i, (nonzero, values) in enumerate(tract_values):
+        # check if diagonal elements are lower than max_value (5000), if so, leave the row empty
+        if (i < seed_dim_this):
+            diagonal = values[nonzero == i]
+            diagonal = diagonal[0] if len(diagonal) else 0
+            if( diagonal < max_value ):
+                exclusion_list.append(this_voxel_list[i])
+                continue
+        this = nonzero < seed_dim_this
+        rows_this.append(np.repeat(i, np.count_nonzero(this)))
+        cols_this.append(nonzero[this])
+        values_this.append(values[this])
+        rows_opposite.append(np.repeat(i, len(nonzero)-np.count_nonzero(this)))
+        cols_opposite.append(nonzero[~this]-seed_dim_this)
+        values_opposite.append(values[~this])
+    
+    def buffers2csr(rows, cols, values, seed_dim):
+        if (len(rows) == 0):
+            return csr_matrix((tract_dim,seed_dim))
+        return csr_matrix((np.concatenate(values).astype(np.float64), (np.concatenate(rows), np.concatenate(cols))), shape=(tract_dim,seed_dim))
+    
+    return buffers2csr(rows_this, cols_this, values_this, seed_dim_this), buffers2csr(rows_opposite, cols_opposite, values_opposite, seed_dim_opposite), exclusion_list
+
+
 """
 read a list of visitation maps and create a direct connectivity matrix
 """
-def get_connectivity_matrix(tract_list_left, tract_list_right, voxel_list_left, voxel_list_right, max_value):
+def get_connectivity_matrix(tract_list_left, tract_list_right, voxel_list_left, voxel_list_right, max_value, n_procs=1):
     
-    def get_connectivity_submatrix(tract_list,this_voxel_list,opposite_voxel_list,max_value):
-        
-        def get_seed_connectivities(in_seed_tract,seedvoxel_list):
-            import nibabel
-            import numpy as np
-                        
-            tract_nii = nibabel.load(in_seed_tract)
-            
-            data = tract_nii.get_data()
-            out_seed_connectivities=np.zeros(len(seedvoxel_list))
-            index=0
-            
-            for x, y, z in seedvoxel_list:
-                out_seed_connectivities[index]=data[x,y,z]
-                index += 1
-                                 
-            return out_seed_connectivities
+    def get_connectivity_submatrix(tract_list,this_voxel_list,opposite_voxel_list,max_value,n_procs):
         
+        import nibabel
         import numpy as np
-        from scipy.sparse import csr_matrix
+        from multiprocessing import Pool
+        from dmri_pipe_aux import get_tract_values
+        from dmri_pipe_aux import connectivity_submatrix
         
-        seed_dim_this=len(this_voxel_list)
-        seed_dim_opposite=len(opposite_voxel_list)
-        tract_dim=len(tract_list)
+        # flat indices of this and the opposite hemisphere seeds, computed once for all tracts
+        tract_shape = nibabel.load(tract_list[0]).shape[:3]
+        seed_coords = np.array(list(this_voxel_list) + list(opposite_voxel_list), dtype=np.int64).reshape(-1,3)
+        flat_indices = np.ravel_multi_index(tuple(seed_coords.T), tract_shape, order='F')
         
-        zeroline_this = np.zeros((1,seed_dim_this))
-        zeroline_opposite = np.zeros((1,seed_dim_opposite))
+        jobs = [(tract, flat_indices) for tract in tract_list]
+        if (n_procs > 1):
+            pool = Pool(n_procs)
+            tract_values = pool.imap(get_tract_values, jobs, chunksize=16)
+        else:
+            pool = None
+            tract_values = (get_tract_values(job) for job in jobs)
         
-        exclusion_list = []
-        exclusion_indexes = []
-                
-        submatrix_this=np.zeros((tract_dim,seed_dim_this))
-        for i in xrange(tract_dim):
-            submatrix_this[i]=get_seed_connectivities(tract_list[i],this_voxel_list)
-        # check if diagonal elements are lower than 5000, if so, set to 0
-        for i in xrange(seed_dim_this):
-            if( submatrix_this[i,i] < max_value ):
-                submatrix_this[i] = zeroline_this
-                exclusion_indexes.append(i)
-                exclusion_list.append(this_voxel_list[i])
-
-        sparse_this = csr_matrix(submatrix_this)
-        del(submatrix_this)
-                           
-        submatrix_opposite=np.zeros((tract_dim,seed_dim_opposite))
-        for i in xrange(tract_dim):
-            submatrix_opposite[i]=get_seed_connectivities(tract_list[i],opposite_voxel_list)
-            
-        for i in exclusion_indexes:
-            submatrix_opposite[i] = zeroline_opposite
-            
-        sparse_opposite = csr_matrix(submatrix_opposite)
-        del(submatrix_opposite)
+        sparse_this, sparse_opposite, exclusion_list = connectivity_submatrix(tract_values, len(tract_list), this_voxel_list, len(opposite_voxel_list), max_value)
+        
+        if (pool is not None):
+            pool.close()
+            pool.join()
                         
         return sparse_this, sparse_opposite, exclusion_list
             
-    submatrix_left_left, submatrix_left_right, exclusion_left= get_connectivity_submatrix(tract_list_left, voxel_list_left, voxel_list_right, max_value)
+    submatrix_left_left, submatrix_left_right, exclusion_left= get_connectivity_submatrix(tract_list_left, voxel_list_left, voxel_list_right, max_value, n_procs)
     
-    submatrix_right_right, submatrix_right_left, exclusion_right = get_connectivity_submatrix(tract_list_right, voxel_list_right, voxel_list_left, max_value)
+    submatrix_right_right, submatrix_right_left, exclusion_right = get_connectivity_submatrix(tract_list_right, voxel_list_right, voxel_list_left, max_value, n_procs)
     
     exclusion_list = []
     exclusion_list.extend(exclusion_left)
@@ -412,67 +436,133 @@ def write_sequence_file(file_list,out_file):
 
 
 """
-downsamples and reorders matrix to the entries indicated by an index file 
+sparse (fsaverage vertices x seeds) downsampling operator of an index file (1-based seed per vertex, 0 for none):
+row i averages the seeds vertex i is mapped to, rows of vertices without seed are empty
 """
+def downsampling_operator(index_file, n_seeds):
+    import numpy as np
+    import scipy.sparse as sp
+    indices = np.atleast_1d(np.loadtxt(index_file, dtype=np.int64))
+    rows = np.flatnonzero(indices)
+    operator = sp.csr_matrix((np.ones(len(rows)), (rows, indices[rows]-1)), shape=(len(indices), n_seeds))
+    counts = np.asarray(operator.sum(axis=1)).ravel()
+    counts[counts==0] = 1
+    return sp.diags(1/counts).dot(operator).tocsr()
 
-def downsample_matrix(index_row_file, index_col_file, matrix_file, out_prefix, dist2sim=True, transpose=False ):
 
+"""
+row_operator . matrix . col_operator^T as two sparse products; with dist2sim distances become similarities 1-d,
+entries of vertices without seed stay 0
+"""
+def project_matrix(matrix, row_operator, col_operator, dist2sim=False):
+    import numpy as np
+    projected = np.asarray(col_operator.dot(np.asarray(row_operator.dot(matrix)).T)).T
+    if(dist2sim):
+        projected = np.outer(np.asarray(row_operator.sum(axis=1)).ravel(), np.asarray(col_operator.sum(axis=1)).ravel()) - projected
+    return projected
+
+
+"""
+save a downsampled matrix as .mat and .nii
+"""
+def save_matrix(matrix, out_prefix):
     import numpy as np
     import os.path as op
     import nibabel as nb
     from scipy.io import savemat
-    from scipy.io import loadmat
-    import sys
-    
-    row_indices = np.loadtxt(index_row_file, dtype=long)
-    col_indices = np.loadtxt(index_col_file, dtype=long)
-
-    d_row=len(row_indices)
-    d_col=len(col_indices)
-    
-    print "indices row: ", d_row, ". indices col ", d_col
-    print "max row: ", max(row_indices), ". max col ", max(col_indices)
-
-    matrix_struct = loadmat(matrix_file)
-    
-    if(transpose):
-        dist_matrix=np.transpose(matrix_struct['obj0'])
-    else:
-        dist_matrix=matrix_struct['obj0']
 
-    print "matrix shape: ", np.shape(dist_matrix), ". first 5x5: "
-    print dist_matrix[0:5,0:5]
-    
-    sim_matrix = np.zeros((d_row,d_col))
-    
-    sys.stdout.flush()
-    
-    for i in xrange(d_row):
-        if(row_indices[i]==0):
-            sim_matrix[i] = np.zeros((1,d_col))
-        else:
-            for j in xrange(d_col):
-                if(col_indices[j]==0):
-                    sim_matrix[i,j]=0
-                else:
-                    if(dist2sim):
-                        sim_matrix[i,j]= 1-(dist_matrix[row_indices[i]-1,col_indices[j]-1])
-                    else:
-                        sim_matrix[i,j]= (dist_matrix[row_indices[i]-1,col_indices[j]-1])
-                        
     out_mat = out_prefix + '.mat'
-    savemat(out_mat, { 'obj0': sim_matrix})
+    savemat(out_mat, { 'obj0': matrix})
     
     out_nii = out_prefix + '.nii'
     niiheader = nb.nifti1.Nifti1Header()
     niiaffine = np.identity(4)
     niiaffine[3,3]=0
-    nifti_image = nb.Nifti1Image(sim_matrix, niiaffine, niiheader)
+    nifti_image = nb.Nifti1Image(matrix, niiaffine, niiheader)
     nb.save(nifti_image, out_nii)
     
     return op.abspath(out_mat), op.abspath(out_nii)
 
 
+"""
+downsamples and reorders matrix to the entries indicated by an index file 
+"""
+
+def downsample_matrix(index_row_file, index_col_file, matrix_file, out_prefix, dist2sim=True, transpose=False ):
+
+    import numpy as np
+    from scipy.io import loadmat
+    from dmri_pipe_aux import downsampling_operator
+    from dmri_pipe_aux import project_matrix
+    from dmri_pipe_aux import save_matrix
+    
+    dist_matrix = loadmat(matrix_file)['obj0']
+    if(transpose):
+        dist_matrix = np.transpose(dist_matrix)
+
+    sim_matrix = project_matrix(dist_matrix, downsampling_operator(index_row_file, dist_matrix.shape[0]),
+                                downsampling_operator(index_col_file, dist_matrix.shape[1]), dist2sim)
+    return save_matrix(sim_matrix, out_prefix)
+
+
+"""
+native nat and log distance matrices of one hemisphere block from the datasink. the left run of pipe 4 computes the
+blocks of both hemispheres, so the right run of pipe 4 and pipe 5 have to run after it
+"""
+def native_distance_matrices(output_dir, subject_ID, side):
+    import os.path as op
+    matrix_files = []
+    for norm in ['nat', 'log']:
+        matrix_file = op.join(output_dir, subject_ID, 'similarity_matrix', 'native', subject_ID + '_full_distmat_' + norm + '_' + side + '.mat')
+        if (not op.exists(matrix_file)):
+            raise IOError(matrix_file + ' not found: run the left hemisphere of pipe 4 first, it writes the native distance matrices of both hemispheres')
+        matrix_files.append(matrix_file)
+    return matrix_files[0], matrix_files[1]
+
+
+"""
+downsamples the nat and log matrices of every given hemisphere block to fsaverage4 and fsaverage5: each source matrix
+is loaded once and each (resolution, hemisphere) operator built once. only the index files of the hemispheres of the
+given blocks are needed. outputs are named out_template % {norm, fs, side}, e.g. subject_connect_%(fs)s_%(norm)s_%(side)s
+"""
+
+def downsample_matrices(out_template, fs4_left=None, fs4_right=None, fs5_left=None, fs5_right=None, dist2sim=True, transpose=False,
+                        nat_left_left=None, log_left_left=None, nat_left_right=None, log_left_right=None,
+                        nat_right_left=None, log_right_left=None, nat_right_right=None, log_right_right=None):
+
+    import numpy as np
+    from scipy.io import loadmat
+    from dmri_pipe_aux import downsampling_operator
+    from dmri_pipe_aux import project_matrix
+    from dmri_pipe_aux import save_matrix
+
+    index_files = {('fs4', 'left'): fs4_left, ('fs4', 'right'): fs4_right, ('fs5', 'left'): fs5_left, ('fs5', 'right'): fs5_right}
+    sources = [('nat', 'left_left', nat_left_left), ('log', 'left_left', log_left_left), ('nat', 'left_right', nat_left_right), ('log', 'left_right', log_left_right),
+               ('nat', 'right_left', nat_right_left), ('log', 'right_left', log_right_left), ('nat', 'right_right', nat_right_right), ('log', 'right_right', log_right_right)]
+    operators = {}
+    outputs = dict(fs4_mat=[], fs4_nii=[], fs5_mat=[], fs5_nii=[])
+    for norm, side, matrix_file in sources:
+        if (matrix_file is None):
+            continue
+        matrix = loadmat(matrix_file)['obj0']
+        if(transpose):
+            matrix = np.transpose(matrix)
+        row_hemi, col_hemi = side.split('_')
+        for fs in ['fs4', 'fs5']:
+            for hemi, n_seeds in [(row_hemi, matrix.shape[0]), (col_hemi, matrix.shape[1])]:
+                if ((fs, hemi) not in operators):
+                    if (index_files[(fs, hemi)] is None):
+                        raise ValueError('%s_%s index file needed to downsample the %s_%s matrix' % (fs, hemi, norm, side))
+                    operators[(fs, hemi)] = downsampling_operator(index_files[(fs, hemi)], n_seeds)
+            projected = project_matrix(matrix, operators[(fs, row_hemi)], operators[(fs, col_hemi)], dist2sim)
+            out_mat, out_nii = save_matrix(projected, out_template % dict(norm=norm, fs=fs, side=side))
+            outputs[fs + '_mat'].append(out_mat)
+            outputs[fs + '_nii'].append(out_nii)
+        del matrix
+    
+    return outputs['fs4_mat'], outputs['fs4_nii'], outputs['fs5_mat'], outputs['fs5_nii']
+
+
 
 def merge_matrices(sm_left_left, sm_left_right, sm_right_left, sm_right_right, out_filename, save_as_nii=False ):
 
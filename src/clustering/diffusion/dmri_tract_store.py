@@ -0,0 +1,364 @@
+'''
+Created on Oct 17, 2013
+
+@author: moreno
+'''
+
+"""
+Packed compact tract store: the visitation maps of all seeds, restricted to a mask, in one file of
+zlib-compressed chunks (seeds x mask voxels, float32) plus an index (<prefix>_index.npz) with the chunk
+offsets in the file, the seed ids, the mask voxels and the sparse visits of the seed voxels of both
+hemispheres (the direct connectivity, read in the same pass). Replaces the per-seed compact_tracts/{nat,log}/*.v
+files written by full2compacttract; nat and log normalizations are computed when reading.
+"""
+
+
+import zlib
+import numpy as np
+
+
+"""
+read one visitation map at the flat (fortran order) mask voxel indices
+"""
+def read_compact_tract(args):
+    import nibabel
+    import numpy as np
+    in_tract, flat_indices = args
+    data = nibabel.load(in_tract).get_data()
+    return np.asarray(np.reshape(data, -1, order='F')[flat_indices], dtype=np.float32)
+
+
+"""
+pack a list of visitation maps (sorted as the seeds) into one chunked, compressed tract store. with the seed voxels
+of this and the opposite hemisphere, their visits are kept in the index for the direct connectivity matrix
+"""
+def pack_tracts(tract_list, mask_file, out_prefix, tract_number, chunk_size=64, n_procs=1, voxel_list=None, opposite_voxel_list=None):
+    import os
+    import re
+    import zlib
+    import nibabel
+    import numpy as np
+    from multiprocessing import Pool
+    from dmri_tract_store import read_compact_tract
+
+    mask = nibabel.load(mask_file).get_data()
+    flat_indices = np.flatnonzero(np.reshape(mask, -1, order='F'))
+    n_voxels = len(flat_indices)
+    seed_voxels = np.zeros(0, dtype=np.int64)
+    if (voxel_list is not None):
+        seed_coords = np.array(list(voxel_list) + list(opposite_voxel_list), dtype=np.int64).reshape(-1,3)
+        seed_voxels = np.ravel_multi_index(tuple(seed_coords.T), np.shape(mask)[:3], order='F')
+    seed_ids = []
+    for i, tract in enumerate(tract_list):
+        number = re.findall(r'(\d+)\.nii', os.path.basename(tract))
+        seed_ids.append(int(number[-1]) if number else i)
+
+    jobs = [(tract, np.concatenate([flat_indices, seed_voxels])) for tract in tract_list]
+    if (n_procs > 1):
+        pool = Pool(n_procs)
+        compact_tracts = pool.imap(read_compact_tract, jobs, chunksize=chunk_size)
+    else:
+        pool = None
+        compact_tracts = map(read_compact_tract, jobs)
+
+    data_file = out_prefix + '_tracts.dat'
+    index_file = out_prefix + '_index.npz'
+    offsets = [0]
+    chunk = []
+    seed_rows, seed_cols, seed_values = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.float32)]
+    with open(data_file, 'wb') as out_file:
+        for i, compact_tract in enumerate(compact_tracts):
+            nonzero = np.flatnonzero(compact_tract[n_voxels:])
+            seed_rows.append(np.repeat(i, len(nonzero)))
+            seed_cols.append(nonzero)
+            seed_values.append(compact_tract[n_voxels:][nonzero])
+            chunk.append(compact_tract[:n_voxels])
+            if (len(chunk) == chunk_size or i == len(jobs)-1):
+                out_file.write(zlib.compress(np.vstack(chunk).tobytes(), 1))
+                offsets.append(out_file.tell())
+                chunk = []
+    if (pool is not None):
+        pool.close()
+        pool.join()
+
+    np.savez(index_file, offsets=np.array(offsets, dtype=np.int64), seed_ids=np.array(seed_ids, dtype=np.int64),
+             voxels=flat_indices, shape=np.array(np.shape(mask)[:3]), chunk_size=chunk_size, tract_number=tract_number,
+             seed_voxels=seed_voxels, seed_rows=np.concatenate(seed_rows), seed_cols=np.concatenate(seed_cols), seed_values=np.concatenate(seed_values))
+    return os.path.abspath(index_file), os.path.abspath(data_file)
+
+
+class TractStore(object):
+    """
+    Random access (store[i], store.read(i)) and sequential streaming (store.chunks()) of a packed tract store.
+    seed_connectivity() gives the visits of the seed voxels packed with it.
+    normalization is 'raw' (visitation counts), 'nat' (counts / tract_number) or 'log' (log10(counts) / log10(tract_number))
+    """
+
+    def __init__(self, index_file, normalization='nat'):
+        index = np.load(index_file)
+        self.offsets = index['offsets']
+        self.seed_ids = index['seed_ids']
+        self.voxels = index['voxels']
+        self.shape = tuple(index['shape'])
+        self.chunk_size = int(index['chunk_size'])
+        self.tract_number = float(index['tract_number'])
+        self.index_file = index_file
+        self.data_file = index_file[:-len('_index.npz')] + '_tracts.dat'
+        self.normalization = normalization
+        self._cached = (None, None)
+
+    def __len__(self):
+        return len(self.seed_ids)
+
+    def check_seed_order(self):
+        # row i is the tract of seed i of the voxel list, the tract files are numbered by seed
+        if (np.any(np.diff(self.seed_ids) <= 0)):
+            raise ValueError(self.index_file + ': tracts are not packed in seed order')
+
+    def seed_connectivity(self):
+        # (seeds x seed voxels) visit counts, the seed voxels as packed: this hemisphere, then the opposite one
+        from scipy.sparse import csr_matrix
+        index = np.load(self.index_file)
+        return index['seed_voxels'], csr_matrix((index['seed_values'], (index['seed_rows'], index['seed_cols'])),
+                                                shape=(len(self), len(index['seed_voxels'])))
+
+    def normalize(self, block, normalization=None):
+        if (normalization is None):
+            normalization = self.normalization
+        if (normalization == 'nat'):
+            return block / np.float32(self.tract_number)
+        if (normalization == 'log'):
+            log_block = np.zeros_like(block)
+            np.log10(block, out=log_block, where=block > 0) # as normalize_matrix, voxels without visits stay 0
+            return log_block / np.float32(np.log10(self.tract_number))
+        return block
+
+    def read_chunk(self, chunk_id):
+        cached = self._cached # one lookup, so threads sharing the store never get another thread's chunk
+        if (cached[0] != chunk_id):
+            with open(self.data_file, 'rb') as in_file:
+                in_file.seek(self.offsets[chunk_id])
+                raw = zlib.decompress(in_file.read(self.offsets[chunk_id+1] - self.offsets[chunk_id]))
+            cached = (chunk_id, np.frombuffer(raw, dtype=np.float32).reshape(-1, len(self.voxels)))
+            self._cached = cached
+        return cached[1]
+
+    def read(self, i):
+        return self.normalize(self.read_chunk(i // self.chunk_size)[i % self.chunk_size])
+
+    def __getitem__(self, i):
+        return self.read(i)
+
+    def read_block(self, start, stop, normalization=None):
+        # seeds start:stop as one (seeds x mask voxels) array, decompressing each chunk once
+        rows = []
+        for chunk_id in range(start // self.chunk_size, (stop - 1) // self.chunk_size + 1):
+            chunk_start = chunk_id * self.chunk_size
+            rows.append(self.read_chunk(chunk_id)[max(start - chunk_start, 0):stop - chunk_start])
+        return self.normalize(np.vstack(rows), normalization)
+
+    def chunks(self):
+        # one sequential pass over the file, yields (first seed, (seeds x mask voxels) block)
+        with open(self.data_file, 'rb') as in_file:
+            for chunk_id in range(len(self.offsets) - 1):
+                raw = zlib.decompress(in_file.read(self.offsets[chunk_id+1] - self.offsets[chunk_id]))
+                yield chunk_id * self.chunk_size, self.normalize(np.frombuffer(raw, dtype=np.float32).reshape(-1, len(self.voxels)))
+
+    def to_volume(self, i):
+        # tract i back in the full image grid
+        volume = np.zeros(int(np.prod(self.shape)), dtype=np.float32)
+        volume[self.voxels] = self.read(i)
+        return volume.reshape(self.shape, order='F')
+
+
+"""
+thresholded tracts scaled to unit norm, so that the dot product of two rows is the normalized dot product of distblocks3
+"""
+def unit_tracts(block, threshold):
+    import numpy as np
+    block = np.where(block < threshold, 0, block).astype(np.float32)
+    norms = np.sqrt(np.einsum('ij,ij->i', block, block, dtype=np.float64))
+    norms[norms==0] = 1 # empty tracts are at distance 1 from every tract
+    block /= norms[:,None].astype(np.float32)
+    return block
+
+
+"""
+blocked distances (1 - normalized dot product) between the tracts of two stores, for all normalizations from one read.
+a panel of row tracts stays in memory while tiles of column tracts stream past it, one tile per thread; with symmetric
+(row_store is col_store) only the tiles on and above the diagonal are computed, and mirrored.
+"""
+def tract_distances(row_store, col_store, normalizations, thresholds, outs, memory_mb=1024, n_threads=1, symmetric=False):
+    import numpy as np
+    from multiprocessing.pool import ThreadPool
+    from dmri_tract_store import unit_tracts
+
+    n_rows = len(row_store)
+    n_cols = len(col_store)
+    row_bytes = 4. * len(row_store.voxels) * (len(normalizations) + 1) # raw tract plus one unit tract per normalization
+    panel = int(max(1, memory_mb * 2**19 // row_bytes)) # half the budget for the row panel
+    tile = int(max(1, memory_mb * 2**19 // (row_bytes * n_threads))) # the other half for the column tiles in flight
+    tile = max(col_store.chunk_size, tile // col_store.chunk_size * col_store.chunk_size) # whole chunks, decompressed once per panel
+
+    for start in range(0, n_rows, panel):
+        rows = slice(start, min(start + panel, n_rows))
+        raw = row_store.read_block(rows.start, rows.stop, 'raw')
+        row_blocks = [unit_tracts(row_store.normalize(raw, normalization), threshold) for normalization, threshold in zip(normalizations, thresholds)]
+        del raw
+        if (symmetric):
+            col_starts = [col_start for col_start in range(0, n_cols, tile) if col_start + tile > rows.start]
+        else:
+            col_starts = range(0, n_cols, tile)
+
+        def fill(col_start):
+            cols = slice(col_start, min(col_start + tile, n_cols))
+            if (symmetric and cols.start >= rows.start and cols.stop <= rows.stop):
+                # tiles inside the panel are already in memory, a store that fits the budget is read once
+                col_blocks = [row_block[cols.start - rows.start:cols.stop - rows.start] for row_block in row_blocks]
+            else:
+                raw = col_store.read_block(cols.start, cols.stop, 'raw')
+                col_blocks = [unit_tracts(col_store.normalize(raw, normalization), threshold) for normalization, threshold in zip(normalizations, thresholds)]
+            for row_block, col_block, out in zip(row_blocks, col_blocks, outs):
+                dist = 1 - np.dot(row_block, col_block.T)
+                np.clip(dist, 0, 1, out=dist)
+                lo, hi = max(rows.start, cols.start), min(rows.stop, cols.stop)
+                if (symmetric and lo < hi):
+                    # pairs computed in both orders keep the upper triangle value, the matrix stays exactly symmetric
+                    square = dist[lo - rows.start:hi - rows.start, lo - cols.start:hi - cols.start]
+                    square[:] = np.triu(square) + np.triu(square, 1).T
+                if (symmetric):
+                    first = max(cols.start, rows.start) # columns left of the panel were mirrored by earlier panels
+                    out[rows, first:cols.stop] = dist[:, first - cols.start:]
+                else:
+                    out[rows, cols] = dist
+                mirrored = max(cols.start, rows.stop)
+                if (symmetric and mirrored < cols.stop):
+                    out[mirrored:cols.stop, rows] = dist[:, mirrored - cols.start:].T
+        if (n_threads > 1):
+            pool = ThreadPool(n_threads) # blas, zlib and numpy ufuncs release the GIL
+            pool.map(fill, col_starts)
+            pool.close()
+            pool.join()
+        else:
+            for col_start in col_starts:
+                fill(col_start)
+    return outs
+
+
+"""
+direct connectivity matrix from the seed voxel visits kept in the tract stores, as get_connectivity_matrix computes it
+from the visitation maps
+"""
+def store_connectivity_matrix(index_left, index_right, voxel_list_left, voxel_list_right, max_value):
+    import numpy as np
+    from dmri_tract_store import TractStore
+    from dmri_pipe_aux import connectivity_submatrix
+
+    submatrices = []
+    exclusion_list = []
+    for index_file, this_voxel_list, opposite_voxel_list in [(index_left, voxel_list_left, voxel_list_right), (index_right, voxel_list_right, voxel_list_left)]:
+        store = TractStore(index_file, 'raw')
+        store.check_seed_order()
+        seed_voxels, connectivity = store.seed_connectivity()
+        seed_coords = np.array(list(this_voxel_list) + list(opposite_voxel_list), dtype=np.int64).reshape(-1,3)
+        if (not np.array_equal(seed_voxels, np.ravel_multi_index(tuple(seed_coords.T), store.shape, order='F'))):
+            raise ValueError(index_file + ': packed with other seed voxels, left and right stores swapped?')
+        tract_values = ((connectivity.indices[connectivity.indptr[i]:connectivity.indptr[i+1]], connectivity.data[connectivity.indptr[i]:connectivity.indptr[i+1]])
+                        for i in range(len(store)))
+        sparse_this, sparse_opposite, exclusion = connectivity_submatrix(tract_values, len(store), this_voxel_list, len(opposite_voxel_list), max_value)
+        submatrices.append((sparse_this, sparse_opposite))
+        exclusion_list.extend(exclusion)
+
+    (submatrix_left_left, submatrix_left_right), (submatrix_right_right, submatrix_right_left) = submatrices
+    return submatrix_left_left, submatrix_left_right, submatrix_right_left, submatrix_right_right, exclusion_list
+
+
+class StackedStores(object):
+    """
+    Tract stores packed over the same mask read as one store, the seeds of each store in turn.
+    """
+
+    def __init__(self, stores):
+        self.stores = stores
+        self.starts = np.cumsum([0] + [len(store) for store in stores])
+        self.voxels = stores[0].voxels
+        self.chunk_size = stores[0].chunk_size
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    def normalize(self, block, normalization=None):
+        return self.stores[0].normalize(block, normalization)
+
+    def read_block(self, start, stop, normalization=None):
+        rows = []
+        for store, first, last in zip(self.stores, self.starts[:-1], self.starts[1:]):
+            if (start < last and stop > first):
+                rows.append(store.read_block(max(start, first) - first, min(stop, last) - first, 'raw'))
+        return self.normalize(np.vstack(rows), normalization)
+
+
+class HemisphereBlocks(object):
+    """
+    The (left + right) x (left + right) distance matrix of stacked left and right stores, written into its
+    left, right and left_right blocks. right_left is the transposed view of left_right and is never written.
+    """
+
+    def __init__(self, left, right, left_right):
+        self.left = left
+        self.right = right
+        self.left_right = left_right
+        n_left = len(left)
+        n = n_left + len(right)
+        self.blocks = [(left, 0, n_left, 0, n_left), (left_right, 0, n_left, n_left, n), (right, n_left, n, n_left, n)]
+
+    @property
+    def right_left(self):
+        return self.left_right.T
+
+    def __setitem__(self, index, block):
+        rows, cols = index
+        for matrix, row_first, row_last, col_first, col_last in self.blocks:
+            row_lo, row_hi = max(rows.start, row_first), min(rows.stop, row_last)
+            col_lo, col_hi = max(cols.start, col_first), min(cols.stop, col_last)
+            if (row_lo < row_hi and col_lo < col_hi):
+                matrix[row_lo - row_first:row_hi - row_first, col_lo - col_first:col_hi - col_first] = \
+                    block[row_lo - rows.start:row_hi - rows.start, col_lo - cols.start:col_hi - cols.start]
+
+
+"""
+nat and log distance matrices within and between the hemispheres from one read of each tract store, written straight
+to .npy and .mat (obj0, as vtomat wrote it). left_right has the left seeds as rows; right_left is its transpose.
+"""
+def hemisphere_distance_matrices(index_left, index_right, out_template, thres_nat, thres_log, memory_mb=1024, n_threads=1):
+    import os.path as op
+    import numpy as np
+    from scipy.io import savemat
+    from dmri_tract_store import TractStore
+    from dmri_tract_store import StackedStores
+    from dmri_tract_store import HemisphereBlocks
+    from dmri_tract_store import tract_distances
+
+    stores = StackedStores([TractStore(index_left, 'raw'), TractStore(index_right, 'raw')])
+    for store in stores.stores:
+        store.check_seed_order() # rows have to match the seed index files of the downsampling
+    n_left, n_right = [len(store) for store in stores.stores]
+    normalizations = ['nat', 'log']
+    sides = [('left', n_left, n_left), ('right', n_right, n_right), ('left_right', n_left, n_right)]
+    outs = []
+    out_npy = []
+    out_mat = []
+    for normalization in normalizations:
+        matrices = []
+        for side, n_rows, n_cols in sides:
+            out_npy.append(out_template % (normalization, side) + '.npy')
+            out_mat.append(out_template % (normalization, side) + '.mat')
+            matrices.append(np.lib.format.open_memmap(out_npy[-1], mode='w+', dtype=np.float32, shape=(n_rows, n_cols)))
+        outs.append(HemisphereBlocks(*matrices))
+    tract_distances(stores, stores, normalizations, [thres_nat, thres_log], outs, memory_mb, n_threads, symmetric=True)
+    matrices = [matrix for out in outs for matrix in (out.left, out.right, out.left_right)]
+    for matrix, filename in zip(matrices, out_mat):
+        matrix.flush()
+        savemat(filename, {'obj0': matrix})
+    out_mat = [op.abspath(filename) for filename in out_mat]
+    return tuple(out_mat) + ([op.abspath(filename) for filename in out_npy],)
@@ -15,8 +15,10 @@ from clustering.similarity import Similarity
 from clustering.mask_surface import MaskSurface
 from clustering.mask_volume import MaskVolume
 from clustering.concat import Concat
+from clustering.bootstrap import Bootstrap
 
-from variables import subjects, sessions, workingdir, preprocdir, similaritydir, freesurferdir, similarity_dg_template, similarity_dg_args, fsaverage, hemispheres, similarity_types
+from variables import subjects, sessions, workingdir, preprocdir, similaritydir, freesurferdir, similarity_dg_template, similarity_dg_args, fsaverage, hemispheres, similarity_types, similarity_backend, similarity_memory, similarity_threads
+from variables import cluster_types, n_clusters, epsilon, dbscan_metric, spectral_affinity, spectral_neighbors, spectral_solver, bootstrap_stability, n_bootstrap, bootstrap_block, bootstrap_procs
 from variables import volume_sourcelabels, volume_targetlabels, surface_sourcelabels, surface_targetlabels
 
 def get_wf():
@@ -73,15 +75,40 @@ def get_wf():
 
 ##concatenate data & run similarity##
     concat = pe.JoinNode(Concat(), joinsource="hemi", joinfield=["surface_input"], unique=True, name = 'concat')
+    concat.inputs.backend = similarity_backend
+    concat.inputs.memory_budget = similarity_memory
+    concat.inputs.n_threads = similarity_threads
     wf.connect(Vmask, 'volume_input_mask', concat, 'volume_input')
     wf.connect(Vmask, 'volume_target_mask', concat, 'volume_target_mask')
     wf.connect(Smask, 'surface_data', concat, 'surface_input')
     wf.connect(Smask, 'surface_mask', concat, 'surface_mask')
     wf.connect(sim_infosource, 'sim', concat, 'sim_type')
 
+##within-subject bootstrap stability## resamples are correlated, clustered and counted inside one node
+    if bootstrap_stability:
+        bootstrap = pe.JoinNode(Bootstrap(), joinsource="hemi", joinfield=["surface_input"], unique=True, name = 'bootstrap')
+        bootstrap.iterables = ('cluster_type', [c for c in cluster_types if c != 'meshward']) #no surface mesh in the similarity pipeline
+        bootstrap.inputs.n_clusters_list = n_clusters
+        bootstrap.inputs.epsilon = epsilon
+        bootstrap.inputs.dbscan_metric = dbscan_metric
+        bootstrap.inputs.affinity = spectral_affinity
+        bootstrap.inputs.n_neighbors = spectral_neighbors
+        bootstrap.inputs.eigen_solver = spectral_solver
+        bootstrap.inputs.n_bootstrap = n_bootstrap
+        bootstrap.inputs.block_length = bootstrap_block
+        bootstrap.inputs.n_procs = bootstrap_procs
+        bootstrap.inputs.memory_budget = similarity_memory
+        wf.connect(Vmask, 'volume_input_mask', bootstrap, 'volume_input')
+        wf.connect(Vmask, 'volume_target_mask', bootstrap, 'volume_target_mask')
+        wf.connect(Smask, 'surface_data', bootstrap, 'surface_input')
+        wf.connect(Smask, 'surface_mask', bootstrap, 'surface_mask')
+        wf.connect(sim_infosource, 'sim', bootstrap, 'sim_type')
+
 ##Datasink##
     ds = pe.Node(nio.DataSink(), name="datasink")
     ds.inputs.base_directory = similaritydir
+    if bootstrap_stability:
+        wf.connect(bootstrap, 'consensus_mats', ds, 'bootstrap')
     wf.connect(concat,'simmatrix', ds, 'similarity')
     wf.connect(concat,'maskindex', ds, 'maskindex')
     wf.connect(concat, 'targetmask', ds, 'targetmask')
@@ -0,0 +1,8 @@
+import os
+import sys
+
+#the pipelines import their modules from src/clustering and src/clustering/diffusion
+here = os.path.dirname(os.path.abspath(__file__))
+for path in [os.path.dirname(here), os.path.join(os.path.dirname(here), 'diffusion')]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,50 @@
+import numpy as np
+
+from clustering.coassociation import co_association, parallel_co_association, triu_offsets, unpack_triu
+
+
+def _labelmaps(n_vertices=23, n_maps=5, seed=0):
+    rng = np.random.RandomState(seed)
+    return [rng.randint(1, 5, n_vertices) for _ in range(n_maps)]
+
+
+def _brute_force(labelmaps):
+    n = len(labelmaps[0])
+    counts = np.zeros((n, n), dtype=np.int64)
+    for labels in labelmaps:
+        for i in range(n):
+            for j in range(n):
+                counts[i, j] += labels[i] == labels[j]
+    return counts
+
+
+def test_co_association_dense():
+    labelmaps = _labelmaps()
+    for block_size in [None, 1, 4]:
+        np.testing.assert_array_equal(co_association(labelmaps, block_size=block_size), _brute_force(labelmaps))
+
+
+def test_co_association_triu_packing():
+    labelmaps = _labelmaps()
+    expected = _brute_force(labelmaps)
+    n = len(expected)
+    for block_size in [None, 1, 4]:
+        packed = co_association(labelmaps, triu=True, block_size=block_size)
+        assert packed.shape == (n*(n+1)//2,)
+        np.testing.assert_array_equal(packed, expected[np.triu_indices(n)])
+        np.testing.assert_array_equal(unpack_triu(packed, n), expected)
+    packed = co_association(labelmaps, triu=True)
+    offsets = triu_offsets(n)
+    for row in range(n):
+        np.testing.assert_array_equal(packed[offsets[row]:offsets[row]+n-row], expected[row, row:])
+
+
+def test_parallel_co_association_matches_serial(tmpdir):
+    #shards counted in worker processes and reduced pairwise, including an odd shard out
+    labelmaps = _labelmaps(n_maps=7)
+    expected = _brute_force(labelmaps)
+    for n_procs in [2, 3]:
+        counts = parallel_co_association(labelmaps, n_procs=n_procs, tmpdir=str(tmpdir))
+        np.testing.assert_array_equal(counts, expected)
+        assert counts.dtype == co_association(labelmaps).dtype #sized for the total, not for one shard
+    assert tmpdir.listdir() == [] #partial sums removed
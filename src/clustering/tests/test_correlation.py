@@ -0,0 +1,27 @@
+import numpy as np
+
+from clustering.correlation import eta2
+
+
+def _brute_force_eta2(data):
+    #eta^2 (Cohen et al., 2008) of every pair of rows, one pair at a time
+    n = len(data)
+    out = np.empty((n, n))
+    for i in range(n):
+        for j in range(n):
+            a, b = data[i], data[j]
+            pairmean = (a+b)/2
+            grandmean = pairmean.mean()
+            within = ((a-pairmean)**2 + (b-pairmean)**2).sum()
+            total = ((a-grandmean)**2 + (b-grandmean)**2).sum()
+            out[i, j] = 1 - within/total if total else 1
+    return out
+
+
+def test_eta2_tiles_and_threads():
+    rng = np.random.RandomState(0)
+    data = rng.randn(37, 15).astype(np.float32)
+    data[5] = 0 #a constant pair has no total variance
+    expected = _brute_force_eta2(data.astype(np.float64))
+    for memory_mb, n_threads in [(1024, 1), (0.001, 1), (0.001, 3)]: #one tile, and many small tiles
+        np.testing.assert_allclose(eta2(data, memory_mb=memory_mb, n_threads=n_threads), expected, atol=1e-5)
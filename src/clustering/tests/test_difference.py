@@ -0,0 +1,52 @@
+import numpy as np
+import nibabel as nb
+
+from clustering.difference import index_results, pairs_across, compare_grid
+
+
+def _clustermap(tmpdir, folders, labels):
+    folder = tmpdir.join('clustered', *folders)
+    folder.ensure(dir=True)
+    filename = str(folder.join('clustermap.nii'))
+    nb.save(nb.Nifti1Image(np.asarray(labels, dtype=np.int16), np.eye(4)), filename)
+    return filename
+
+
+def _folders(fs, subject_id):
+    #datasink layout of clustering_pipeline.py: no _session_ folder, one _fs_ folder
+    return ['_cluster_kmeans', '_fs_' + fs, '_hemi_lh', '_n_clusters_3', '_sim_temp', '_subject_id_' + subject_id]
+
+
+def test_index_results(tmpdir):
+    labels = [1, 1, 2, 2, 3, 0]
+    files = dict(((fs, subject_id), _clustermap(tmpdir, _folders(fs, subject_id), labels)) for fs in ['fs4', 'fs5'] for subject_id in ['a', 'b'])
+    _clustermap(tmpdir, ['_cluster_kmeans', '_hemi_lh'], labels) #incomplete path, not indexed
+    index = index_results(str(tmpdir))
+    assert sorted(index.values()) == sorted(files.values())
+    key = (None, 'lh', None, 'a', 'temp', 'kmeans', '3')
+    for fs in ['fs4', 'fs5']:
+        assert index[(fs,) + key[1:]] == files[(fs, 'a')]
+
+    pairs = pairs_across(index, 'fs')
+    assert len(pairs) == 2
+    rows = compare_grid(index, pairs)
+    for row in rows:
+        np.testing.assert_allclose([row['dice'], row['ari'], row['nmi']], 1)
+    assert set(row['subject_id_1'] for row in rows) == set(['a', 'b'])
+    assert len(pairs_across(index, 'subject_id')) == 2
+    try:
+        pairs_across(index, 'session')
+    except ValueError as e:
+        assert 'session' in str(e)
+    else:
+        assert False, 'missing sessions not reported'
+
+
+def test_index_results_empty(tmpdir):
+    tmpdir.join('clustered').ensure(dir=True)
+    try:
+        index_results(str(tmpdir))
+    except IOError as e:
+        assert 'clustered' in str(e)
+    else:
+        assert False, 'empty results not reported'
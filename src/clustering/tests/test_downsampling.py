@@ -0,0 +1,80 @@
+import os
+import numpy as np
+from scipy.io import savemat, loadmat
+
+from dmri_pipe_aux import downsampling_operator, downsample_matrices
+
+
+def _index_file(path, n_vertices, n_seeds, rng):
+    indices = rng.randint(0, n_seeds+1, n_vertices) #1-based seed per vertex, 0 for none
+    indices[:3] = 0
+    np.savetxt(path, indices, fmt='%d')
+    return path, indices
+
+
+def _brute_force(matrix, row_indices, col_indices, dist2sim):
+    out = np.zeros((len(row_indices), len(col_indices)))
+    for i, r in enumerate(row_indices):
+        for j, c in enumerate(col_indices):
+            if r and c:
+                out[i, j] = 1-matrix[r-1, c-1] if dist2sim else matrix[r-1, c-1]
+    return out
+
+
+def test_downsampling_operator_selects_seeds(tmpdir):
+    rng = np.random.RandomState(0)
+    index_file, indices = _index_file(str(tmpdir.join('fs4.txt')), 40, 25, rng)
+    operator = downsampling_operator(index_file, 25).toarray()
+    matrix = rng.rand(25, 7)
+    expected = np.array([matrix[i-1] if i else np.zeros(7) for i in indices])
+    np.testing.assert_allclose(operator.dot(matrix), expected)
+
+
+def test_downsample_matrices_one_hemisphere(tmpdir):
+    #called the way pipe 4 does: only the indices of the processed hemisphere
+    rng = np.random.RandomState(1)
+    fs4_right, fs4_indices = _index_file(str(tmpdir.join('fs4_right.txt')), 40, 30, rng)
+    fs5_right, fs5_indices = _index_file(str(tmpdir.join('fs5_right.txt')), 70, 30, rng)
+    matrices = {}
+    for norm in ['nat', 'log']:
+        matrices[norm] = rng.rand(30, 30)
+        savemat(str(tmpdir.join(norm + '.mat')), {'obj0': matrices[norm]})
+
+    out_template = str(tmpdir.join('subject_simmat_%(fs)s_%(norm)s_right'))
+    fs4_mat, fs4_nii, fs5_mat, fs5_nii = downsample_matrices(fs4_right=fs4_right, fs5_right=fs5_right, out_template=out_template, dist2sim=True,
+                                                             nat_right_right=str(tmpdir.join('nat.mat')), log_right_right=str(tmpdir.join('log.mat')))
+
+    assert len(fs4_mat) == len(fs5_mat) == 2
+    assert all(os.path.exists(f) for f in fs4_nii + fs5_nii)
+    for fs, indices, out_files in [('fs4', fs4_indices, fs4_mat), ('fs5', fs5_indices, fs5_mat)]:
+        for norm in ['nat', 'log']:
+            out_file = out_template % dict(fs=fs, norm=norm) + '.mat'
+            assert out_file in out_files
+            np.testing.assert_allclose(loadmat(out_file)['obj0'], _brute_force(matrices[norm], indices, indices, True))
+
+
+def test_downsample_matrices_cross_hemisphere(tmpdir):
+    rng = np.random.RandomState(2)
+    fs4_left, left_indices = _index_file(str(tmpdir.join('fs4_left.txt')), 40, 20, rng)
+    fs4_right, right_indices = _index_file(str(tmpdir.join('fs4_right.txt')), 40, 15, rng)
+    fs5_left, _ = _index_file(str(tmpdir.join('fs5_left.txt')), 70, 20, rng)
+    fs5_right, _ = _index_file(str(tmpdir.join('fs5_right.txt')), 70, 15, rng)
+    matrix = rng.rand(20, 15)
+    savemat(str(tmpdir.join('nat.mat')), {'obj0': matrix})
+
+    out_template = str(tmpdir.join('subject_connect_%(fs)s_%(norm)s_%(side)s'))
+    fs4_mat, _, _, _ = downsample_matrices(out_template, fs4_left, fs4_right, fs5_left, fs5_right, dist2sim=False,
+                                           nat_left_right=str(tmpdir.join('nat.mat')))
+    np.testing.assert_allclose(loadmat(fs4_mat[0])['obj0'], _brute_force(matrix, left_indices, right_indices, False))
+
+
+def test_downsample_matrices_missing_index(tmpdir):
+    rng = np.random.RandomState(3)
+    fs4_left, _ = _index_file(str(tmpdir.join('fs4_left.txt')), 40, 20, rng)
+    savemat(str(tmpdir.join('nat.mat')), {'obj0': rng.rand(20, 15)})
+    try:
+        downsample_matrices(str(tmpdir.join('out_%(fs)s_%(norm)s')), fs4_left=fs4_left, nat_left_right=str(tmpdir.join('nat.mat')))
+    except ValueError as e:
+        assert 'fs4_right' in str(e)
+    else:
+        assert False, 'missing index file not reported'
@@ -0,0 +1,28 @@
+import numpy as np
+from sklearn.cluster import DBSCAN
+
+from clustering.sweep import factored_sweep
+
+
+def _labels(tmpdir):
+    rng = np.random.RandomState(0)
+    base = rng.randint(0, 4, 60)
+    labels = np.column_stack([np.where(rng.rand(60) < 0.2, rng.randint(0, 4, 60), base) for _ in range(10)])
+    filename = str(tmpdir.join('lh_ConsensusFactors.npy'))
+    np.save(filename, labels)
+    return filename, (labels[:,None,:] == labels[None,:,:]).mean(axis=2)
+
+
+def test_factored_dbscan_epsilon_is_a_consensus_radius(tmpdir):
+    filename, consensus = _labels(tmpdir)
+    for epsilon in [0.05, 0.15, 0.35]:
+        labels = factored_sweep(filename, 'dbscan', [3], epsilon)[3]
+        np.testing.assert_array_equal(labels, DBSCAN(eps=epsilon, metric='precomputed').fit_predict(1-consensus))
+
+
+def test_factored_sweep_all_k(tmpdir):
+    filename, _ = _labels(tmpdir)
+    for cluster_type in ['spectral', 'hiercluster', 'kmeans']:
+        labels = factored_sweep(filename, cluster_type, [2, 4])
+        assert sorted(labels) == [2, 4]
+        assert len(np.unique(labels[4])) == 4
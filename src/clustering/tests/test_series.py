@@ -0,0 +1,30 @@
+import numpy as np
+
+from clustering.series import ConcatenatedSeries
+
+
+def _images(seed=0):
+    rng = np.random.RandomState(seed)
+    surf = rng.randn(11, 1, 1, 8) * (rng.rand(11, 1, 1, 1) < 0.6) #all-zero rows to squeeze out
+    vol = rng.randn(3, 4, 2, 8) * (rng.rand(3, 4, 2, 1) < 0.5)
+    return surf, vol
+
+
+def _brute_force(images):
+    #physical concatenation and squeeze, as Concat did before the view
+    total = np.concatenate([np.reshape(image, (-1, image.shape[-1])) for image in images])
+    indices = np.nonzero(total.sum(axis=1) != 0)[0]
+    return total[indices], indices
+
+
+def test_concatenated_series_rows():
+    images = _images()
+    expected, indices = _brute_force(images)
+    for memory_mb in [256, 0.0001]: #row sums over all timepoints at once, or one timepoint at a time
+        series = ConcatenatedSeries(list(images), memory_mb=memory_mb)
+        np.testing.assert_array_equal(series.indices, indices)
+        assert series.shape == expected.shape
+        np.testing.assert_array_equal(series[:], expected)
+        np.testing.assert_array_equal(series[3:9], expected[3:9])
+        picked = np.array([len(expected)-1, 0, 4])
+        np.testing.assert_array_equal(series[picked], expected[picked])
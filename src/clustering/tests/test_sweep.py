@@ -0,0 +1,40 @@
+import numpy as np
+from sklearn.cluster import ward_tree, AgglomerativeClustering
+
+from clustering.sweep import cut_tree, ward_sweep
+
+
+def _same_partition(labels, expected):
+    #equal up to renaming the clusters
+    pairs = set(zip(labels, expected))
+    return len(pairs) == len(set(labels)) == len(set(expected))
+
+
+def _brute_force_cut(children, n_leaves, n_clusters):
+    #replay the first n_leaves-n_clusters merges on explicit member sets
+    members = dict((i, set([i])) for i in range(n_leaves))
+    for merge, (left, right) in enumerate(children[:n_leaves-n_clusters]):
+        members[n_leaves+merge] = members.pop(left) | members.pop(right)
+    labels = np.empty(n_leaves, dtype=int)
+    for label, leaves in enumerate(members.values()):
+        labels[list(leaves)] = label
+    return labels
+
+
+def test_cut_tree():
+    rng = np.random.RandomState(0)
+    data = rng.randn(40, 5)
+    children = ward_tree(data)[0]
+    for n_clusters in [1, 2, 7, 39, 40]:
+        labels = cut_tree(children, len(data), n_clusters)
+        assert len(np.unique(labels)) == n_clusters
+        assert _same_partition(labels, _brute_force_cut(children, len(data), n_clusters))
+
+
+def test_ward_sweep_matches_ward_per_k():
+    rng = np.random.RandomState(1)
+    data = rng.randn(50, 6)
+    labels = ward_sweep(data, [2, 5, 9])
+    for n_clusters in [2, 5, 9]:
+        expected = AgglomerativeClustering(n_clusters=n_clusters, linkage='ward').fit_predict(data)
+        assert _same_partition(labels[n_clusters], expected)
@@ -0,0 +1,177 @@
+import numpy as np
+import nibabel as nb
+
+from dmri_tract_store import pack_tracts, TractStore, store_connectivity_matrix, tract_distances, \
+    hemisphere_distance_matrices, HemisphereBlocks
+from dmri_pipe_aux import get_connectivity_matrix
+
+SHAPE = (6, 5, 4)
+MAX_VALUE = 50
+
+
+def _seed_voxels(rng, n_left, n_right):
+    coords = np.array(np.unravel_index(rng.permutation(int(np.prod(SHAPE)))[:n_left+n_right], SHAPE)).T
+    return coords[:n_left].tolist(), coords[n_left:].tolist()
+
+
+def _tracts(tmpdir, hemi, this_voxels, rng):
+    #visitation counts, every third seed visits its own voxel less than MAX_VALUE times
+    tract_list = []
+    for i, (x, y, z) in enumerate(this_voxels):
+        data = rng.randint(0, MAX_VALUE, SHAPE) * (rng.rand(*SHAPE) < 0.5)
+        data[x, y, z] = MAX_VALUE - 1 if i % 3 == 0 else MAX_VALUE
+        tract_list.append(str(tmpdir.join('%s_probtract_%06d.nii' % (hemi, i))))
+        nb.save(nb.Nifti1Image(data.astype(np.float32), np.eye(4)), tract_list[-1])
+    return tract_list
+
+
+def _mask(tmpdir, rng):
+    mask_file = str(tmpdir.join('mask_wm.nii'))
+    nb.save(nb.Nifti1Image((rng.rand(*SHAPE) < 0.6).astype(np.uint8), np.eye(4)), mask_file)
+    return mask_file
+
+
+def _brute_force(tract_list, this_voxels, opposite_voxels):
+    rows_this, rows_opposite, exclusion_list = [], [], []
+    for i, tract in enumerate(tract_list):
+        data = nb.load(tract).get_data()
+        row_this = np.array([data[x, y, z] for x, y, z in this_voxels], dtype=np.float64)
+        row_opposite = np.array([data[x, y, z] for x, y, z in opposite_voxels], dtype=np.float64)
+        if row_this[i] < MAX_VALUE:
+            exclusion_list.append(this_voxels[i])
+            row_this[:] = 0
+            row_opposite[:] = 0
+        rows_this.append(row_this)
+        rows_opposite.append(row_opposite)
+    return np.array(rows_this), np.array(rows_opposite), exclusion_list
+
+
+def test_store_connectivity_matrix(tmpdir):
+    rng = np.random.RandomState(0)
+    voxels_left, voxels_right = _seed_voxels(rng, 7, 5)
+    tracts_left = _tracts(tmpdir, 'lh', voxels_left, rng)
+    tracts_right = _tracts(tmpdir, 'rh', voxels_right, rng)
+    mask_file = _mask(tmpdir, rng)
+    index_left, _ = pack_tracts(tracts_left, mask_file, str(tmpdir.join('left')), MAX_VALUE, chunk_size=3, voxel_list=voxels_left, opposite_voxel_list=voxels_right)
+    index_right, _ = pack_tracts(tracts_right, mask_file, str(tmpdir.join('right')), MAX_VALUE, chunk_size=3, voxel_list=voxels_right, opposite_voxel_list=voxels_left)
+
+    from_store = store_connectivity_matrix(index_left, index_right, voxels_left, voxels_right, MAX_VALUE)
+    from_tracts = get_connectivity_matrix(tracts_left, tracts_right, voxels_left, voxels_right, MAX_VALUE)
+    left_left, left_right, exclusion_left = _brute_force(tracts_left, voxels_left, voxels_right)
+    right_right, right_left, exclusion_right = _brute_force(tracts_right, voxels_right, voxels_left)
+
+    for result in [from_store, from_tracts]:
+        for submatrix, expected in zip(result[:4], [left_left, left_right, right_left, right_right]):
+            np.testing.assert_array_equal(submatrix.toarray(), expected)
+        assert result[4] == exclusion_left + exclusion_right
+
+
+def test_store_connectivity_matrix_swapped_stores(tmpdir):
+    rng = np.random.RandomState(1)
+    voxels_left, voxels_right = _seed_voxels(rng, 4, 4)
+    mask_file = _mask(tmpdir, rng)
+    index_left, _ = pack_tracts(_tracts(tmpdir, 'lh', voxels_left, rng), mask_file, str(tmpdir.join('left')), MAX_VALUE, voxel_list=voxels_left, opposite_voxel_list=voxels_right)
+    index_right, _ = pack_tracts(_tracts(tmpdir, 'rh', voxels_right, rng), mask_file, str(tmpdir.join('right')), MAX_VALUE, voxel_list=voxels_right, opposite_voxel_list=voxels_left)
+    try:
+        store_connectivity_matrix(index_right, index_left, voxels_left, voxels_right, MAX_VALUE)
+    except ValueError as e:
+        assert 'seed voxels' in str(e)
+    else:
+        assert False, 'swapped stores not reported'
+
+
+def test_pack_tracts_seed_order(tmpdir):
+    rng = np.random.RandomState(2)
+    voxels_left, _ = _seed_voxels(rng, 5, 0)
+    tract_list = _tracts(tmpdir, 'lh', voxels_left, rng)
+    mask_file = _mask(tmpdir, rng)
+    TractStore(pack_tracts(tract_list, mask_file, str(tmpdir.join('sorted')), MAX_VALUE)[0]).check_seed_order()
+    store = TractStore(pack_tracts(tract_list[::-1], mask_file, str(tmpdir.join('reversed')), MAX_VALUE)[0])
+    try:
+        store.check_seed_order()
+    except ValueError:
+        pass
+    else:
+        assert False, 'tracts out of seed order not reported'
+
+
+def _normalized(raw, normalization, tract_number):
+    if normalization == 'nat':
+        return raw / float(tract_number)
+    logs = np.zeros_like(raw)
+    logs[raw > 0] = np.log10(raw[raw > 0])
+    return logs / np.log10(tract_number)
+
+
+def _brute_force_distances(rows, cols, threshold):
+    #1 - normalized dot product of the thresholded tracts, one pair at a time (empty tracts at distance 1)
+    out = np.empty((len(rows), len(cols)))
+    for i, a in enumerate(rows):
+        for j, b in enumerate(cols):
+            a_t, b_t = np.where(a < threshold, 0, a), np.where(b < threshold, 0, b)
+            norms = np.linalg.norm(a_t) * np.linalg.norm(b_t)
+            out[i, j] = min(max(1 - np.dot(a_t, b_t)/norms, 0), 1) if norms else 1
+    return out
+
+
+def _store(tmpdir, name, n_seeds, mask_file, rng, chunk_size=3):
+    voxels, _ = _seed_voxels(rng, n_seeds, 0)
+    tract_list = _tracts(tmpdir.mkdir(name), 'lh', voxels, rng)
+    tract_list.append(tract_list[0].replace('000000', '%06d' % n_seeds)) #an empty tract
+    nb.save(nb.Nifti1Image(np.zeros(SHAPE, dtype=np.float32), np.eye(4)), tract_list[-1])
+    index_file, _ = pack_tracts(tract_list, mask_file, str(tmpdir.join(name)), MAX_VALUE, chunk_size=chunk_size)
+    store = TractStore(index_file, 'raw')
+    return index_file, store, store.read_block(0, len(store)).astype(np.float64)
+
+
+def test_tract_distances(tmpdir):
+    rng = np.random.RandomState(3)
+    mask_file = _mask(tmpdir, rng) #both stores are packed over one mask, as in the pipeline
+    _, rows, raw_rows = _store(tmpdir, 'rows', 10, mask_file, rng)
+    _, cols, raw_cols = _store(tmpdir, 'cols', 6, mask_file, rng)
+    normalizations, thresholds = ['nat', 'log'], [0.1, 0.3]
+    for memory_mb, n_threads in [(1024, 1), (0.0001, 1), (0.0003, 3)]: #one panel, or many panels and tiles
+        for row_store, col_store, raw_a, raw_b, symmetric in [(rows, rows, raw_rows, raw_rows, True), (rows, cols, raw_rows, raw_cols, False)]:
+            outs = [np.full((len(row_store), len(col_store)), np.nan, dtype=np.float32) for _ in normalizations]
+            tract_distances(row_store, col_store, normalizations, thresholds, outs, memory_mb, n_threads, symmetric=symmetric)
+            for out, normalization, threshold in zip(outs, normalizations, thresholds):
+                expected = _brute_force_distances(_normalized(raw_a, normalization, MAX_VALUE), _normalized(raw_b, normalization, MAX_VALUE), threshold)
+                np.testing.assert_allclose(out, expected, atol=1e-5)
+                if symmetric:
+                    np.testing.assert_array_equal(out, out.T)
+
+
+def test_hemisphere_distance_matrices(tmpdir):
+    from scipy.io import loadmat
+    rng = np.random.RandomState(4)
+    mask_file = _mask(tmpdir, rng)
+    index_left, _, raw_left = _store(tmpdir, 'left', 7, mask_file, rng)
+    index_right, _, raw_right = _store(tmpdir, 'right', 5, mask_file, rng)
+    n_left = len(raw_left)
+    thres_nat, thres_log = 0.1, 0.3
+    raw = np.vstack([raw_left, raw_right])
+    for memory_mb, n_threads in [(1024, 1), (0.0001, 2)]:
+        out_template = str(tmpdir.join('%s_%s_' + str(n_threads)))
+        results = hemisphere_distance_matrices(index_left, index_right, out_template, thres_nat, thres_log, memory_mb, n_threads)
+        for normalization, threshold, mat_files in [('nat', thres_nat, results[0:3]), ('log', thres_log, results[3:6])]:
+            expected = _brute_force_distances(_normalized(raw, normalization, MAX_VALUE), _normalized(raw, normalization, MAX_VALUE), threshold)
+            left, right, left_right = [loadmat(mat_file)['obj0'] for mat_file in mat_files]
+            np.testing.assert_allclose(left, expected[:n_left, :n_left], atol=1e-5)
+            np.testing.assert_allclose(right, expected[n_left:, n_left:], atol=1e-5)
+            np.testing.assert_allclose(left_right, expected[:n_left, n_left:], atol=1e-5)
+            np.testing.assert_array_equal(left, left.T)
+            np.testing.assert_array_equal(right, right.T)
+        assert len(results[6]) == 6
+        for npy_file, mat_file in zip(results[6], results[:6]):
+            np.testing.assert_array_equal(np.load(npy_file), loadmat(mat_file)['obj0'])
+
+
+def test_hemisphere_blocks_right_left():
+    blocks = HemisphereBlocks(np.zeros((3, 3)), np.zeros((2, 2)), np.zeros((3, 2)))
+    full = np.arange(25.).reshape(5, 5)
+    blocks[slice(1, 5), slice(0, 4)] = full[1:5, 0:4] #a tile across all three blocks
+    np.testing.assert_array_equal(blocks.left[1:], full[1:3, 0:3])
+    np.testing.assert_array_equal(blocks.left_right[1:, :1], full[1:3, 3:4])
+    np.testing.assert_array_equal(blocks.right[:, :1], full[3:5, 3:4])
+    assert not blocks.right[:, 1:].any() and not blocks.left[0].any()
+    np.testing.assert_array_equal(blocks.right_left, blocks.left_right.T)
@@ -82,15 +82,31 @@ fsaverage = ['fs5']# ,'fs4']
 hemispheres = ['lh', 'rh']
 #hemispheres = ['lh']
 similarity_types = ['temp']#,'nat']
-cluster_types = ['kmeans']#,'spectral','hiercluster','dbscan']
+similarity_backend = 'afni' #'afni' runs 3dAutoTcorrelate, 'numpy' computes the similarity in-process
+similarity_memory = 1024 #MB per block of the numpy similarity products
+similarity_threads = 4 #threads for the numpy eta2 tiles
+bootstrap_stability = False #block-bootstrap consensus of every subject, for cluster_types and n_clusters below
+n_bootstrap = 100 #resamples of the timepoints per subject
+bootstrap_block = 10 #timepoints per bootstrap block
+bootstrap_procs = 4 #worker processes, each resamples, correlates and clusters
+cluster_types = ['kmeans']#,'spectral','hiercluster','meshward','dbscan'] #meshward is ward constrained to fsaverage mesh neighbours
 #cluster_types = ['hiercluster','dbscan']
 #n_clusters = [2,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20]
 #n_clusters = [3,5,7,9,12,15,18,20]
 
 epsilon = .03 #parameter for dbscan
+dbscan_metric = 'euclidean' #'euclidean' runs dbscan on the similarity rows, 'precomputed' on a sparse radius graph of 1-similarity <= epsilon (bounded memory)
+spectral_affinity = 'dense' #'knn' keeps only each vertex's strongest similarities in a sparse graph
+spectral_neighbors = 20 #similarities kept per vertex for the knn affinity
+spectral_solver = 'arpack' #'lobpcg' or 'amg' for the sparse knn affinity
 
 
 n_clusters = [9]
+consensus_procs = 1 #worker processes for the consensus map-reduce over subject shards
+consensus_memory = 1024 #MB per consensus worker
+consensus_representation = 'dense' #'factored' keeps stacked subject labels instead of the (n x n) consensus matrix
+clustermap_text = True #text copy of every clustermap next to the int16 nifti (slow for large surfaces)
+cluster_sweep = False #cluster all n_clusters in one node, reusing one spectral embedding / ward tree
 
 """
 spat simmats for 010 011 (except 3 excluded)